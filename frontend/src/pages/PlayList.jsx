@@ -96,9 +96,13 @@ function PlaylistPage() {
           playlists.map((playlist) => (
             <div className="col-md-6 col-lg-4" key={playlist.id}>
               <div className="card shadow-sm h-100">
+                {playlist.cover_thumbnail && <img src={playlist.cover_thumbnail} className="card-img-top" alt={playlist.name} />}
                 <div className="card-body d-flex flex-column">
                   <h5 className="card-title">{playlist.name}</h5>
                   <p className="card-text">{playlist.description || 'No description.'}</p>
+                  <p className="text-muted small">
+                    {playlist.item_count} track{playlist.item_count === 1 ? '' : 's'} · {playlist.total_duration}
+                  </p>
                   <button
                     className="btn btn-outline-primary mt-auto"
                     onClick={() => (window.location.href = `/playlist/${playlist.id}`)}
@@ -27,14 +27,37 @@ function Search() {
     if (!query.trim()) return;
     localStorage.setItem('recentSearch', query);
     setLoading(true);
+    setResults([]);
+    setEmbedded([]);
+    setCurrentPage(1);
     try {
-      const res = await axiosInstance.get(`/api/search/?q=${encodeURIComponent(query)}`);
-      const allResults = res.data.results || [];
-      const playable = allResults.filter(item => item.stream_url && item.source !== 'youtube');
-      const embeds = allResults.filter(item => item.source === 'youtube');
-      setResults(playable);
-      setEmbedded(embeds);
-      setCurrentPage(1);
+      // Each provider's results arrive as one NDJSON line as soon as that
+      // provider answers, so fast sources render before slow ones finish.
+      const res = await fetch(
+        `${axiosInstance.defaults.baseURL}api/search/?q=${encodeURIComponent(query)}&stream=ndjson`
+      );
+      if (!res.ok) throw new Error(`Search failed with status ${res.status}`);
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const chunk = JSON.parse(line);
+          const chunkResults = chunk.results || [];
+          const playable = chunkResults.filter(item => item.stream_url && item.source !== 'youtube');
+          const embeds = chunkResults.filter(item => item.source === 'youtube');
+          if (playable.length) setResults(prev => [...prev, ...playable]);
+          if (embeds.length) setEmbedded(prev => [...prev, ...embeds]);
+          if (chunkResults.length) setLoading(false);
+        }
+      }
     } catch (error) {
       console.error('Search error:', error);
       setResults([]);
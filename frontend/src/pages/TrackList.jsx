@@ -12,6 +12,8 @@ function TrackList() {
   const [editModal, setEditModal] = useState(null);
   const [playlists, setPlaylists] = useState([]);
   const [selectedTrackToAdd, setSelectedTrackToAdd] = useState(null);
+  const [streamToken, setStreamToken] = useState(null);
+  const [favorited, setFavorited] = useState({ tracks: new Set(), online_tracks: new Set() });
 
   const audioRefs = useRef({});
   const token = localStorage.getItem('token');
@@ -31,34 +33,86 @@ function TrackList() {
     return results;
   };
 
+  const matchesSearch = (track) => {
+    const needle = search.trim().toLowerCase();
+    return !needle || [track.title, track.artist, track.album, track.source, ...track.tags, ...track.genres]
+      .some(value => value && value.toLowerCase().includes(needle));
+  };
+
   const fetchTracks = async () => {
     try {
-      const [uploaded, online] = await Promise.all([
-        fetchAllTracks(`http://localhost:8000/api/tracks/?search=${search}`, true),
-        fetchAllTracks(`http://localhost:8000/api/online-tracks/?search=${search}`, false)
-      ]);
-
-      setUploadedTracks(uploaded);
-      setOnlineTracks(online);
+      // Cursor pages cost the same however deep the library goes.
+      setUploadedTracks(
+        await fetchAllTracks(`http://localhost:8000/api/tracks/?search=${search}&pagination=cursor&page_size=50`, true)
+      );
     } catch (err) {
       console.error('Error fetching tracks:', err);
     }
   };
 
-  const fetchPlaylists = async () => {
+  // The user's own library (saved tracks, playlists) comes as one snapshot;
+  // the browser revalidates it with If-None-Match, so an unchanged library
+  // is a 304.
+  const fetchLibrary = async () => {
+    try {
+      const res = await axiosInstance.get('http://localhost:8000/api/library/');
+      setOnlineTracks(res.data.online_tracks);
+      setPlaylists(res.data.playlists);
+    } catch (err) {
+      console.error('Error fetching library:', err);
+    }
+  };
+
+  // <audio> can't send the Bearer header, so uploaded tracks are streamed
+  // (with Range/seek support) through a signed token instead.
+  const fetchStreamToken = async () => {
     try {
-      const res = await axiosInstance.get('http://localhost:8000/api/playlists/');
-      setPlaylists(res.data);
+      const res = await axiosInstance.get('http://localhost:8000/api/tracks/stream-token/');
+      setStreamToken(res.data.token);
     } catch (err) {
-      console.error('Error fetching playlists:', err);
+      console.error('Error fetching stream token:', err);
     }
   };
 
+  const streamUrl = (track) =>
+    streamToken
+      ? `http://localhost:8000/api/tracks/${track.id}/stream/?token=${encodeURIComponent(streamToken)}`
+      : track.audio_file;
+
   useEffect(() => {
     fetchTracks();
-    fetchPlaylists();
+    fetchStreamToken();
   }, [search]);
 
+  useEffect(() => {
+    fetchLibrary();
+  }, []);
+
+  // Heart state for everything shown, a thousand ids per request.
+  const fetchFavorited = async () => {
+    const found = { tracks: new Set(), online_tracks: new Set() };
+    const ids = { tracks: uploadedTracks.map(t => t.id), online_tracks: onlineTracks.map(t => t.id) };
+    try {
+      for (const [param, all] of Object.entries(ids)) {
+        for (let start = 0; start < all.length; start += 1000) {
+          const res = await axiosInstance.get('http://localhost:8000/api/favorites/contains/', {
+            params: { [param]: all.slice(start, start + 1000).join(',') }
+          });
+          res.data[param].forEach(id => found[param].add(id));
+        }
+      }
+      setFavorited(found);
+    } catch (err) {
+      console.error('Error fetching favorites:', err);
+    }
+  };
+
+  useEffect(() => {
+    fetchFavorited();
+  }, [uploadedTracks, onlineTracks]);
+
+  const isFavorited = (track, isOnline) => favorited[isOnline ? 'online_tracks' : 'tracks'].has(track.id);
+
   const handlePlayPause = (trackId, isOnline = false) => {
     Object.entries(audioRefs.current).forEach(([id, audio]) => {
       if (id !== trackId && audio) audio.pause();
@@ -85,7 +139,7 @@ function TrackList() {
       await axiosInstance.delete(url, {
         headers: { Authorization: `Bearer ${token}` }
       });
-      fetchTracks();
+      isOnline ? fetchLibrary() : fetchTracks();
     } catch (err) {
       console.error('Error deleting track:', err);
     }
@@ -98,6 +152,8 @@ function TrackList() {
         : { track: track.id };
 
       await axiosInstance.post('http://localhost:8000/api/favorites/', payload)
+      const kind = isOnline ? 'online_tracks' : 'tracks';
+      setFavorited(prev => ({ ...prev, [kind]: new Set(prev[kind]).add(track.id) }));
       alert(`Added "${track.title}" to favorites!`);
     } catch (err) {
       console.error('Error adding favorite:', err);
@@ -200,7 +256,7 @@ function TrackList() {
                 <p className="text-muted small">Genres: {track.genres.join(', ')}</p>
                 <audio
                   ref={(el) => (audioRefs.current[track.id] = el)}
-                  src={track.audio_file}
+                  src={streamUrl(track)}
                   onPause={() => setPlayingTrackId(null)}
                 />
                 <div className="d-flex justify-content-between mt-auto pt-2 flex-wrap">
@@ -218,8 +274,9 @@ function TrackList() {
                   <button
                     className="btn btn-outline-warning btn-sm me-1 mb-1"
                     onClick={() => handleFavorite(track, false)}
+                    disabled={isFavorited(track, false)}
                   >
-                    Favorite
+                    {isFavorited(track, false) ? '♥ Favorited' : 'Favorite'}
                   </button>
 
                   <div className="btn-group mb-1">
@@ -248,15 +305,15 @@ function TrackList() {
 
       <h4 className="mt-4">🌐 Online Saved Tracks</h4>
       <div className="row g-4">
-        {onlineTracks.map(track => (
+        {onlineTracks.filter(matchesSearch).map(track => (
           <div className="col-md-6 col-lg-4" key={track.id}>
             <div className="card shadow-sm h-100">
               {track.thumbnail && <img src={track.thumbnail} className="card-img-top" alt={track.title} />}
               <div className="card-body d-flex flex-column">
                 <h5 className="card-title">{track.title}</h5>
-                <p className="card-text">{track.artist?.name || 'Unknown Artist'} — {track.album?.name || ''}</p>
-                <p className="text-muted small">Tags: {track.tags?.map(t => t.name).join(', ')}</p>
-                <p className="text-muted small">Genres: {track.genres?.map(g => g.name).join(', ')}</p>
+                <p className="card-text">{track.artist || 'Unknown Artist'} — {track.album || ''}</p>
+                <p className="text-muted small">Tags: {track.tags.join(', ')}</p>
+                <p className="text-muted small">Genres: {track.genres.join(', ')}</p>
                 <audio
                   ref={(el) => (audioRefs.current[`online-${track.id}`] = el)}
                   src={track.stream_url}
@@ -280,8 +337,9 @@ function TrackList() {
                   <button
                     className="btn btn-outline-warning btn-sm me-1 mb-1"
                     onClick={() => handleFavorite(track, true)}
+                    disabled={isFavorited(track, true)}
                   >
-                    Favorite
+                    {isFavorited(track, true) ? '♥ Favorited' : 'Favorite'}
                   </button>
 
                   <button
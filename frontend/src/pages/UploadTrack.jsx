@@ -3,6 +3,36 @@ import axiosInstance from './axiosInstance';
 import { Link } from 'react-router-dom';
 import './UploadTrack.css';
 
+const UPLOADS_URL = 'http://localhost:8000/api/uploads/';
+const CHUNK_SIZE = 5 * 1024 * 1024;
+const MAX_RETRIES = 5;
+
+// Resumable upload: the file goes up in chunks, and after a failed chunk
+// we ask the server how much it kept and carry on from there.
+const uploadInChunks = async (file, onProgress) => {
+  const { data } = await axiosInstance.post(UPLOADS_URL, { filename: file.name, length: file.size });
+  const url = `${UPLOADS_URL}${data.id}/`;
+  let offset = 0;
+  let retries = 0;
+
+  while (offset < file.size) {
+    try {
+      const res = await axiosInstance.patch(url, file.slice(offset, offset + CHUNK_SIZE), {
+        headers: { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': offset },
+        timeout: 60000
+      });
+      offset = Number(res.headers['upload-offset']);
+      retries = 0;
+    } catch (err) {
+      if (++retries > MAX_RETRIES) throw err;
+      const res = await axiosInstance.get(url);
+      offset = res.data.offset;
+    }
+    onProgress(Math.round((offset / file.size) * 100));
+  }
+  return url;
+};
+
 function UploadTrack() {
   const [title, setTitle] = useState('');
   const [audioFile, setAudioFile] = useState(null);
@@ -13,6 +43,7 @@ function UploadTrack() {
   const [message, setMessage] = useState('');
   const [error, setError] = useState('');
   const [isUploading, setIsUploading] = useState(false);
+  const [progress, setProgress] = useState(0);
 
   const token = localStorage.getItem('token');
 
@@ -35,20 +66,11 @@ function UploadTrack() {
     setIsUploading(true);
     setMessage('');
     setError('');
-
-    const formData = new FormData();
-    formData.append('title', title);
-    formData.append('audio_file', audioFile);
-    formData.append('artist', artist);
-    formData.append('album', album);
+    setProgress(0);
 
     try {
-      await axiosInstance.post('http://localhost:8000/api/tracks/', formData, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      const uploadUrl = await uploadInChunks(audioFile, setProgress);
+      await axiosInstance.post(`${uploadUrl}finalize/`, { title, artist, album });
       setMessage('🎉 Track uploaded successfully!');
       setTitle('');
       setAudioFile(null);
@@ -128,7 +150,7 @@ function UploadTrack() {
 
                 <div className="d-grid">
                   <button className="btn btn-primary btn-lg" type="submit" disabled={isUploading}>
-                    {isUploading ? "Uploading..." : "🚀 Upload Track"}
+                    {isUploading ? `Uploading... ${progress}%` : "🚀 Upload Track"}
                   </button>
                 </div>
 
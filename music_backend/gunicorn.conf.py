@@ -0,0 +1,16 @@
+# gunicorn settings for serving the ASGI application with uvicorn workers
+# (see music_backend/asgi.py):
+#
+#     ASYNC_VIEWS=True gunicorn music_backend.asgi:application
+
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# One event loop per core is enough; each carries thousands of requests.
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# Streamed audio and search responses can stay open well past the default.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,119 @@
+from datetime import date, timedelta
+
+from .bulk import resolve_artists
+from .fragments import forget_fragments
+from .models import Album, Track
+
+
+def parse_release_date(value):
+    # Tags carry "2019", "2019-05" or "2019-05-01"; Album needs a full date.
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    try:
+        return date(int(value[:4]), 1, 1)
+    except ValueError:
+        return None
+
+
+def read_audio_metadata(path):
+    """
+    Read stream info and embedded tags from an audio file.
+
+    Returns a dict with ``duration`` (seconds), ``bitrate`` (kbps),
+    ``codec`` and the ``title``, ``artist``, ``album`` and ``date`` tags;
+    anything the file doesn't carry is None.
+    """
+    import mutagen  # Only the upload workers need it.
+
+    audio = mutagen.File(path, easy=True)
+    if audio is None:
+        raise ValueError("Unrecognized audio format")
+
+    tags = audio.tags or {}
+
+    def tag(name):
+        try:
+            values = tags.get(name)
+        except (KeyError, ValueError):
+            values = None
+        return str(values[0]).strip() or None if values else None
+
+    info = audio.info
+    codec = getattr(info, "codec", None) or audio.mime[0].split("/")[-1]
+    bitrate = getattr(info, "bitrate", None)
+    return {
+        "duration": getattr(info, "length", None),
+        "bitrate": bitrate // 1000 if bitrate else None,
+        "codec": codec,
+        "title": tag("title"),
+        "artist": tag("artist"),
+        "album": tag("album"),
+        "date": tag("date"),
+    }
+
+
+def apply_metadata(track, meta):
+    """
+    Copy extracted metadata onto ``track``. Values the uploader already set
+    are kept; only the stream info is always refreshed. Returns the names
+    of the fields that changed.
+    """
+    changed = ["bitrate", "codec"]
+    track.bitrate = meta["bitrate"]
+    track.codec = meta["codec"]
+
+    if track.duration is None and meta["duration"]:
+        track.duration = timedelta(seconds=meta["duration"])
+        changed.append("duration")
+    if not track.title and meta["title"]:
+        track.title = meta["title"]
+        changed.append("title")
+    if track.artist_id is None and meta["artist"]:
+        track.artist = resolve_artists([meta["artist"]])[meta["artist"]]
+        changed.append("artist")
+    if track.album_id is None and meta["album"] and track.artist_id:
+        album = Album.objects.filter(title=meta["album"], artist_id=track.artist_id).order_by("pk").first()
+        release_date = parse_release_date(meta["date"])
+        if album is None and release_date:
+            album = Album.objects.create(title=meta["album"], artist=track.artist, release_date=release_date)
+        if album is not None:
+            track.album = album
+            changed.append("album")
+    return changed
+
+
+def analyze_track(track_id):
+    """
+    Extract duration, bitrate, codec and tags from an uploaded track and
+    fill in the Track (and its Artist/Album). Runs on the task backend;
+    progress is visible to clients through ``Track.analysis_status``.
+    """
+    claimed = Track.objects.filter(
+        pk=track_id, analysis_status=Track.AnalysisStatus.PENDING
+    ).update(analysis_status=Track.AnalysisStatus.PROCESSING)
+    if not claimed:
+        # Deleted meanwhile, or another worker got there first.
+        return
+    forget_fragments(Track, [track_id])
+
+    track = Track.objects.get(pk=track_id)
+    audio = track.audio_file or track.file
+    try:
+        if not audio:
+            raise ValueError("Track has no uploaded audio")
+        meta = read_audio_metadata(audio.path)
+    except Exception as exc:
+        Track.objects.filter(pk=track_id).update(
+            analysis_status=Track.AnalysisStatus.FAILED, analysis_error=str(exc)
+        )
+        forget_fragments(Track, [track_id])
+        return
+
+    changed = apply_metadata(track, meta)
+    track.analysis_status = Track.AnalysisStatus.DONE
+    track.analysis_error = ""
+    track.save(update_fields=changed + ["analysis_status", "analysis_error"])
@@ -0,0 +1,102 @@
+from django.db import transaction
+
+from .models import Album, Artist, Genre, LibraryChange, Tag, onlineTrack
+from .reference import resolve_names
+from .search.library import update_search_vectors
+from .sync import record_library_changes
+
+
+def resolve_artists(names):
+    """
+    Map artist names to Artist rows: one query for the existing ones and one
+    bulk insert for the rest. Names are not unique, so the oldest row wins.
+    """
+    names = {name for name in names if name}
+    artists = {}
+    for artist in Artist.objects.filter(name__in=names).order_by('pk'):
+        artists.setdefault(artist.name, artist)
+
+    missing = [Artist(name=name) for name in names if name not in artists]
+    for artist in Artist.objects.bulk_create(missing):
+        artists[artist.name] = artist
+    return artists
+
+
+def resolve_albums(titles):
+    """
+    Map album titles to existing Album rows in one query. Unknown titles are
+    left out: an Album needs an artist and a release date we don't have.
+    """
+    titles = {title for title in titles if title}
+    albums = {}
+    for album in Album.objects.filter(title__in=titles).order_by('pk'):
+        albums.setdefault(album.title, album)
+    return albums
+
+
+def resolve_labels(model, names):
+    """Map Genre/Tag names to primary keys from the reference cache."""
+    return resolve_names(model, set(names))
+
+
+def bulk_save_online_tracks(user, items):
+    """
+    Save validated online-track dicts for ``user`` in one transaction with
+    a fixed number of queries, whatever the number of items.
+
+    Items that match an already saved track, or an earlier item in the same
+    batch, on (title, source) are skipped. Returns ``(created_ids, skipped)``
+    where ``skipped`` lists the (title, source) pairs left out.
+    """
+    with transaction.atomic():
+        existing = set(
+            onlineTrack.objects.filter(user=user, title__in={item['title'] for item in items})
+            .values_list('title', 'source')
+        )
+
+        fresh, skipped = [], []
+        for item in items:
+            key = (item['title'], item.get('source'))
+            if key in existing:
+                skipped.append(key)
+                continue
+            existing.add(key)
+            fresh.append(item)
+
+        artists = resolve_artists(item.get('artist') for item in fresh)
+        albums = resolve_albums(item.get('album') for item in fresh)
+        genres = resolve_labels(Genre, (name for item in fresh for name in item.get('genres', [])))
+        tags = resolve_labels(Tag, (name for item in fresh for name in item.get('tags', [])))
+
+        tracks = onlineTrack.objects.bulk_create([
+            onlineTrack(
+                user=user,
+                title=item['title'],
+                artist=artists.get(item.get('artist')),
+                album=albums.get(item.get('album')),
+                stream_url=item.get('stream_url'),
+                thumbnail=item.get('thumbnail'),
+                source=item.get('source'),
+            )
+            for item in fresh
+        ])
+
+        genre_links = onlineTrack.genres.through
+        tag_links = onlineTrack.tags.through
+        genre_links.objects.bulk_create([
+            genre_links(onlinetrack_id=track.pk, genre_id=genres[name])
+            for track, item in zip(tracks, fresh) for name in set(item.get('genres', []))
+        ])
+        tag_links.objects.bulk_create([
+            tag_links(onlinetrack_id=track.pk, tag_id=tags[name])
+            for track, item in zip(tracks, fresh) for name in set(item.get('tags', []))
+        ])
+
+        # bulk_create skips the post_save/m2m_changed signals that keep the
+        # search vectors and the library change log current, so do it here.
+        created_ids = [track.pk for track in tracks]
+        if created_ids:
+            update_search_vectors(onlineTrack, created_ids)
+            record_library_changes((user.pk, LibraryChange.Kind.ONLINE_TRACK, pk, False) for pk in created_ids)
+
+    return created_ids, skipped
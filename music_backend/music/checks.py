@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries only the current process sees (or nobody does).
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The reference table cache (music.reference), the response fragments
+    (music.fragments) and the favorites membership arrays
+    (music.favorites) are invalidated or updated through keys in the
+    default cache. With a per-process cache that only
+    reaches the worker that made the write, and every other one keeps
+    serving what it had.
+    """
+    if not getattr(settings, "REQUIRE_SHARED_CACHE", False):
+        return []
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get("BACKEND")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint=(
+            "Set REDIS_URL, or point CACHES['default'] at Redis or Memcached. Set "
+            "REQUIRE_SHARED_CACHE = False only when a single process serves the API."
+        ),
+        obj="CACHES",
+        id="music.E001",
+    )]
@@ -0,0 +1,29 @@
+import os
+import subprocess
+
+
+def encode_hls_rendition(ffmpeg, source, out_dir, bitrate, segment_seconds, timeout=None):
+    """
+    Transcode ``source`` to stereo AAC at ``bitrate`` kbps and package it
+    as an HLS VOD playlist (``index.m3u8``) with MPEG-TS segments in
+    ``out_dir``. Returns the playlist path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    playlist = os.path.join(out_dir, "index.m3u8")
+    command = [
+        ffmpeg, "-v", "error", "-y", "-i", source,
+        "-vn", "-c:a", "aac", "-b:a", f"{bitrate}k", "-ac", "2",
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "segment_%04d.ts"),
+        playlist,
+    ]
+    try:
+        subprocess.run(command, capture_output=True, check=True, timeout=timeout)
+    except FileNotFoundError:
+        raise RuntimeError(f"{ffmpeg} not found")
+    except subprocess.CalledProcessError as exc:
+        # Re-raised as a plain message, which is recorded on the rendition.
+        raise RuntimeError(exc.stderr.decode(errors="replace").strip() or f"{ffmpeg} exited with {exc.returncode}")
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Transcoding took longer than {timeout}s")
+    return playlist
@@ -0,0 +1,78 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .renderers import Fragment, FragmentList, JSONRenderer
+
+# Bump when the cached layout changes.
+FRAGMENT_FORMAT = 1
+
+
+def _version_key(model, pk):
+    return f"fragment-version:{model._meta.label_lower}:{pk}"
+
+
+def serialized_fragments(serializer_class, objects, queryset, context, rows=None):
+    """
+    ``objects`` as serialized by ``serializer_class``, each from the cache
+    when it hasn't changed since it was last serialized. Returns a
+    FragmentList in the same order, leaving out objects deleted meanwhile.
+
+    Every object has a version token in the shared cache, replaced on each
+    write (music.signals), and its fragment is keyed on it. Misses are
+    re-read through ``queryset`` (with whatever it prefetches) *after* the
+    token is known, so a fragment is never older than its token; only they
+    are serialized, together, by ``rows(queryset, context)`` when given
+    (music.lean: the same output without the serializer). A page costs
+    two cache round trips, plus one query set and serializing the misses.
+
+    Tokens must live in a cache every worker shares (see
+    music.checks.check_shared_cache), or a write would only reach the
+    worker that made it.
+    """
+    model = queryset.model
+    pks = [obj.pk for obj in objects]
+    timeout = getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 60 * 60)
+
+    version_keys = {pk: _version_key(model, pk) for pk in pks}
+    versions = cache.get_many(version_keys.values())
+    new_versions = {key: uuid.uuid4().hex for key in version_keys.values() if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, timeout)
+        versions.update(new_versions)
+
+    # Output can depend on the request (absolute file URLs), so on its origin.
+    request = context.get("request")
+    origin = request.build_absolute_uri("/") if request is not None else ""
+    variant = hashlib.blake2s(origin.encode(), digest_size=8).hexdigest()
+    prefix = f"fragment:{FRAGMENT_FORMAT}:{serializer_class.__module__}.{serializer_class.__qualname__}:{variant}"
+    keys = {pk: f"{prefix}:{pk}:{versions[version_keys[pk]]}" for pk in pks}
+    raw = cache.get_many(keys.values())
+
+    missing = [pk for pk in pks if keys[pk] not in raw]
+    if missing:
+        fresh = queryset.filter(pk__in=missing)
+        if rows is not None:
+            data = rows(fresh, context)
+        else:
+            data = serializer_class(fresh, many=True, context=context).data
+        renderer = JSONRenderer()
+        encoded = {keys[row["id"]]: renderer.dumps(row) for row in data}
+        cache.set_many(encoded, timeout)
+        raw.update(encoded)
+
+    return FragmentList(Fragment(raw[keys[pk]]) for pk in pks if keys[pk] in raw)
+
+
+def forget_fragments(model, pks):
+    # Dropping the tokens orphans every fragment keyed on them. Dropped
+    # right away, and again on commit in case a reader cached the objects
+    # as they were before this transaction meanwhile.
+    keys = [_version_key(model, pk) for pk in pks]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
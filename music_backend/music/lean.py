@@ -0,0 +1,89 @@
+"""
+Lean list rows: what TrackSerializer and OnlineTrackSerializer return,
+built straight from ``.values()`` rows with genres and tags aggregated in
+the same query, without a serializer field per value. Keep them in step
+with those serializers; LeanRowsTests checks they match.
+"""
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import F, OuterRef
+from django.utils.duration import duration_string
+from rest_framework.settings import api_settings
+
+from .models import Genre, Tag, Track
+
+
+def _labels(model, relation, field):
+    # Ordered by id, as the serializers' label prefetches are.
+    return ArraySubquery(model.objects.filter(**{relation: OuterRef("pk")}).order_by("pk").values(field))
+
+
+def _plain(queryset):
+    return queryset.select_related(None).prefetch_related(None)
+
+
+def _file_url(field, context):
+    """TrackSerializer's rendering of a FileField, as a function of the stored name."""
+    storage = Track._meta.get_field(field).storage
+    request = context.get("request")
+
+    def url(name):
+        if not name:
+            return None
+        if not api_settings.UPLOADED_FILES_USE_URL:
+            return name
+        if request is not None:
+            return request.build_absolute_uri(storage.url(name))
+        return storage.url(name)
+
+    return url
+
+
+def lean_track_rows(queryset, context):
+    file_url = _file_url("file", context)
+    audio_file_url = _file_url("audio_file", context)
+    rows = _plain(queryset).values(
+        "id", "title", "file", "duration", "artist", "album", "uploaded_by", "audio_file", "stream_url",
+        "bitrate", "codec", "analysis_status", "analysis_error",
+    ).annotate(genre_ids=_labels(Genre, "track", "pk"), tag_ids=_labels(Tag, "track", "pk"))
+    return [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "file": file_url(row["file"]),
+            "duration": duration_string(row["duration"]) if row["duration"] is not None else None,
+            "artist": row["artist"],
+            "album": row["album"],
+            "uploaded_by": row["uploaded_by"],
+            "genres": row["genre_ids"],
+            "tags": row["tag_ids"],
+            "audio_file": audio_file_url(row["audio_file"]),
+            "stream_url": row["stream_url"],
+            "bitrate": row["bitrate"],
+            "codec": row["codec"],
+            "analysis_status": row["analysis_status"],
+            "analysis_error": row["analysis_error"],
+        }
+        for row in rows
+    ]
+
+
+def lean_online_track_rows(queryset, context):
+    rows = _plain(queryset).values(
+        "id", "title", "stream_url", "thumbnail", "source",
+        artist_name=F("artist__name"), album_title=F("album__title"),
+    ).annotate(genre_names=_labels(Genre, "onlinetrack", "name"), tag_names=_labels(Tag, "onlinetrack", "name"))
+    return [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "artist": row["artist_name"],
+            "album": row["album_title"],
+            "stream_url": row["stream_url"],
+            "thumbnail": row["thumbnail"],
+            "source": row["source"],
+            "genres": row["genre_names"],
+            "tags": row["tag_names"],
+        }
+        for row in rows
+    ]
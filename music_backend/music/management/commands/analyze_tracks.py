@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from music.audio import analyze_track
+from music.fragments import forget_fragments
+from music.models import Track
+from music.transcode import transcode_track
+from music.waveform import compute_waveform
+
+
+class Command(BaseCommand):
+    help = "Analyze, compute waveforms for and transcode uploaded tracks; pending tracks only unless --all."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-analyze tracks that were already processed.")
+
+    def handle(self, *args, **options):
+        tracks = Track.objects.all()
+        if options["all"]:
+            tracks.update(analysis_status=Track.AnalysisStatus.PENDING)
+        else:
+            tracks = tracks.filter(analysis_status=Track.AnalysisStatus.PENDING)
+
+        pks = list(tracks.order_by("pk").values_list("pk", flat=True))
+        forget_fragments(Track, pks)
+        for pk in pks:
+            analyze_track(pk)
+            compute_waveform(pk)
+            transcode_track(pk)
+
+        failed = Track.objects.filter(pk__in=pks, analysis_status=Track.AnalysisStatus.FAILED).count()
+        self.stdout.write(f"{len(pks)} track(s) analyzed, {failed} failed")
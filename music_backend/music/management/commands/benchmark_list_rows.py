@@ -0,0 +1,60 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from music.models import Genre, Tag, Track, onlineTrack
+from music.views import TrackViewSet, onlineTrackViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing a page of tracks and online tracks through their serializers and through the "
+        "lean .values() rows, in rows/second. Works on throwaway rows that are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--labels", type=int, default=3, help="Genres and tags per track.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per path; the best one counts.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.fill(options["rows"], options["labels"])
+            for view in (TrackViewSet, onlineTrackViewSet):
+                owner = "uploaded_by" if view is TrackViewSet else "user"
+                queryset = view.fragment_queryset.filter(**{owner: user})
+                full = self.best(options["repeat"], lambda: view.serializer_class(queryset, many=True).data)
+                lean = self.best(options["repeat"], lambda: view.lean_rows(queryset, {}))
+                rows = options["rows"]
+                self.stdout.write(
+                    f"{view.serializer_class.Meta.model.__name__}: serializer {rows / full:,.0f} rows/s, "
+                    f"lean {rows / lean:,.0f} rows/s ({full / lean:.1f}x)"
+                )
+            transaction.set_rollback(True)
+
+    def fill(self, count, labels):
+        # bulk_create skips the signals; nothing here outlives the rollback.
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex}")
+        genres = Genre.objects.bulk_create([Genre(name=f"{user.username} genre {i}") for i in range(labels)])
+        tags = Tag.objects.bulk_create([Tag(name=f"{user.username} tag {i}") for i in range(labels)])
+        for model, owner in ((Track, "uploaded_by"), (onlineTrack, "user")):
+            tracks = model.objects.bulk_create([model(title=f"track {i}", **{owner: user}) for i in range(count)])
+            for name, values in (("genres", genres), ("tags", tags)):
+                field = model._meta.get_field(name)
+                source, target = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+                through = field.remote_field.through
+                through.objects.bulk_create(
+                    [through(**{source: track.pk, target: value.pk}) for track in tracks for value in values]
+                )
+        return user
+
+    def best(self, repeat, run):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return min(times)
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F, Func, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from music.models import AudioBlob, Track
+from music.storage import get_blob_storage
+
+
+class Command(BaseCommand):
+    help = "Recount audio blob references and delete blobs no Track uses any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours", type=float, default=getattr(settings, "BLOB_GC_GRACE_HOURS", 1),
+            help="Keep unreferenced blobs touched more recently than this (uploads in flight).",
+        )
+
+    def handle(self, *args, **options):
+        # Refcounts are kept incrementally by music.signals; recounting here
+        # repairs any drift (e.g. a failed request after the file was stored).
+        references = Subquery(
+            Track.objects.filter(Q(file=OuterRef("name")) | Q(audio_file=OuterRef("name")))
+            .order_by()
+            .annotate(count=Func(F("pk"), function="COUNT"))
+            .values("count")
+        )
+        fixed = AudioBlob.objects.exclude(refcount=references).update(refcount=references)
+
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        storage = get_blob_storage()
+        removed = 0
+        for blob in AudioBlob.objects.filter(refcount=0, updated_at__lt=cutoff):
+            storage.delete(blob.name)
+            blob.delete()
+            removed += 1
+        self.stdout.write(f"{fixed} refcount(s) fixed, {removed} blob(s) removed")
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from music.models import LibraryChange, LibraryRevision
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete library sync tombstones older than LIBRARY_TOMBSTONE_RETENTION_DAYS. "
+        "Clients syncing from before them are told to start over from a snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=getattr(settings, "LIBRARY_TOMBSTONE_RETENTION_DAYS", 30))
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        stale = LibraryChange.objects.filter(deleted=True, changed_at__lt=cutoff)
+        newest_pruned = (
+            stale.filter(user=OuterRef("user")).values("user").annotate(newest=Max("revision")).values("newest")
+        )
+        with transaction.atomic():
+            # Raise the floor first: a sync from below it could miss a delete.
+            LibraryRevision.objects.filter(user__in=stale.values("user")).update(
+                sync_floor=Greatest(F("sync_floor"), Subquery(newest_pruned))
+            )
+            count, _ = stale.delete()
+        self.stdout.write(f"{count} tombstone(s) pruned")
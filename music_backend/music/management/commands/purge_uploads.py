@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from music.models import ChunkedUpload
+from music.uploads import discard
+
+
+class Command(BaseCommand):
+    help = "Delete resumable uploads untouched for UPLOAD_EXPIRY_HOURS, with their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=getattr(settings, "UPLOAD_EXPIRY_HOURS", 24))
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["hours"])
+        stale = ChunkedUpload.objects.filter(updated_at__lt=cutoff)
+        count = 0
+        for upload in stale.iterator():
+            discard(upload)
+            count += 1
+        stale.delete()
+        self.stdout.write(f"{count} upload(s) purged")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from music.models import Playlist
+from music.playlists import refresh_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute every playlist's denormalized item count, total duration and cover thumbnail."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(Playlist.objects.order_by("pk").values_list("pk", flat=True))
+        size = options["batch_size"]
+        for start in range(0, len(ids), size):
+            # One UPDATE per batch keeps each transaction short.
+            with transaction.atomic():
+                refresh_aggregates(ids[start:start + size], touch=False)
+        self.stdout.write(f"{len(ids)} playlist(s) rebuilt")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from music.models import Track, onlineTrack
+from music.search.library import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search vectors of Track and onlineTrack rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model in (Track, onlineTrack):
+            # Walk primary keys in batches so a large table is not rewritten
+            # in one long transaction.
+            updated = 0
+            last_pk = 0
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+                )
+                if not pks:
+                    break
+                updated += update_search_vectors(model, pks)
+                last_pk = pks[-1]
+            self.stdout.write(f"{model.__name__}: {updated} row(s) indexed")
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_favoritetrack'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Existing rows get their vectors from `manage.py rebuild_search_index`.
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='onlinetrack',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='onlinetrack',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='online_track_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='onlinetrack',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='online_track_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='track_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='track_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
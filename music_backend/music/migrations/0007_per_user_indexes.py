@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_search_vectors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # The composite indexes are built before the single-column FK indexes
+    # they replace are dropped.
+    operations = [
+        migrations.AddIndex(
+            model_name='favoritetrack',
+            index=models.Index(fields=['user', 'favorited_at'], include=('track', 'online_track'), name='favorite_user_favorited'),
+        ),
+        migrations.AddIndex(
+            model_name='onlinetrack',
+            index=models.Index(fields=['user', 'saved_at', 'id'], name='online_track_user_saved'),
+        ),
+        migrations.AddIndex(
+            model_name='onlinetrack',
+            index=models.Index(fields=['user', 'title', 'source'], name='online_track_user_title_src'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['user', 'created_at'], include=('name',), name='playlist_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='playlistitem',
+            index=models.Index(fields=['playlist', 'id'], include=('track', 'online_track'), name='playlist_item_playlist_id'),
+        ),
+        migrations.AlterField(
+            model_name='favoritetrack',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='onlinetrack',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='playlist',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='playlistitem',
+            name='playlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='music.playlist'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_per_user_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='favoritetrack',
+            name='favorite_user_favorited',
+        ),
+        migrations.AddIndex(
+            model_name='favoritetrack',
+            index=models.Index(fields=['user', 'favorited_at', 'id'], include=('track', 'online_track'), name='favorite_user_favorited_id'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['created_at', 'id'], name='track_created_id'),
+        ),
+    ]
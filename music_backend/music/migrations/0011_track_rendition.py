@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_track_waveform'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bitrate', models.PositiveIntegerField()),
+                ('codec', models.CharField(default='mp4a.40.2', max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('playlist', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='music.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track', 'bitrate'), name='track_rendition_bitrate')],
+            },
+        ),
+    ]
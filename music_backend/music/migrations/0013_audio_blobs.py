@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:13
+
+import music.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='audio_file',
+            field=models.FileField(blank=True, max_length=255, null=True, storage=music.storage.get_blob_storage, upload_to='tracks/'),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=music.storage.get_blob_storage, upload_to='tracks/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('music', '0013_audio_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryRevision',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='library_revision', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('revision', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_library_revision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libraryrevision',
+            name='sync_floor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='LibraryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('online_track', 'Online Track'), ('playlist', 'Playlist'), ('playlist_item', 'Playlist Item'), ('favorite', 'Favorite')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('revision', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='library_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'revision'], name='library_change_user_revision')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='library_change_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+from django.db import migrations, models
+
+from music.ranks import ranks_between
+
+
+def rank_existing_items(apps, schema_editor):
+    # Existing items keep their insertion (id) order.
+    PlaylistItem = apps.get_model('music', 'PlaylistItem')
+    playlist_ids = PlaylistItem.objects.values_list('playlist_id', flat=True).distinct()
+    for playlist_id in playlist_ids.iterator():
+        items = list(PlaylistItem.objects.filter(playlist_id=playlist_id).order_by('id'))
+        for item, rank in zip(items, ranks_between(None, None, len(items))):
+            item.rank = rank
+        PlaylistItem.objects.bulk_update(items, ['rank'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_library_changes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='playlistitem',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='playlistitem',
+            name='playlist_item_playlist_id',
+        ),
+        migrations.AddField(
+            model_name='playlistitem',
+            name='rank',
+            field=models.CharField(blank=True, db_collation='C', max_length=255),
+        ),
+        migrations.RunPython(rank_existing_items, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='playlistitem',
+            index=models.Index(fields=['playlist', 'rank'], include=('track', 'online_track'), name='playlist_item_rank'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_aggregates(apps, schema_editor):
+    # Same as music.playlists.refresh_aggregates, against this migration's models.
+    Playlist = apps.get_model('music', 'Playlist')
+    PlaylistItem = apps.get_model('music', 'PlaylistItem')
+    items = PlaylistItem.objects.filter(playlist=OuterRef('pk')).order_by().values('playlist')
+    covers = (
+        PlaylistItem.objects.filter(playlist=OuterRef('pk'), online_track__thumbnail__gt='')
+        .order_by('rank', 'id')
+        .values('online_track__thumbnail')[:1]
+    )
+    Playlist.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Count('pk')).values('n')), 0),
+        total_duration=Coalesce(
+            Subquery(items.annotate(total=Sum('track__duration')).values('total')),
+            Value(datetime.timedelta(0), output_field=models.DurationField()),
+        ),
+        cover_thumbnail=Subquery(covers),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0016_playlist_item_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='cover_thumbnail',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='total_duration',
+            field=models.DurationField(default=datetime.timedelta),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 
+from .ranks import rank_between
+from .storage import get_blob_storage
+
 class Genre(models.Model):
     name = models.CharField(max_length=100 ,unique = True)
 
@@ -37,25 +45,98 @@ class Album(models.Model):
 
 
 
+class AudioBlob(models.Model):
+    # One stored audio file, shared by every Track uploaded with the same
+    # bytes; see music.storage.ContentAddressedStorage.
+    digest = models.CharField(max_length=64, primary_key=True)  # sha256 hex
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Track(models.Model):
+    class AnalysisStatus(models.TextChoices):
+        PENDING = 'pending'
+        PROCESSING = 'processing'
+        DONE = 'done'
+        FAILED = 'failed'
+
     title = models.CharField(max_length=255 , blank=True, null=True)
     artist = models.ForeignKey(Artist, on_delete=models.SET_NULL, null=True, blank=True)
     album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, blank=True)
-    file = models.FileField(upload_to='tracks/',blank=True, null=True)
+    file = models.FileField(upload_to='tracks/', storage=get_blob_storage, blank=True, null=True)
     duration = models.DurationField(blank=True, null=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank =True)
     genres = models.ManyToManyField(Genre , blank = True)
     tags = models.ManyToManyField(Tag, blank= True)
     created_at = models.DateTimeField(auto_now_add=True)
-    audio_file = models.FileField(upload_to='tracks/',null=True,blank=True,max_length=255)
+    audio_file = models.FileField(upload_to='tracks/', storage=get_blob_storage, null=True,blank=True,max_length=255)
     stream_url = models.URLField(blank=True, null=True,default=None)  
+    # Filled in from the uploaded file by music.audio.analyze_track.
+    bitrate = models.PositiveIntegerField(blank=True, null=True)  # kbps
+    codec = models.CharField(max_length=50, blank=True)
+    analysis_status = models.CharField(max_length=10, choices=AnalysisStatus.choices, default=AnalysisStatus.PENDING)
+    analysis_error = models.TextField(blank=True)
+    # Maintained by music.signals; see music.search.library.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='track_search_vector_gin'),
+            GinIndex(fields=['title'], name='track_title_trgm', opclasses=['gin_trgm_ops']),
+            # Keyset pagination: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['created_at', 'id'], name='track_created_id'),
+        ]
 
     def __str__(self):
         return self.title or self.file.name
 
 
+class TrackWaveform(models.Model):
+    # Kept off Track so list queries never drag the blob along.
+    # Written by music.waveform.compute_waveform.
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, related_name='waveform')
+    peaks = models.BinaryField()  # int8 peak envelope, 0..127
+    loudness = models.FloatField(blank=True, null=True)  # integrated LUFS
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Waveform of {self.track}"
+
+
+class TrackRendition(models.Model):
+    # One HLS bitrate rung of a Track; written by music.transcode.
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        READY = 'ready'
+        FAILED = 'failed'
+
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='renditions')
+    bitrate = models.PositiveIntegerField()  # kbps
+    codec = models.CharField(max_length=50, default='mp4a.40.2')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    error = models.TextField(blank=True)
+    # Storage-relative path of the variant playlist; segments sit next to it.
+    playlist = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'bitrate'], name='track_rendition_bitrate'),
+        ]
+
+    def __str__(self):
+        return f"{self.track} @ {self.bitrate} kbps"
+
+
 class onlineTrack(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by the (user, ...) composite indexes below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=255)
     artist = models.ForeignKey(Artist, on_delete=models.SET_NULL, null=True, blank=True)
     album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, blank=True)
@@ -65,30 +146,67 @@ class onlineTrack(models.Model):
     saved_at = models.DateTimeField(auto_now_add=True)
     genres = models.ManyToManyField(Genre , blank = True)
     tags = models.ManyToManyField(Tag, blank= True)
+    # Maintained by music.signals; see music.search.library.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='online_track_search_gin'),
+            GinIndex(fields=['title'], name='online_track_title_trgm', opclasses=['gin_trgm_ops']),
+            # Library listing: WHERE user_id = ? ORDER BY saved_at DESC, id DESC
+            models.Index(fields=['user', 'saved_at', 'id'], name='online_track_user_saved'),
+            # Duplicate check on save: WHERE user_id = ? AND title = ? AND source = ?
+            models.Index(fields=['user', 'title', 'source'], name='online_track_user_title_src'),
+        ]
 
     def __str__(self):
         return self.title or self.stream_url or "untitled"
 
 class Playlist(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by the (user, created_at) index below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from the items so the index page reads this table only;
+    # kept current by music.playlists.refresh_aggregates (rebuild them all
+    # with rebuild_playlist_aggregates).
+    item_count = models.PositiveIntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    last_modified = models.DateTimeField(auto_now=True)
+    cover_thumbnail = models.URLField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Playlist index page: WHERE user_id = ? ORDER BY created_at
+            models.Index(fields=['user', 'created_at'], name='playlist_user_created', include=['name']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.user.username}"
 
 class PlaylistItem(models.Model):
-    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='items')
+    # Covered by the (playlist, rank) index below.
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='items', db_index=False)
     track = models.ForeignKey(Track, null=True, blank=True, on_delete=models.CASCADE)
     online_track = models.ForeignKey(onlineTrack, null=True, blank=True, on_delete=models.CASCADE)
+    # Fractional rank key (music.ranks), compared byte-wise. Moving an item
+    # rewrites its rank only; saving an item without one appends it.
+    rank = models.CharField(max_length=255, db_collation='C', blank=True)
 
     class Meta:
+        ordering = ['rank', 'id']
         constraints = [
             models.UniqueConstraint(
                 fields=['playlist', 'track', 'online_track'],
                 name='unique_playlist_track_combination'
             )
         ]
+        indexes = [
+            # Items of a playlist in order, answered from the index alone.
+            # Not unique: a reorder rewrites ranks in one UPDATE, and ranks
+            # are only handed out under the playlist's row lock anyway.
+            models.Index(fields=['playlist', 'rank'], name='playlist_item_rank', include=['track', 'online_track']),
+        ]
 
     def clean(self):
         if not self.track and not self.online_track:
@@ -98,7 +216,14 @@ class PlaylistItem(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()  # ensure constraints before saving
-        super().save(*args, **kwargs)
+        if self.rank:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            # The playlist's row lock keeps concurrent appends from picking the same rank.
+            list(Playlist.objects.select_for_update().filter(pk=self.playlist_id).values_list('pk'))
+            last = PlaylistItem.objects.filter(playlist_id=self.playlist_id).order_by('-rank').values_list('rank', flat=True).first()
+            self.rank = rank_between(last, None)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.playlist.name} item: {self.track or self.online_track}"
@@ -106,13 +231,18 @@ class PlaylistItem(models.Model):
 
 
 class FavoriteTrack(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by unique_together and the (user, favorited_at) index below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     track = models.ForeignKey(Track, null=True, blank=True, on_delete=models.CASCADE)
     online_track = models.ForeignKey(onlineTrack, null=True, blank=True, on_delete=models.CASCADE)
     favorited_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'track', 'online_track')
+        indexes = [
+            # Favorites listing: WHERE user_id = ? ORDER BY favorited_at DESC, id DESC
+            models.Index(fields=['user', 'favorited_at', 'id'], name='favorite_user_favorited_id', include=['track', 'online_track']),
+        ]
 
     def clean(self):
         if not self.track and not self.online_track:
@@ -126,3 +256,65 @@ class FavoriteTrack(models.Model):
 
     def __str__(self):
         return f"{self.user.username} favorited: {self.track or self.online_track}"
+
+
+class ChunkedUpload(models.Model):
+    # A resumable upload in progress; see music.uploads. The bytes live in
+    # a .part file until finalize turns them into a Track.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField()
+    # Optional, declared by the client: lets a known file skip the upload.
+    sha256 = models.CharField(max_length=64, blank=True)
+    offset = models.BigIntegerField(default=0)
+    track = models.OneToOneField(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length})"
+
+
+class LibraryRevision(models.Model):
+    # Bumped on every write to a user's library (music.signals); versions
+    # the /api/library/ snapshot. No row means revision 0.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='library_revision')
+    revision = models.BigIntegerField(default=0)
+    # Tombstones up to this revision were pruned; older sync tokens must
+    # start over from a snapshot.
+    sync_floor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} @ {self.revision}"
+
+
+class LibraryChange(models.Model):
+    # The latest change to each object of a user's library, stamped with
+    # the revision it happened at; deletes leave a tombstone (deleted=True).
+    # Feeds /api/library/sync/ (music.sync).
+    class Kind(models.TextChoices):
+        ONLINE_TRACK = 'online_track'
+        PLAYLIST = 'playlist'
+        PLAYLIST_ITEM = 'playlist_item'
+        FAVORITE = 'favorite'
+
+    # Covered by the (user, revision) index below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='library_changes', db_index=False)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    revision = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='library_change_object'),
+        ]
+        indexes = [
+            # Sync: WHERE user_id = ? AND revision > ? ORDER BY revision
+            models.Index(fields=['user', 'revision'], name='library_change_user_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} @ {self.revision}{' (deleted)' if self.deleted else ''}"
@@ -0,0 +1,165 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def wants_keyset(request):
+    return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination, newest first, over ``(view.keyset_field, id)``.
+
+    Each page is fetched with ``WHERE (field, id) < (last field, last id)``
+    against a composite index, so page 1000 costs the same as page 1, and no
+    COUNT(*) is run. The response is ``{"next", "previous", "results"}``
+    with an opaque ``cursor`` in ``next``; ``previous`` is always null.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # When False the view stays unpaginated unless the client asks for it.
+    paginate_by_default = True
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, value, pk):
+        raw = f'{value.isoformat()}|{pk}'.encode()
+        return urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            value, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(value), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.paginate_by_default and not wants_keyset(request):
+            return None
+
+        self.request = request
+        self.field = view.keyset_field
+        self.page_size_for_request = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.field}', '-id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            # The <= bound gives the index a range to seek on; the OR
+            # breaks ties between rows saved in the same instant.
+            queryset = queryset.filter(**{f'{self.field}__lte': value}).filter(
+                Q(**{f'{self.field}__lt': value}) | Q(id__lt=pk)
+            )
+
+        rows = list(queryset[:self.page_size_for_request + 1])
+        self.has_next = len(rows) > self.page_size_for_request
+        self.page = rows[:self.page_size_for_request]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, 'pagination', 'cursor')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(getattr(last, self.field), last.pk))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    # For endpoints that have always returned a plain list.
+    paginate_by_default = False
+
+
+class TrackPagination(PageNumberPagination):
+    """
+    Page-number pagination with two opt-in modes:
+
+    * ``?pagination=cursor`` switches to :class:`KeysetPagination`.
+    * ``?count=false`` skips the COUNT(*); ``count`` is null and ``next`` is
+      worked out by fetching one extra row.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        self.skip_count = False
+
+        if wants_keyset(request):
+            self.display_page_controls = False
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get('count') in ('0', 'false'):
+            self.display_page_controls = False
+            self.skip_count = True
+            return self.paginate_without_count(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_without_count(self, queryset, request):
+        self.request = request
+        size = self.get_page_size(request)
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * size
+        rows = list(queryset[offset:offset + size + 1])
+        self.has_next = len(rows) > size
+        return rows[:size]
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        if self.skip_count:
+            url = self.request.build_absolute_uri()
+            next_url = replace_query_param(url, self.page_query_param, self.page_number + 1) if self.has_next else None
+            if self.page_number == 1:
+                previous_url = None
+            elif self.page_number == 2:
+                previous_url = remove_query_param(url, self.page_query_param)
+            else:
+                previous_url = replace_query_param(url, self.page_query_param, self.page_number - 1)
+            return Response({
+                'count': None,
+                'next': next_url,
+                'previous': previous_url,
+                'results': data,
+            })
+        return super().get_paginated_response(data)
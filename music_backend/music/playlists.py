@@ -0,0 +1,193 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DurationField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+from rest_framework.exceptions import ValidationError
+
+from .fragments import forget_fragments
+from .models import LibraryChange, Playlist, PlaylistItem, Track, onlineTrack
+from .ranks import ranks_between
+from .sync import record_library_changes
+
+# Where a batch goes when the client names no item to put it after.
+AT_END = object()
+
+# Ranks grow by a digit every few inserts at the same spot; past this the
+# playlist is respread once instead of letting them grow further.
+MAX_RANK_LENGTH = 128
+
+
+# --- Ranks ---
+
+def lock_playlist(playlist):
+    # Every rank is handed out under the playlist's row lock, so concurrent
+    # writers never compute the same one.
+    list(Playlist.objects.select_for_update().filter(pk=playlist.pk).values_list("pk"))
+
+
+def _gap(playlist, after, moving):
+    """The ranks on either side of the slot right after item ``after``, ignoring ``moving``."""
+    others = PlaylistItem.objects.filter(playlist=playlist).exclude(pk__in=moving)
+    if after is AT_END:
+        return others.order_by("-rank").values_list("rank", flat=True).first(), None
+    low = None
+    if after is not None:
+        if after in moving:
+            raise ValidationError({"after": "Items can't be placed after one of themselves."})
+        low = PlaylistItem.objects.filter(playlist=playlist, pk=after).values_list("rank", flat=True).first()
+        if low is None:
+            raise ValidationError({"after": "Not an item of this playlist."})
+    high = others.filter(rank__gt=low or "").order_by("rank").values_list("rank", flat=True).first()
+    return low, high
+
+
+def _respread(playlist):
+    items = list(PlaylistItem.objects.filter(playlist=playlist).only("pk", "rank"))
+    for item, rank in zip(items, ranks_between(None, None, len(items))):
+        item.rank = rank
+    PlaylistItem.objects.bulk_update(items, ["rank"])
+    _log(playlist, [item.pk for item in items])
+
+
+def allocate_ranks(playlist, count, after=AT_END, moving=()):
+    """``count`` ascending ranks for the slot after item ``after`` (None: the start)."""
+    ranks = ranks_between(*_gap(playlist, after, moving), count)
+    if any(len(rank) > MAX_RANK_LENGTH for rank in ranks):
+        _respread(playlist)
+        ranks = ranks_between(*_gap(playlist, after, moving), count)
+    return ranks
+
+
+def _log(playlist, item_ids, deleted=False):
+    # Batch writes skip the model signals; log the changes for sync here.
+    record_library_changes(
+        (playlist.user_id, LibraryChange.Kind.PLAYLIST_ITEM, item_id, deleted) for item_id in item_ids
+    )
+
+
+# --- Aggregates ---
+
+def refresh_aggregates(playlists, touch=True):
+    """
+    Recompute the denormalized item_count, total_duration and
+    cover_thumbnail of the ``playlists`` ids in one UPDATE, and with
+    ``touch`` their last_modified. Call it in the same transaction as the
+    item writes.
+    """
+    items = PlaylistItem.objects.filter(playlist=OuterRef("pk")).order_by().values("playlist")
+    covers = (
+        PlaylistItem.objects.filter(playlist=OuterRef("pk"), online_track__thumbnail__gt="")
+        .order_by("rank", "id")
+        .values("online_track__thumbnail")[:1]
+    )
+    fields = {
+        "item_count": Coalesce(Subquery(items.annotate(n=Count("pk")).values("n")), 0),
+        "total_duration": Coalesce(
+            Subquery(items.annotate(total=Sum("track__duration")).values("total")),
+            Value(timedelta(0), output_field=DurationField()),
+        ),
+        "cover_thumbnail": Subquery(covers),
+    }
+    if touch:
+        fields["last_modified"] = Now()
+    Playlist.objects.filter(pk__in=playlists).update(**fields)
+    forget_fragments(Playlist, playlists)
+
+
+# --- Batch operations ---
+# Each runs in one transaction with a fixed number of queries, however
+# many items it touches.
+
+def add_items(playlist, entries, after=AT_END):
+    """
+    Insert ``entries`` (``{"track": id}`` or ``{"online_track": id}``) in
+    order after item ``after``. Tracks already in the playlist are skipped.
+    Returns the new items.
+    """
+    track_ids = [entry["track"] for entry in entries if entry.get("track")]
+    online_ids = [entry["online_track"] for entry in entries if entry.get("online_track")]
+    with transaction.atomic():
+        lock_playlist(playlist)
+        found_tracks = set(Track.objects.filter(pk__in=track_ids).values_list("pk", flat=True))
+        found_online = set(
+            onlineTrack.objects.filter(pk__in=online_ids, user=playlist.user_id).values_list("pk", flat=True)
+        )
+        missing = {
+            "track": sorted(set(track_ids) - found_tracks),
+            "online_track": sorted(set(online_ids) - found_online),
+        }
+        if any(missing.values()):
+            raise ValidationError({f"unknown_{kind}s": ids for kind, ids in missing.items() if ids})
+
+        seen = set(
+            PlaylistItem.objects.filter(playlist=playlist)
+            .filter(Q(track__in=track_ids) | Q(online_track__in=online_ids))
+            .values_list("track_id", "online_track_id")
+        )
+        new = []
+        for entry in entries:
+            key = (entry.get("track"), entry.get("online_track"))
+            if key not in seen:
+                seen.add(key)
+                new.append(key)
+
+        ranks = allocate_ranks(playlist, len(new), after)
+        items = PlaylistItem.objects.bulk_create([
+            PlaylistItem(playlist=playlist, track_id=track_id, online_track_id=online_track_id, rank=rank)
+            for (track_id, online_track_id), rank in zip(new, ranks)
+        ])
+        _log(playlist, [item.pk for item in items])
+        refresh_aggregates([playlist.pk])
+    return items
+
+
+def remove_items(playlist, item_ids):
+    """Delete the given items of ``playlist``; returns the ids actually removed."""
+    table = connection.ops.quote_name(PlaylistItem._meta.db_table)
+    with transaction.atomic():
+        lock_playlist(playlist)
+        # Nothing references playlist items, so one DELETE does it.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE playlist_id = %s AND id = ANY(%s) RETURNING id",
+                [playlist.pk, list(item_ids)],
+            )
+            removed = [row[0] for row in cursor.fetchall()]
+        _log(playlist, removed, deleted=True)
+        refresh_aggregates([playlist.pk])
+    return removed
+
+
+def move_items(playlist, item_ids, after=AT_END):
+    """
+    Move the given items, in the given order, to right after item
+    ``after``. Only the moved items get new ranks. Returns them in order.
+    """
+    item_ids = list(dict.fromkeys(item_ids))
+    with transaction.atomic():
+        lock_playlist(playlist)
+        items = (
+            PlaylistItem.objects.filter(playlist=playlist, pk__in=item_ids)
+            .only("pk", "rank", "track", "online_track")
+            .in_bulk()
+        )
+        missing = [pk for pk in item_ids if pk not in items]
+        if missing:
+            raise ValidationError({"items": f"Not items of this playlist: {', '.join(map(str, missing))}"})
+
+        moved = [items[pk] for pk in item_ids]
+        for item, rank in zip(moved, allocate_ranks(playlist, len(moved), after, moving=item_ids)):
+            item.rank = rank
+        PlaylistItem.objects.bulk_update(moved, ["rank"])
+        _log(playlist, item_ids)
+        # The first online track, and so the cover, may have changed.
+        refresh_aggregates([playlist.pk])
+    return moved
+
+
+def item_rows(items):
+    return [
+        {"id": item.pk, "track": item.track_id, "online_track": item.online_track_id, "rank": item.rank}
+        for item in items
+    ]
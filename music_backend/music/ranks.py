@@ -0,0 +1,54 @@
+"""
+Fractional rank keys for ordered lists.
+
+A rank is a string of base-62 digits read as a fraction after the point
+("V" is 31/62, "0V" is 31/62**2), compared byte-wise. There is a rank
+between any two, so an item moves or is inserted by writing one key and
+nothing else is renumbered. Ranks never end in "0", which keeps every
+value's spelling unique.
+"""
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def rank_between(before, after):
+    """
+    A rank strictly between ``before`` and ``after``; None (or "") for
+    ``before`` means the start of the list and None for ``after`` its end.
+    """
+    before = before or ""
+    if after is not None and not before < after:
+        raise ValueError(f"No rank between {before!r} and {after!r}")
+    return _midpoint(before, after)
+
+
+def _midpoint(a, b):
+    if b is not None:
+        # Skip the shared prefix ("" pads as zeros on a's side).
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    low = DIGITS.index(a[0]) if a else 0
+    high = DIGITS.index(b[0]) if b is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    # Adjacent first digits: b's first digit alone fits if b goes on;
+    # otherwise keep a's digit and split the remainder.
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[low] + _midpoint(a[1:], None)
+
+
+def ranks_between(before, after, count):
+    """
+    ``count`` ascending ranks between ``before`` and ``after``, spread by
+    bisection so their length grows only with log(count).
+    """
+    if count <= 0:
+        return []
+    middle = count // 2
+    rank = rank_between(before, after)
+    return ranks_between(before, rank, middle) + [rank] + ranks_between(rank, after, count - middle - 1)
@@ -0,0 +1,90 @@
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Genre, Tag
+
+
+class ReferenceTable:
+    """
+    Read-through cache of a small reference table (genres, tags): a
+    name -> id map for resolving names in batch, and the whole table
+    pre-serialized as JSON bytes for its list endpoint. Only for tables
+    that stay small and rarely change: any write reloads the whole table.
+
+    Entries are keyed on a version token kept in the shared cache and
+    replaced on every write (music.signals), so workers never serve a
+    table older than the last write they can see. Each process also keeps
+    the current version in memory; a read costs one shared-cache lookup
+    (the token) until the table changes.
+    """
+
+    def __init__(self, model, name_field):
+        self.model = model
+        self.name_field = name_field
+        self.label = model._meta.label_lower
+        self._local = (None, None)
+
+    @property
+    def _version_key(self):
+        return f"reference:{self.label}:version"
+
+    def version(self):
+        token = cache.get(self._version_key)
+        if token is None:
+            cache.add(self._version_key, uuid.uuid4().hex, None)
+            token = cache.get(self._version_key)
+        return token
+
+    def load(self):
+        """``(version, entry)``, where entry has the ``ids`` map and the JSON ``body``."""
+        version = self.version()
+        local_version, entry = self._local
+        if local_version == version:
+            return version, entry
+
+        key = f"reference:{self.label}:{version}"
+        entry = cache.get(key)
+        if entry is None:
+            fields = [field.name for field in self.model._meta.concrete_fields]
+            rows = list(self.model.objects.order_by("pk").values(*fields))
+            ids = {}
+            for row in rows:
+                ids.setdefault(row[self.name_field], row["id"])
+            body = json.dumps(rows, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+            entry = {"ids": ids, "body": body}
+            cache.set(key, entry, getattr(settings, "REFERENCE_CACHE_TIMEOUT", 60 * 60))
+        self._local = (version, entry)
+        return version, entry
+
+    def resolve(self, names):
+        """Map the known ``names`` to primary keys; unknown ones are left out."""
+        ids = self.load()[1]["ids"]
+        return {name: ids[name] for name in names if name in ids}
+
+    def invalidate(self):
+        # A new token now, and again on commit in case a reader cached the
+        # table as it was before this transaction meanwhile.
+        def bump():
+            cache.set(self._version_key, uuid.uuid4().hex, None)
+
+        bump()
+        transaction.on_commit(bump)
+
+
+TABLES = {
+    Genre: ReferenceTable(Genre, "name"),
+    Tag: ReferenceTable(Tag, "name"),
+}
+
+
+def reference_table(model):
+    return TABLES[model]
+
+
+def resolve_names(model, names):
+    return TABLES[model].resolve(names)
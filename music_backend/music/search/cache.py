@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    # "  Daft  PUNK " and "daft punk" are the same search.
+    return " ".join(query.casefold().split())
+
+
+def get_ttl(provider):
+    ttls = getattr(settings, "SEARCH_CACHE_TTL", {})
+    return ttls.get(provider, ttls.get("default", 300))
+
+
+def get_stale_ttl():
+    return getattr(settings, "SEARCH_CACHE_STALE_TTL", 600)
+
+
+class SearchCache:
+    """
+    Two-tier cache of provider results keyed on (provider, normalized query).
+
+    The first tier is a bounded LRU in process memory. The optional second
+    tier is a Django cache backend (``SEARCH_CACHE_BACKEND``) shared between
+    workers. An entry is fresh for the provider's TTL, then served stale for
+    ``SEARCH_CACHE_STALE_TTL`` more seconds while a background refresh runs.
+    """
+
+    def __init__(self, max_entries=None, backend=None):
+        if max_entries is None:
+            max_entries = getattr(settings, "SEARCH_CACHE_MAX_ENTRIES", 10000)
+        if backend is None:
+            backend = getattr(settings, "SEARCH_CACHE_BACKEND", None)
+
+        self.max_entries = max_entries
+        self.backend = caches[backend] if backend else None
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = Lock()
+        self._counters = dict.fromkeys(
+            ["hits", "stale_hits", "backend_hits", "misses", "evictions", "refreshes"], 0
+        )
+
+    def _key(self, provider, query):
+        return provider, normalize_query(query)
+
+    def _backend_key(self, key):
+        provider, query = key
+        return f"song-search:{provider}:{hashlib.sha1(query.encode()).hexdigest()}"
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _get_backend(self, key):
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(self._backend_key(key))
+        except Exception:
+            # A broken shared cache must not take search down with it.
+            logger.exception("Search cache backend read failed")
+            return None
+
+    def _set_backend(self, key, entry):
+        if self.backend is None:
+            return
+        timeout = max(entry[2] - time.time(), 1)
+        try:
+            self.backend.set(self._backend_key(key), entry, timeout)
+        except Exception:
+            logger.exception("Search cache backend write failed")
+
+    def get(self, provider, query):
+        """
+        Return ``(results, is_fresh)`` for a cached entry, or None on a miss.
+        """
+        key = self._key(provider, query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] <= now:
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+
+        if entry is None:
+            entry = self._get_backend(key)
+            if entry is None or entry[2] <= now:
+                self._count("misses")
+                return None
+            self._count("backend_hits")
+            self._store_local(key, entry)
+
+        results, fresh_until, _ = entry
+        if fresh_until > now:
+            self._count("hits")
+            return results, True
+        self._count("stale_hits")
+        return results, False
+
+    def set(self, provider, query, results):
+        key = self._key(provider, query)
+        fresh_until = time.time() + get_ttl(provider)
+        entry = (results, fresh_until, fresh_until + get_stale_ttl())
+        self._store_local(key, entry)
+        self._set_backend(key, entry)
+
+    def revalidate(self, provider, query, search, executor):
+        """
+        Refresh a stale entry in the background. Concurrent requests for the
+        same stale key share a single upstream call.
+        """
+        key = self._key(provider, query)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._counters["refreshes"] += 1
+
+        def refresh():
+            try:
+                self.set(provider, query, search(query))
+            except Exception:
+                logger.exception("Background refresh of %s search failed", provider)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        executor.submit(refresh)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for counter in self._counters:
+                self._counters[counter] = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "backend": getattr(settings, "SEARCH_CACHE_BACKEND", None),
+                **self._counters,
+            }
+
+
+_search_cache = None
+_search_cache_lock = Lock()
+
+
+def get_search_cache():
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache()
+    return _search_cache
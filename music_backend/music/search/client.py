@@ -0,0 +1,197 @@
+import asyncio
+import random
+import weakref
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ProviderClient:
+    """
+    Shared HTTP client for search providers.
+
+    Keeps one keep-alive ``requests.Session`` per provider host, so repeated
+    searches reuse pooled TCP/TLS connections instead of handshaking every
+    time. Requests always carry connect/read timeouts, and 429/5xx answers
+    and connection failures are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, pool_size=None, timeout=None, retries=None, backoff_factor=None, backoff_jitter=None):
+        if pool_size is None:
+            pool_size = getattr(settings, "SEARCH_HTTP_POOL_SIZE", 16)
+        if timeout is None:
+            timeout = getattr(settings, "SEARCH_HTTP_TIMEOUT", (2.0, 3.0))
+        if retries is None:
+            retries = getattr(settings, "SEARCH_HTTP_RETRIES", 2)
+        if backoff_factor is None:
+            backoff_factor = getattr(settings, "SEARCH_HTTP_BACKOFF", 0.2)
+        if backoff_jitter is None:
+            backoff_jitter = getattr(settings, "SEARCH_HTTP_BACKOFF_JITTER", 0.2)
+
+        self.pool_size = pool_size
+        self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self._sessions = {}
+        self._lock = Lock()
+
+    def _retry(self):
+        return Retry(
+            total=self.retries,
+            # A read timeout means the provider is hung; retrying it would
+            # only pin the worker for longer.
+            read=False,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            backoff_max=2,
+            # Provider deadlines are a few seconds; honouring a long
+            # Retry-After would outlive the request that asked.
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+
+    def session_for(self, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=self._retry(),
+                )
+                session = requests.Session()
+                session.mount(host, adapter)
+                self._sessions[host] = session
+        return session
+
+    def get(self, url, params=None, **kwargs):
+        """
+        GET ``url`` through the pooled session for its host. Raises
+        ``requests.RequestException`` on timeouts, connection errors and any
+        non-2xx status left after retries.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session_for(url).get(url, params=params, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_client = None
+_client_lock = Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ProviderClient()
+    return _client
+
+
+class AsyncProviderClient:
+    """
+    ProviderClient for the async views (needs httpx): one pooled
+    ``httpx.AsyncClient`` per event loop, the same timeouts, and the same
+    retries of 429/5xx answers and connection failures with jittered
+    exponential backoff. Waiting on a provider costs a coroutine, not a
+    thread, so SEARCH_ASYNC_MAX_CONNECTIONS searches can be in flight at
+    once per process.
+    """
+
+    def __init__(self, max_connections=None, timeout=None, retries=None, backoff_factor=None, backoff_jitter=None):
+        if httpx is None:
+            raise ImproperlyConfigured("AsyncProviderClient needs the httpx package.")
+        if max_connections is None:
+            max_connections = getattr(settings, "SEARCH_ASYNC_MAX_CONNECTIONS", 512)
+        if timeout is None:
+            timeout = getattr(settings, "SEARCH_HTTP_TIMEOUT", (2.0, 3.0))
+        if retries is None:
+            retries = getattr(settings, "SEARCH_HTTP_RETRIES", 2)
+        if backoff_factor is None:
+            backoff_factor = getattr(settings, "SEARCH_HTTP_BACKOFF", 0.2)
+        if backoff_jitter is None:
+            backoff_jitter = getattr(settings, "SEARCH_HTTP_BACKOFF_JITTER", 0.2)
+
+        connect, read = timeout if isinstance(timeout, (list, tuple)) else (timeout, timeout)
+        self.max_connections = max_connections
+        self.timeout = httpx.Timeout(read, connect=connect)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        # Connections belong to the loop that opened them.
+        self._clients = weakref.WeakKeyDictionary()
+
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+            self._clients[loop] = client
+        return client
+
+    def _backoff(self, attempt):
+        delay = self.backoff_factor * 2 ** attempt + random.uniform(0, self.backoff_jitter)
+        return min(delay, 2)
+
+    async def get(self, url, params=None, **kwargs):
+        """
+        GET ``url``. Raises ``httpx.HTTPError`` on timeouts, connection
+        errors and any non-2xx status left after retries.
+        """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self.client().get(url, params=params, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # As in ProviderClient, read timeouts aren't retried.
+                if last:
+                    raise
+            else:
+                if last or response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+_async_client = None
+
+
+def get_async_client():
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncProviderClient()
+    return _async_client
@@ -0,0 +1,250 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+
+from .cache import get_search_cache
+from .providers import SearchProvider, get_providers
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_pool_size():
+    # Every search calls each provider once, so SEARCH_CONCURRENT_SEARCHES
+    # searches need a thread per provider each for their calls to start
+    # right away, not part way into their deadlines.
+    return getattr(settings, "SEARCH_CONCURRENT_SEARCHES", 8) * max(len(get_providers()), 1)
+
+
+def get_executor():
+    # One bounded pool shared by every search request, so a traffic spike
+    # queues provider calls instead of spawning unbounded threads.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_pool_size(),
+                thread_name_prefix="song-search",
+            )
+    return _executor
+
+
+def get_deadline(name):
+    deadlines = getattr(settings, "SEARCH_PROVIDER_DEADLINES", {})
+    return deadlines.get(name, getattr(settings, "SEARCH_DEFAULT_DEADLINE", 3.0))
+
+
+def _elapsed_ms(started):
+    return round((time.monotonic() - started) * 1000)
+
+
+def _timed_call(search, query, started, cache, name):
+    results = search(query)
+    # Cached even when the provider already missed its deadline, so the
+    # next request for this query gets it for free.
+    cache.set(name, query, results)
+    return results, _elapsed_ms(started)
+
+
+def iter_fan_out(query, providers=None, cache=None):
+    """
+    Run every provider concurrently and yield ``(name, results, status)``
+    as soon as each one finishes, fails or misses its deadline.
+    ``providers`` maps names to callables taking the query; it defaults to
+    the enabled :class:`~music.search.providers.SearchProvider` instances.
+
+    Deadlines are measured from the moment the fan-out starts, so the whole
+    call never takes longer than the largest provider deadline; the pool
+    is sized (see get_pool_size) so calls don't queue at the expected
+    load. Cached
+    results are yielded first without touching the pool; stale ones are
+    refreshed in the background.
+    """
+    providers = get_providers() if providers is None else providers
+    cache = get_search_cache() if cache is None else cache
+    executor = get_executor()
+    started = time.monotonic()
+
+    pending = {}
+    for name, search in providers.items():
+        cached = cache.get(name, query)
+        if cached is not None:
+            results, is_fresh = cached
+            if not is_fresh:
+                cache.revalidate(name, query, search, executor)
+            yield name, results, {
+                "status": "ok", "count": len(results), "elapsed_ms": _elapsed_ms(started),
+                "cache": "hit" if is_fresh else "stale",
+            }
+            continue
+
+        future = executor.submit(_timed_call, search, query, started, cache, name)
+        pending[future] = (name, started + get_deadline(name))
+
+    while pending:
+        next_deadline = min(deadline for _, deadline in pending.values())
+        done, _ = wait(
+            pending,
+            timeout=max(next_deadline - time.monotonic(), 0),
+            return_when=FIRST_COMPLETED,
+        )
+
+        for future in done:
+            name, _ = pending.pop(future)
+            try:
+                results, elapsed_ms = future.result()
+            except Exception as e:
+                yield name, [], {"status": "error", "error": str(e), "elapsed_ms": _elapsed_ms(started)}
+            else:
+                yield name, results, {"status": "ok", "count": len(results), "elapsed_ms": elapsed_ms, "cache": "miss"}
+
+        now = time.monotonic()
+        for future, (name, deadline) in list(pending.items()):
+            if deadline <= now:
+                # The worker keeps running until the HTTP call returns, but
+                # nobody waits for it any more.
+                del pending[future]
+                future.cancel()
+                yield name, [], {"status": "timeout", "elapsed_ms": _elapsed_ms(started)}
+
+
+def fan_out(query, providers=None, cache=None):
+    """
+    Collect :func:`iter_fan_out` into ``(results, status)``: the results of
+    every provider that answered in time, in provider order, and a status
+    block keyed by provider name.
+    """
+    providers = get_providers() if providers is None else providers
+    by_provider = {}
+    status = {}
+    for name, results, provider_status in iter_fan_out(query, providers, cache):
+        by_provider[name] = results
+        status[name] = provider_status
+
+    results = []
+    for name in providers:
+        results += by_provider.get(name, [])
+    return results, status
+
+
+# --- Async fan-out ---
+# The same contract for the async views: provider calls are coroutines on
+# the request's event loop instead of jobs on the thread pool, so a
+# process can have thousands in flight. Both cache tiers are called as
+# they are; they answer from memory or a shared cache in about a
+# millisecond.
+
+# Searches still running after their fan-out is over. The event loop
+# only holds tasks weakly.
+_late_tasks = set()
+
+
+def _async_search(search):
+    # Providers search natively; other callables run in a thread.
+    if isinstance(search, SearchProvider):
+        return search.acall
+    if inspect.iscoroutinefunction(search):
+        return search
+    return sync_to_async(search, thread_sensitive=False)
+
+
+def _sync_search(search):
+    # Stale entries are refreshed on the thread pool, as in iter_fan_out.
+    return async_to_sync(search) if inspect.iscoroutinefunction(search) else search
+
+
+async def _atimed_call(search, query, started, cache, name):
+    results = await search(query)
+    cache.set(name, query, results)
+    return results, _elapsed_ms(started)
+
+
+def _forget_late_task(task):
+    _late_tasks.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+def _let_finish(task):
+    _late_tasks.add(task)
+    task.add_done_callback(_forget_late_task)
+
+
+async def aiter_fan_out(query, providers=None, cache=None):
+    """
+    Async :func:`iter_fan_out`: yields ``(name, results, status)`` as each
+    provider finishes, fails or misses its deadline. ``providers`` may map
+    names to provider instances, coroutine functions or plain callables.
+    """
+    providers = get_providers() if providers is None else providers
+    cache = get_search_cache() if cache is None else cache
+    started = time.monotonic()
+
+    pending = {}
+    try:
+        for name, search in providers.items():
+            cached = cache.get(name, query)
+            if cached is not None:
+                results, is_fresh = cached
+                if not is_fresh:
+                    cache.revalidate(name, query, _sync_search(search), get_executor())
+                yield name, results, {
+                    "status": "ok", "count": len(results), "elapsed_ms": _elapsed_ms(started),
+                    "cache": "hit" if is_fresh else "stale",
+                }
+                continue
+
+            task = asyncio.ensure_future(_atimed_call(_async_search(search), query, started, cache, name))
+            pending[task] = (name, started + get_deadline(name))
+
+        while pending:
+            next_deadline = min(deadline for _, deadline in pending.values())
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            for task in done:
+                name, _ = pending.pop(task)
+                try:
+                    results, elapsed_ms = task.result()
+                except Exception as e:
+                    yield name, [], {"status": "error", "error": str(e), "elapsed_ms": _elapsed_ms(started)}
+                else:
+                    yield name, results, {
+                        "status": "ok", "count": len(results), "elapsed_ms": elapsed_ms, "cache": "miss",
+                    }
+
+            now = time.monotonic()
+            for task, (name, deadline) in list(pending.items()):
+                if deadline <= now:
+                    del pending[task]
+                    _let_finish(task)
+                    yield name, [], {"status": "timeout", "elapsed_ms": _elapsed_ms(started)}
+    finally:
+        # Searches nobody waits for any more (missed deadlines, a client
+        # that went away) are left running so their results still reach
+        # the cache; their HTTP timeouts bound how long.
+        for task in pending:
+            _let_finish(task)
+
+
+async def afan_out(query, providers=None, cache=None):
+    """Async :func:`fan_out`: ``(results, status)`` in provider order."""
+    providers = get_providers() if providers is None else providers
+    by_provider = {}
+    status = {}
+    async for name, results, provider_status in aiter_fan_out(query, providers, cache):
+        by_provider[name] = results
+        status[name] = provider_status
+
+    results = []
+    for name in providers:
+        results += by_provider.get(name, [])
+    return results, status
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import F, OuterRef, Q, Subquery
+
+from ..models import Album, Artist
+
+
+def get_config():
+    return getattr(settings, "LIBRARY_SEARCH_CONFIG", "simple")
+
+
+def _label_names(m2m_field):
+    # Space-separated names of a track's genres or tags, as a correlated
+    # subquery so the vector can be rebuilt in a single UPDATE.
+    through = m2m_field.remote_field.through
+    owner = m2m_field.m2m_field_name()
+    label = m2m_field.m2m_reverse_field_name()
+    return Subquery(
+        through.objects.filter(**{owner: OuterRef("pk")})
+        .values(owner)
+        .annotate(names=StringAgg(f"{label}__name", delimiter=" "))
+        .values("names")[:1]
+    )
+
+
+def search_vector_for(model):
+    """
+    Weighted tsvector over the title (A), artist name (B), album title (C)
+    and genre/tag names (D) of ``model`` rows (Track or onlineTrack).
+    """
+    config = get_config()
+    artist = Subquery(Artist.objects.filter(pk=OuterRef("artist_id")).values("name")[:1])
+    album = Subquery(Album.objects.filter(pk=OuterRef("album_id")).values("title")[:1])
+    genres = _label_names(model._meta.get_field("genres"))
+    tags = _label_names(model._meta.get_field("tags"))
+    return (
+        SearchVector("title", weight="A", config=config)
+        + SearchVector(artist, weight="B", config=config)
+        + SearchVector(album, weight="C", config=config)
+        + SearchVector(genres, tags, weight="D", config=config)
+    )
+
+
+def update_search_vectors(model, pks=None):
+    """
+    Recompute ``search_vector`` for the given primary keys (a list or a
+    queryset of pks), or for every row when ``pks`` is None.
+    """
+    queryset = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return queryset.update(search_vector=search_vector_for(model))
+
+
+def search_library(queryset, text):
+    """
+    Filter ``queryset`` to rows matching ``text`` and order them by rank.
+
+    Matches come from the GIN-indexed ``search_vector`` (websearch syntax:
+    quotes, ``or``, ``-word``), plus trigram similarity on the title so that
+    typos still find the song when LIBRARY_SEARCH_TRIGRAM is on.
+    """
+    query = SearchQuery(text, search_type="websearch", config=get_config())
+    condition = Q(search_vector=query)
+    rank = SearchRank(F("search_vector"), query)
+
+    if getattr(settings, "LIBRARY_SEARCH_TRIGRAM", True):
+        condition |= Q(title__trigram_similar=text)
+        rank = rank + TrigramSimilarity("title", text)
+
+    return queryset.annotate(rank=rank).filter(condition).order_by("-rank", "-pk")
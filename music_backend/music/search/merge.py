@@ -0,0 +1,119 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Bracketed decorations that say nothing about which song it is, e.g.
+# "(Official Video)", "[Lyrics]", "(HD Audio)". "Live" and "Remix" are left
+# alone: those are different recordings.
+NOISE_RE = re.compile(
+    r"[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|explicit|clean|mv)\b[^\)\]]*[\)\]]",
+    re.IGNORECASE,
+)
+FEATURING_RE = re.compile(r"[\(\[]?\s*\b(feat|ft|featuring)\b\.?.*$", re.IGNORECASE)
+ARTIST_NOISE_RE = re.compile(r"(vevo|\s-\s*topic|\bofficial\b)\s*$", re.IGNORECASE)
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize_text(text):
+    """
+    Lowercase, strip accents and punctuation, and collapse whitespace:
+    "Beyoncé - Halo!" -> "beyonce halo".
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(NON_WORD_RE.sub(" ", text.casefold()).split())
+
+
+def normalize_title(title):
+    title = NOISE_RE.sub(" ", title or "")
+    return normalize_text(FEATURING_RE.sub(" ", title))
+
+
+def normalize_artist(artist):
+    return normalize_text(ARTIST_NOISE_RE.sub("", (artist or "").strip()))
+
+
+def fingerprint(result):
+    """
+    Order-insensitive key over the title and artist tokens. YouTube's
+    "Adele - Hello (Official Video)" by "AdeleVEVO" and Jamendo's "Hello" by
+    "Adele" both become "adele hello", so clustering is a single dict lookup
+    per result instead of comparing every pair.
+    """
+    tokens = set(normalize_title(result.get("title")).split())
+    tokens.update(normalize_artist(result.get("artist")).split())
+    return " ".join(sorted(tokens))
+
+
+def get_source_weight(source):
+    weights = getattr(settings, "SEARCH_SOURCE_WEIGHTS", {})
+    return weights.get(source, 1.0)
+
+
+def default_score(cluster, query_tokens):
+    """
+    Rank a cluster by how much of the query it matches, how trusted its best
+    source is, how many providers returned it and how high they ranked it.
+    """
+    best = cluster["members"][0]
+    key_tokens = set(cluster["key"].split())
+    match = len(query_tokens & key_tokens) / len(query_tokens) if query_tokens else 0
+    return (
+        2 * match
+        + get_source_weight(best["result"].get("source"))
+        + 0.5 * (len(cluster["members"]) - 1)
+        + 1 / (1 + min(member["position"] for member in cluster["members"]))
+    )
+
+
+def get_score_function():
+    path = getattr(settings, "SEARCH_RANKING_FUNCTION", None)
+    return import_string(path) if path else default_score
+
+
+def merge_results(results, query, score=None):
+    """
+    Collapse near-duplicate results from different providers and return one
+    entry per song, best first.
+
+    Each entry is the result from the highest weighted source, with the other
+    copies listed under ``alternates`` as ``{"source", "stream_url"}``.
+    ``score(cluster, query_tokens)`` defaults to ``SEARCH_RANKING_FUNCTION``.
+    """
+    score = score or get_score_function()
+    query_tokens = set(normalize_text(query).split())
+
+    clusters = {}
+    positions = {}
+    for result in results:
+        source = result.get("source")
+        position = positions.get(source, 0)
+        positions[source] = position + 1
+
+        key = fingerprint(result) or result.get("stream_url") or ""
+        # A result with neither a title nor a stream URL can't be matched
+        # to anything: it stays a cluster of its own.
+        cluster = clusters.setdefault(key or ("unkeyed", id(result)), {"key": key, "members": []})
+        cluster["members"].append({"result": result, "position": position})
+
+    for cluster in clusters.values():
+        cluster["members"].sort(
+            key=lambda member: (-get_source_weight(member["result"].get("source")), member["position"])
+        )
+
+    ranked = sorted(clusters.values(), key=lambda cluster: score(cluster, query_tokens), reverse=True)
+
+    merged = []
+    for cluster in ranked:
+        best, *others = cluster["members"]
+        entry = dict(best["result"])
+        if others:
+            entry["alternates"] = [
+                {"source": member["result"].get("source"), "stream_url": member["result"].get("stream_url")}
+                for member in others
+            ]
+        merged.append(entry)
+    return merged
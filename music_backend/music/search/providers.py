@@ -0,0 +1,206 @@
+import os
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from dotenv import load_dotenv
+
+from .client import get_async_client, get_client
+
+load_dotenv()
+
+
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+JAMENDO_CLIENT_ID = os.getenv("JAMENDO_CLIENT_ID")
+MIXCLOUD_CLIENT_ID = os.getenv("MIXCLOUD_CLIENT_ID")
+
+
+class SearchProvider:
+    """
+    Base class for song search sources.
+
+    Subclasses set ``name`` and ``url`` and implement ``params``, the query
+    string for a search, and ``parse``, which turns the JSON answer into a
+    list of result dicts with ``title``, ``artist``, ``stream_url``,
+    ``thumbnail`` and ``source`` keys. ``search`` and its async twin
+    ``asearch`` run them over the sync or async HTTP client. A provider can
+    override ``search`` instead; ``asearch`` then runs it in a thread.
+    Providers are enabled by listing their dotted path in
+    ``settings.SEARCH_PROVIDERS``.
+
+    Calling a provider instance (or awaiting ``acall``) runs a search with
+    the configured limit, which is what the fan-out does.
+    """
+    name = None
+    url = None
+
+    def params(self, query, limit):
+        raise NotImplementedError
+
+    def parse(self, data, limit):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        return self.parse(self.get(self.params(query, limit)), limit)
+
+    async def asearch(self, query, limit):
+        if type(self).search is not SearchProvider.search:
+            return await sync_to_async(self.search, thread_sensitive=False)(query, limit)
+        return self.parse(await self.aget(self.params(query, limit)), limit)
+
+    def get_limit(self):
+        return getattr(settings, "SEARCH_PROVIDER_LIMIT", 5)
+
+    def get(self, params):
+        # Raises on timeouts and non-2xx answers so the fan-out reports the
+        # provider as failed instead of caching an empty result.
+        return get_client().get(self.url, params=params).json()
+
+    async def aget(self, params):
+        return (await get_async_client().get(self.url, params=params)).json()
+
+    def __call__(self, query):
+        return self.search(query, self.get_limit())
+
+    async def acall(self, query):
+        return await self.asearch(query, self.get_limit())
+
+
+class YouTubeProvider(SearchProvider):
+    name = "youtube"
+    url = "https://www.googleapis.com/youtube/v3/search"
+
+    def params(self, query, limit):
+        return {
+            "part": "snippet",
+            "q": query,
+            "key": YOUTUBE_API_KEY,
+            "maxResults": limit,
+            "type": "video"
+        }
+
+    def parse(self, data, limit):
+        results = []
+
+        for item in data.get("items", []):
+            video_id = item["id"]["videoId"]
+            snippet = item["snippet"]
+            results.append({
+                "title": snippet["title"],
+                "artist": snippet.get("channelTitle", ""),
+                "stream_url": f"https://www.youtube.com/watch?v={video_id}",
+                "thumbnail": snippet["thumbnails"]["default"]["url"],
+                "source": "youtube"
+            })
+
+        return results
+
+
+class JamendoProvider(SearchProvider):
+    name = "jamendo"
+    url = "https://api.jamendo.com/v3.0/tracks"
+
+    def params(self, query, limit):
+        return {
+            "client_id": JAMENDO_CLIENT_ID,
+            "format": "json",
+            "limit": limit,
+            "search": query,
+            "audioformat": "mp31"
+        }
+
+    def parse(self, data, limit):
+        results = []
+
+        for track in data.get("results", []):
+            results.append({
+                "title": track["name"],
+                "artist": track["artist_name"],
+                "stream_url": track["audio"],
+                "thumbnail": track["album_image"],
+                "source": "jamendo"
+            })
+
+        return results
+
+
+class MixcloudProvider(SearchProvider):
+    name = "mixcloud"
+    url = "https://api.mixcloud.com/search/"
+
+    def params(self, query, limit):
+        return {
+            "q": query,
+            "type": "cloudcast",
+            "limit": limit
+        }
+
+    def parse(self, data, limit):
+        results = []
+
+        for item in data.get("data", [])[:limit]:
+            results.append({
+                "title": item["name"],
+                "artist": item["user"]["name"],
+                "stream_url": item["url"],
+                "thumbnail": item["pictures"]["thumbnail"],
+                "source": "mixcloud"
+            })
+
+        return results
+
+
+class AudiusProvider(SearchProvider):
+    name = "audius"
+    url = "https://api.audius.co/v1/tracks/search"
+
+    def params(self, query, limit):
+        return {
+            "query": query,
+            "app_name": "music-app"
+        }
+
+    def parse(self, data, limit):
+        results = []
+
+        for track in data.get("data", [])[:limit]:
+            # Construct streamable URL using `id`
+            track_id = track.get("id")
+            if not track_id:
+                continue  # skip if stream_url couldn't be built
+
+            results.append({
+                "title": track.get("title", "Unknown Title"),
+                "artist": track.get("user", {}).get("name", "Unknown Artist"),
+                "stream_url": f"https://api.audius.co/v1/tracks/{track_id}/stream",
+                "thumbnail": track.get("artwork", {}).get("150x150", ""),
+                "source": "audius"
+            })
+
+        return results
+
+
+DEFAULT_PROVIDERS = [
+    "music.search.providers.YouTubeProvider",
+    "music.search.providers.JamendoProvider",
+    "music.search.providers.MixcloudProvider",
+    "music.search.providers.AudiusProvider",
+]
+
+
+@lru_cache(maxsize=None)
+def _load_providers(paths):
+    providers = {}
+    for path in paths:
+        provider = import_string(path)()
+        providers[provider.name] = provider
+    return providers
+
+
+def get_providers():
+    """
+    Return the enabled providers as an ordered ``{name: provider}`` dict.
+    The order of ``SEARCH_PROVIDERS`` is the order results are returned in.
+    """
+    return _load_providers(tuple(getattr(settings, "SEARCH_PROVIDERS", DEFAULT_PROVIDERS)))
@@ -0,0 +1,53 @@
+import json
+
+from django.http import StreamingHttpResponse
+
+from .fanout import aiter_fan_out, iter_fan_out
+
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _format(stream_format, event, data):
+    if stream_format == "ndjson":
+        if event == "done":
+            data = {"done": True}
+        return json.dumps(data) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _events(query, stream_format):
+    for name, results, status in iter_fan_out(query):
+        yield _format(stream_format, "results", {"provider": name, "status": status, "results": results})
+    yield _format(stream_format, "done", {})
+
+
+async def _aevents(query, stream_format):
+    async for name, results, status in aiter_fan_out(query):
+        yield _format(stream_format, "results", {"provider": name, "status": status, "results": results})
+    yield _format(stream_format, "done", {})
+
+
+def _response(body, stream_format):
+    response = StreamingHttpResponse(body, content_type=STREAM_FORMATS[stream_format])
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream into a single response.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def stream_search(query, stream_format):
+    """
+    Stream each provider's results the moment they arrive, one NDJSON line
+    or SSE ``results`` event per provider, followed by a final done marker.
+    """
+    return _response(_events(query, stream_format), stream_format)
+
+
+def astream_search(query, stream_format):
+    # For the async views: an async body, which ASGI servers send as it is
+    # produced (a sync one would be read to the end first).
+    return _response(_aevents(query, stream_format), stream_format)
@@ -1,6 +1,11 @@
+import re
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Artist, Album, Track , onlineTrack , Genre, Tag, Playlist, PlaylistItem , FavoriteTrack
+from .models import Artist, Album, Track , onlineTrack , Genre, Tag, Playlist, PlaylistItem , FavoriteTrack, ChunkedUpload
+from .reference import resolve_names
 
 class ArtistSerializer(serializers.ModelSerializer):
     class Meta:
@@ -55,7 +60,9 @@ class TrackSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Track
-        fields = ['id', 'title', 'file', 'duration', 'artist', 'album', 'uploaded_by', 'genres', 'tags','audio_file','stream_url']
+        fields = ['id', 'title', 'file', 'duration', 'artist', 'album', 'uploaded_by', 'genres', 'tags','audio_file','stream_url',
+                  'bitrate', 'codec', 'analysis_status', 'analysis_error']
+        read_only_fields = ['bitrate', 'codec', 'analysis_status', 'analysis_error']
         extra_kwargs = {
             'title': {'required': False},
             'file': {'required': False},
@@ -74,14 +81,49 @@ class TrackSerializer(serializers.ModelSerializer):
 
 
 
+class CachedNamesField(ManyRelatedField):
+    """Resolves a whole list of names through the reference cache at once."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        model = child.queryset.model
+        names = [str(name) for name in data]
+        ids = resolve_names(model, names)
+        for name in names:
+            if name not in ids:
+                child.fail('does_not_exist', slug_name=child.slug_field, value=name)
+        # Stand-ins loaded "from the database" so relation managers accept them.
+        fields = [model._meta.pk.attname, child.slug_field]
+        return [model.from_db(child.queryset.db, fields, [ids[name], name]) for name in names]
+
+
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField for the cached reference tables (music.reference):
+    names resolve from the cache instead of one query each.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return CachedNamesField(**list_kwargs)
+
+
 class OnlineTrackSerializer(serializers.ModelSerializer):
-    genres = serializers.SlugRelatedField(
+    genres = CachedSlugRelatedField(
         many=True,
         slug_field='name',
         queryset=Genre.objects.all(),
         required=False
     )
-    tags = serializers.SlugRelatedField(
+    tags = CachedSlugRelatedField(
         many=True,
         slug_field='name',
         queryset=Tag.objects.all(),
@@ -113,9 +155,11 @@ class OnlineTrackSerializer(serializers.ModelSerializer):
         if artist_data:
             artist, _ = Artist.objects.get_or_create(name=artist_data)
 
+        # Albums need an artist and release date, so only existing ones are
+        # linked by title.
         album = None
         if album_data:
-            album, _ = Album.objects.get_or_create(name=album_data)
+            album = Album.objects.filter(title=album_data).order_by('pk').first()
 
         track = onlineTrack.objects.create(
             user=user,
@@ -125,21 +169,53 @@ class OnlineTrackSerializer(serializers.ModelSerializer):
         )
 
         # Handle ManyToMany fields after instance is created
-        for genre in genres_data:
-            track.genres.add(genre)
-
-        for tag in tags_data:
-            track.tags.add(tag)
+        track.genres.add(*genres_data)
+        track.tags.add(*tags_data)
 
         return track
 
 
 
 
+class OnlineTrackBulkItemSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    artist = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    album = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    stream_url = serializers.URLField(required=False, allow_null=True, max_length=200)
+    thumbnail = serializers.URLField(required=False, allow_null=True, max_length=200)
+    source = serializers.CharField(required=False, allow_null=True, max_length=255)
+    genres = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    tags = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+
+
+class OnlineTrackBulkSerializer(serializers.Serializer):
+    """
+    Validates a batch for onlineTrackViewSet.bulk. Genre and tag names are
+    checked against the reference cache once for the whole batch rather
+    than once per name per item.
+    """
+    tracks = OnlineTrackBulkItemSerializer(many=True, allow_empty=False)
+
+    max_items = 1000
+
+    def validate_tracks(self, tracks):
+        if len(tracks) > self.max_items:
+            raise serializers.ValidationError(f"At most {self.max_items} tracks per request.")
+
+        for model, field in ((Genre, 'genres'), (Tag, 'tags')):
+            names = {name for track in tracks for name in track.get(field, [])}
+            known = set(resolve_names(model, names))
+            unknown = sorted(names - known)
+            if unknown:
+                raise serializers.ValidationError({field: [f"Unknown {field}: {', '.join(unknown)}"]})
+        return tracks
+
+
 class PlaylistItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = PlaylistItem
-        fields = ['id', 'playlist', 'track', 'online_track']
+        fields = ['id', 'playlist', 'track', 'online_track', 'rank']
+        read_only_fields = ['rank']
 
 
     def validate(self, data):
@@ -160,13 +236,51 @@ class PlaylistItemSerializer(serializers.ModelSerializer):
             rep['online_track_detail'] = OnlineTrackSerializer(instance.online_track).data
         return rep
     
-class PlaylistSerializer(serializers.ModelSerializer):
-    items = PlaylistItemSerializer(many=True, read_only=True)
+class PlaylistEntrySerializer(serializers.Serializer):
+    track = serializers.IntegerField(required=False)
+    online_track = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if bool(data.get('track')) == bool(data.get('online_track')):
+            raise serializers.ValidationError("Specify exactly one of track or online_track.")
+        return data
+
+
+class PlaylistBatchSerializer(serializers.Serializer):
+    """
+    Validates a batch for the PlaylistViewSet add/remove/reorder actions.
+    ``after`` is the item to place the batch after: null for the start of
+    the playlist, left out for its end.
+    """
+    items = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    after = serializers.IntegerField(required=False, allow_null=True)
+
+    max_items = 1000
+
+    def validate_items(self, items):
+        if len(items) > self.max_items:
+            raise serializers.ValidationError(f"At most {self.max_items} items per request.")
+        return items
+
+
+class PlaylistAddSerializer(PlaylistBatchSerializer):
+    items = PlaylistEntrySerializer(many=True, allow_empty=False)
+
 
+class PlaylistSummarySerializer(serializers.ModelSerializer):
+    # The playlist index page: the denormalized aggregates, no items.
     class Meta:
         model = Playlist
-        fields = ['id', 'user', 'name', 'created_at', 'items']
-        read_only_fields = ['user', 'created_at', 'items']
+        fields = ['id', 'user', 'name', 'created_at', 'item_count', 'total_duration', 'last_modified', 'cover_thumbnail']
+        read_only_fields = ['user', 'created_at', 'item_count', 'total_duration', 'last_modified', 'cover_thumbnail']
+
+
+class PlaylistSerializer(PlaylistSummarySerializer):
+    items = PlaylistItemSerializer(many=True, read_only=True)
+
+    class Meta(PlaylistSummarySerializer.Meta):
+        fields = PlaylistSummarySerializer.Meta.fields + ['items']
+        read_only_fields = PlaylistSummarySerializer.Meta.read_only_fields + ['items']
         
 
 class FavoriteTrackSerializer(serializers.ModelSerializer):
@@ -187,3 +301,25 @@ class FavoriteTrackSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
+
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'filename', 'length', 'sha256', 'offset', 'track', 'created_at']
+        read_only_fields = ['offset', 'track', 'created_at']
+
+    def validate_length(self, value):
+        max_size = getattr(settings, 'UPLOAD_MAX_SIZE', 1024 ** 3)
+        if value <= 0:
+            raise serializers.ValidationError("Length must be positive.")
+        if value > max_size:
+            raise serializers.ValidationError(f"Uploads are limited to {max_size} bytes.")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Expected a hex SHA-256 digest.")
+        return value
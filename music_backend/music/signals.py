@@ -0,0 +1,311 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Album, Artist, FavoriteTrack, Genre, LibraryChange, Playlist, PlaylistItem, Tag, Track, onlineTrack
+from .favorites import change_favorite_ids, forget_favorite_ids
+from .fragments import forget_fragments
+from .playlists import refresh_aggregates
+from .reference import reference_table
+from .search.library import update_search_vectors
+from .snapshot import bump_library_revisions
+from .storage import acquire_blobs, release_blobs
+from .sync import record_library_changes
+
+
+SEARCHABLE_MODELS = (Track, onlineTrack)
+
+
+# --- Full-text search vectors ---
+
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=onlineTrack)
+def refresh_track_search_vector(sender, instance, **kwargs):
+    update_search_vectors(sender, [instance.pk])
+
+
+def refresh_labels_search_vector(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        update_search_vectors(type(instance), [instance.pk])
+    elif pk_set:
+        # genre.track_set.add(...): pk_set holds the affected tracks.
+        update_search_vectors(model, pk_set)
+
+
+for searchable in SEARCHABLE_MODELS:
+    for field in ("genres", "tags"):
+        m2m_changed.connect(
+            refresh_labels_search_vector,
+            sender=getattr(searchable, field).through,
+            dispatch_uid=f"search-vector-{searchable.__name__}-{field}",
+        )
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Tag)
+def refresh_related_search_vectors(sender, instance, created, **kwargs):
+    # A new artist/album/genre/tag isn't attached to anything yet; a rename
+    # changes the text indexed for every track that uses it.
+    if created:
+        return
+    lookup = {
+        Artist: "artist",
+        Album: "album",
+        Genre: "genres",
+        Tag: "tags",
+    }[sender]
+    for searchable in SEARCHABLE_MODELS:
+        pks = searchable.objects.filter(**{lookup: instance}).values("pk")
+        update_search_vectors(searchable, pks)
+
+
+# --- Audio blob reference counts ---
+
+AUDIO_FIELDS = ("file", "audio_file")
+
+
+def audio_names(track):
+    return {getattr(track, field).name for field in AUDIO_FIELDS if getattr(track, field)}
+
+
+@receiver(pre_save, sender=Track)
+def remember_track_audio(sender, instance, update_fields=None, **kwargs):
+    # Saves that can't touch the files (analysis results, ...) skip the lookup.
+    if update_fields is not None and not set(update_fields) & set(AUDIO_FIELDS):
+        instance._audio_names_before = None
+        return
+    before = sender.objects.filter(pk=instance.pk).values_list(*AUDIO_FIELDS).first() if instance.pk else None
+    instance._audio_names_before = {name for name in before or () if name}
+
+
+@receiver(post_save, sender=Track)
+def count_track_audio(sender, instance, **kwargs):
+    before = getattr(instance, "_audio_names_before", None)
+    if before is None:
+        return
+    after = audio_names(instance)
+    acquire_blobs(after - before)
+    release_blobs(before - after)
+
+
+@receiver(post_delete, sender=Track)
+def release_track_audio(sender, instance, **kwargs):
+    release_blobs(audio_names(instance))
+
+
+# --- Library revisions and sync ---
+# Any write that changes what /api/library/ returns for a user bumps that
+# user's revision; writes to synced objects also log the change (or a
+# tombstone) for /api/library/sync/. bulk_create/update bypass these;
+# callers record the changes themselves.
+
+OWNER_FIELDS = {
+    Track: "uploaded_by_id",
+    onlineTrack: "user_id",
+    Playlist: "user_id",
+    FavoriteTrack: "user_id",
+}
+
+SYNC_KINDS = {
+    onlineTrack: LibraryChange.Kind.ONLINE_TRACK,
+    Playlist: LibraryChange.Kind.PLAYLIST,
+    PlaylistItem: LibraryChange.Kind.PLAYLIST_ITEM,
+    FavoriteTrack: LibraryChange.Kind.FAVORITE,
+}
+
+
+def deleting_user(origin):
+    # Deleting a user cascades through their whole library: nobody is left
+    # to notify, and a new revision row would violate its foreign key.
+    return getattr(origin, "model", type(origin)) is User
+
+
+def deleting_playlist(origin):
+    # Items deleted along with their playlist are logged by
+    # log_playlist_item_deletions, all at once.
+    return getattr(origin, "model", type(origin)) is Playlist
+
+
+def touch_library_objects(model, pks):
+    """Mark the given objects as changed in their owners' libraries."""
+    if model in SYNC_KINDS:
+        owned = model.objects.filter(pk__in=pks).values_list("pk", OWNER_FIELDS[model])
+        record_library_changes((user_id, SYNC_KINDS[model], pk, False) for pk, user_id in owned)
+    else:
+        bump_library_revisions(model.objects.filter(pk__in=pks).values_list(OWNER_FIELDS[model], flat=True))
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def bump_owner_library(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin):
+        return
+    bump_library_revisions([instance.uploaded_by_id])
+
+
+@receiver(post_save, sender=onlineTrack)
+@receiver(post_delete, sender=onlineTrack)
+@receiver(post_save, sender=Playlist)
+@receiver(post_delete, sender=Playlist)
+@receiver(post_save, sender=PlaylistItem)
+@receiver(post_delete, sender=PlaylistItem)
+@receiver(post_save, sender=FavoriteTrack)
+@receiver(post_delete, sender=FavoriteTrack)
+def log_library_change(sender, instance, signal, origin=None, **kwargs):
+    if deleting_user(origin):
+        return
+    if sender is PlaylistItem:
+        if signal is post_delete and deleting_playlist(origin):
+            return
+        user_id = Playlist.objects.filter(pk=instance.playlist_id).values_list("user_id", flat=True).first()
+    else:
+        user_id = getattr(instance, OWNER_FIELDS[sender])
+    record_library_changes([(user_id, SYNC_KINDS[sender], instance.pk, signal is post_delete)])
+
+
+@receiver(pre_delete, sender=Playlist)
+def log_playlist_item_deletions(sender, instance, origin=None, **kwargs):
+    # One upsert for every item of a deleted playlist, instead of a lookup
+    # and an upsert per cascaded item.
+    if deleting_user(origin):
+        return
+    item_ids = instance.items.values_list("pk", flat=True)
+    record_library_changes((instance.user_id, LibraryChange.Kind.PLAYLIST_ITEM, pk, True) for pk in item_ids)
+
+
+def touch_labelled_library_objects(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        touch_library_objects(type(instance), [instance.pk])
+    elif pk_set:
+        touch_library_objects(model, pk_set)
+
+
+for searchable in SEARCHABLE_MODELS:
+    for field in ("genres", "tags"):
+        m2m_changed.connect(
+            touch_labelled_library_objects,
+            sender=getattr(searchable, field).through,
+            dispatch_uid=f"library-revision-{searchable.__name__}-{field}",
+        )
+
+
+@receiver(post_save, sender=Artist)
+@receiver(pre_delete, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(pre_delete, sender=Album)
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tracks_showing_label(sender, instance, created=False, **kwargs):
+    # Snapshots and synced rows inline artist/album/genre/tag names, so
+    # renames (and deletes, caught before the references are cleared)
+    # reach every track that shows the name.
+    if created:
+        return
+    lookup = {Artist: "artist", Album: "album", Genre: "genres", Tag: "tags"}[sender]
+    for model in SEARCHABLE_MODELS:
+        touch_library_objects(model, model.objects.filter(**{lookup: instance}).values("pk"))
+
+
+# --- Playlist aggregates ---
+# Single-item writes; the batch actions in music.playlists refresh for
+# themselves.
+
+@receiver(post_save, sender=PlaylistItem)
+@receiver(post_delete, sender=PlaylistItem)
+def refresh_item_playlist(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin) or deleting_playlist(origin):
+        return
+    refresh_aggregates([instance.playlist_id])
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_save, sender=onlineTrack)
+def refresh_playlists_showing_track(sender, instance, created, update_fields=None, **kwargs):
+    # A new track isn't on any playlist yet; otherwise only the fields the
+    # aggregates read matter.
+    field, lookup = (("duration", "items__track") if sender is Track else ("thumbnail", "items__online_track"))
+    if created or (update_fields is not None and field not in update_fields):
+        return
+    refresh_aggregates(list(Playlist.objects.filter(**{lookup: instance}).values_list("pk", flat=True)), touch=False)
+
+
+# --- Favorites membership ---
+
+@receiver(post_save, sender=FavoriteTrack)
+@receiver(post_delete, sender=FavoriteTrack)
+def update_user_favorites(sender, instance, signal, created=False, **kwargs):
+    if signal is post_save and not created:
+        # Which track it used to point at is gone: rebuild.
+        forget_favorite_ids(instance.user_id)
+        return
+    change_favorite_ids(instance.user_id, instance.track_id, instance.online_track_id, favorited=signal is post_save)
+
+
+# --- Reference data cache ---
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_reference_table(sender, **kwargs):
+    reference_table(sender).invalidate()
+
+
+# --- Response fragments ---
+# Cached serializer output (music.fragments) of tracks and playlists.
+# Queryset updates bypass these; music.audio and music.playlists forget
+# the objects they update themselves.
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+@receiver(post_save, sender=onlineTrack)
+@receiver(post_delete, sender=onlineTrack)
+@receiver(post_save, sender=Playlist)
+@receiver(post_delete, sender=Playlist)
+def forget_object_fragments(sender, instance, origin=None, **kwargs):
+    if deleting_user(origin):
+        return
+    forget_fragments(sender, [instance.pk])
+
+
+def forget_labelled_fragments(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        forget_fragments(type(instance), [instance.pk])
+    elif pk_set:
+        forget_fragments(model, pk_set)
+
+
+for searchable in SEARCHABLE_MODELS:
+    for field in ("genres", "tags"):
+        m2m_changed.connect(
+            forget_labelled_fragments,
+            sender=getattr(searchable, field).through,
+            dispatch_uid=f"fragments-{searchable.__name__}-{field}",
+        )
+
+
+@receiver(post_save, sender=Artist)
+@receiver(pre_delete, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(pre_delete, sender=Album)
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def forget_fragments_showing_label(sender, instance, created=False, **kwargs):
+    # Online tracks show the names, uploads the ids (cleared on delete).
+    if created:
+        return
+    lookup = {Artist: "artist", Album: "album", Genre: "genres", Tag: "tags"}[sender]
+    for model in SEARCHABLE_MODELS:
+        forget_fragments(model, list(model.objects.filter(**{lookup: instance}).values_list("pk", flat=True)))
@@ -0,0 +1,138 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F, OuterRef
+from django.db.models.functions import JSONObject
+
+from .models import FavoriteTrack, Genre, LibraryRevision, Playlist, PlaylistItem, Tag, Track, onlineTrack
+
+# Bump when the payload's shape changes so clients drop old copies.
+SNAPSHOT_FORMAT = 2
+
+
+# --- Revisions ---
+
+def get_library_revision(user_id):
+    return LibraryRevision.objects.filter(user_id=user_id).values_list("revision", flat=True).first() or 0
+
+
+async def aget_library_revision(user_id):
+    return await LibraryRevision.objects.filter(user_id=user_id).values_list("revision", flat=True).afirst() or 0
+
+
+def bump_library_revisions(user_ids):
+    """Increment (or start at 1) the library revision of every given user, in one upsert."""
+    user_ids = sorted({pk for pk in user_ids if pk is not None})
+    if not user_ids:
+        return
+    table = connection.ops.quote_name(LibraryRevision._meta.db_table)
+    with connection.cursor() as cursor:
+        # Sorted ids keep concurrent bumps taking row locks in one order.
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, revision, sync_floor) SELECT unnest(%s::integer[]), 1, 0 "
+            f"ON CONFLICT (user_id) DO UPDATE SET revision = {table}.revision + 1",
+            [user_ids],
+        )
+
+
+def library_etag(user_id, revision):
+    return f'"library-{SNAPSHOT_FORMAT}-{user_id}-{revision}"'
+
+
+# --- Snapshot ---
+
+def _labels(model, relation):
+    return ArraySubquery(model.objects.filter(**{relation: OuterRef("pk")}).order_by("name").values("name"))
+
+
+def track_rows(queryset):
+    rows = list(
+        queryset.order_by("-created_at", "-id")
+        .values("id", "title", "duration", "audio_file", artist_name=F("artist__name"), album_title=F("album__title"))
+        .annotate(genres=_labels(Genre, "track"), tags=_labels(Tag, "track"))
+    )
+    for track in rows:
+        track["artist"] = track.pop("artist_name")
+        track["album"] = track.pop("album_title")
+        track["duration"] = track["duration"].total_seconds() if track["duration"] else None
+        track["audio_file"] = settings.MEDIA_URL + track["audio_file"] if track["audio_file"] else None
+    return rows
+
+
+def online_track_rows(queryset):
+    rows = list(
+        queryset.order_by("-saved_at", "-id")
+        .values(
+            "id", "title", "stream_url", "thumbnail", "source", "saved_at",
+            artist_name=F("artist__name"), album_title=F("album__title"),
+        )
+        .annotate(genres=_labels(Genre, "onlinetrack"), tags=_labels(Tag, "onlinetrack"))
+    )
+    for track in rows:
+        track["artist"] = track.pop("artist_name")
+        track["album"] = track.pop("album_title")
+    return rows
+
+
+def playlist_rows(queryset, with_items=True):
+    rows = queryset.order_by("created_at").values("id", "name", "created_at")
+    if with_items:
+        items = PlaylistItem.objects.filter(playlist=OuterRef("pk")).order_by("rank", "id").values(
+            json=JSONObject(id="id", track="track_id", online_track="online_track_id", rank="rank")
+        )
+        rows = rows.annotate(items=ArraySubquery(items))
+    return list(rows)
+
+
+def playlist_item_rows(queryset):
+    return list(queryset.order_by("rank", "id").values("id", "playlist", "track", "online_track", "rank"))
+
+
+def favorite_rows(queryset):
+    return list(queryset.order_by("-favorited_at", "-id").values("id", "track", "online_track", "favorited_at"))
+
+
+def build_library_snapshot(user):
+    """
+    Everything the library page shows, in a fixed handful of queries:
+    the user's uploaded and saved tracks (genre/tag names inlined),
+    playlists with their item ids, and favorites.
+    """
+    return {
+        "tracks": track_rows(Track.objects.filter(uploaded_by=user)),
+        "online_tracks": online_track_rows(onlineTrack.objects.filter(user=user)),
+        "playlists": playlist_rows(Playlist.objects.filter(user=user)),
+        "favorites": favorite_rows(FavoriteTrack.objects.filter(user=user)),
+    }
+
+
+def _snapshot_key(user, revision):
+    return f"library-snapshot:{SNAPSHOT_FORMAT}:{user.pk}:{revision}"
+
+
+def library_snapshot_bytes(user, revision):
+    """
+    The serialized snapshot for ``revision``, built once and then served
+    from the cache until the next write bumps the revision.
+    """
+    key = _snapshot_key(user, revision)
+    body = cache.get(key)
+    if body is None:
+        snapshot = {"revision": revision, **build_library_snapshot(user)}
+        body = json.dumps(snapshot, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+        cache.set(key, body, getattr(settings, "LIBRARY_SNAPSHOT_CACHE_TIMEOUT", 60 * 60))
+    return body
+
+
+async def alibrary_snapshot_bytes(user, revision):
+    # Cache hits stay on the event loop; a build (a handful of queries and
+    # the encoding) runs in a thread.
+    body = await cache.aget(_snapshot_key(user, revision))
+    if body is None:
+        body = await sync_to_async(library_snapshot_bytes)(user, revision)
+    return body
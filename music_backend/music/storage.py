@@ -0,0 +1,106 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_NAME_RE = re.compile(r"^blobs/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$")
+READ_SIZE = 1024 * 1024
+
+
+def blob_digest(name):
+    """The SHA-256 of a content-addressed file name, or None for other files."""
+    match = BLOB_NAME_RE.match(name or "")
+    return match.group(1) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage for uploaded audio that keeps each distinct file once,
+    under ``blobs/<2 hex>/<sha256><ext>``, whatever name it was uploaded as.
+
+    Saving hashes the content as it is copied to a temporary file; if the
+    digest is already known the copy is dropped and the existing name is
+    returned. Every blob has an AudioBlob row whose ``refcount`` counts the
+    Track fields pointing at it (kept by music.signals); unreferenced blobs
+    are removed by ``gc_audio_blobs``. Names outside ``blobs/`` (files
+    stored before deduplication) are read and served as usual.
+    """
+
+    def _save(self, name, content):
+        sha256 = hashlib.sha256()
+        size = 0
+        tmp_dir = self.path("blobs/tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as f:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for chunk in content.chunks():
+                sha256.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return self.ingest(f.name, sha256.hexdigest(), size, os.path.splitext(name)[1])
+
+    def ingest(self, path, digest, size, ext=""):
+        """
+        Take ownership of the fully written file at ``path`` with the given
+        SHA-256: move it into place, or discard it when the blob is already
+        stored. Returns the blob's storage name.
+        """
+        AudioBlob = apps.get_model("music", "AudioBlob")
+        blob = AudioBlob.objects.filter(digest=digest).first()
+        if blob is not None and self.exists(blob.name):
+            os.remove(path)
+            # Restarts gc_audio_blobs' grace period until the new reference lands.
+            AudioBlob.objects.filter(pk=digest).update(updated_at=timezone.now())
+            return blob.name
+
+        # The extension is kept only so the type can be guessed from the name.
+        ext = ext.lower() if re.fullmatch(r"\.\w{1,10}", ext or "") else ""
+        name = blob.name if blob is not None else f"blobs/{digest[:2]}/{digest}{ext}"
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        # Identical bytes under an identical name: if two uploads race
+        # here, whichever rename lands last is just as good.
+        os.replace(path, self.path(name))
+        AudioBlob.objects.get_or_create(digest=digest, defaults={"name": name, "size": size})
+        return name
+
+    def ingest_file(self, path, ext="", expected_digest=None):
+        """Hash an existing file in one pass and ingest it (see ``ingest``)."""
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(READ_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+        digest = sha256.hexdigest()
+        if expected_digest and expected_digest != digest:
+            raise ValueError("The file's SHA-256 does not match the one declared.")
+        return self.ingest(path, digest, size, ext)
+
+
+_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return _storage
+
+
+def acquire_blobs(names):
+    names = [name for name in names if blob_digest(name)]
+    if names:
+        apps.get_model("music", "AudioBlob").objects.filter(name__in=names).update(refcount=F("refcount") + 1)
+
+
+def release_blobs(names):
+    # Unreferenced blobs stay on disk until gc_audio_blobs: a concurrent
+    # upload of the same bytes may be about to reference them again.
+    names = [name for name in names if blob_digest(name)]
+    if names:
+        apps.get_model("music", "AudioBlob").objects.filter(name__in=names, refcount__gt=0).update(
+            refcount=F("refcount") - 1, updated_at=timezone.now()
+        )
@@ -0,0 +1,199 @@
+import asyncio
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .storage import blob_digest
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_TOKEN_SALT = "music.streaming"
+
+
+# --- Stream tokens ---
+# <audio> elements can't send an Authorization header, so players append a
+# short-lived signed token naming the user instead. It only stands in for
+# the login: any active user may stream any track, as any signed-in user
+# can list them at /api/tracks/.
+
+def make_stream_token(user):
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign(str(user.pk))
+
+
+def _token_user_id(token):
+    max_age = getattr(settings, "STREAM_TOKEN_MAX_AGE", 6 * 60 * 60)
+    try:
+        return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+def user_from_stream_token(token):
+    """Return the active user a valid, unexpired token was issued to, or None."""
+    user_id = _token_user_id(token)
+    if user_id is None:
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+async def auser_from_stream_token(token):
+    user_id = _token_user_id(token)
+    if user_id is None:
+        return None
+    return await User.objects.filter(pk=user_id, is_active=True).afirst()
+
+
+# --- Byte ranges ---
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range), so the whole file is sent. Raises RangeNotSatisfiable
+    when the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _read_range(path, start, length, chunk_size):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _aread_range(path, start, length, chunk_size):
+    # Reads happen on a worker thread; the event loop only waits for them.
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _proxy_response(name, path, content_type):
+    # The fronting proxy serves the bytes itself (with its own Range and
+    # sendfile support); we only decide whether it may.
+    mode = settings.STREAM_SENDFILE_MODE
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-accel-redirect":
+        prefix = getattr(settings, "STREAM_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = prefix + quote(name)
+    elif mode == "x-sendfile":
+        response["X-Sendfile"] = path
+    else:
+        raise ValueError(f"Unknown STREAM_SENDFILE_MODE: {mode!r}")
+    return response
+
+
+def stream_file(request, name, storage=default_storage, content_type=None, asynchronous=False):
+    """
+    Serve the stored file ``name`` with HTTP Range (206), ETag / Last-Modified
+    revalidation (304) and If-Range support.
+
+    Whole-file responses go through ``FileResponse`` so WSGI servers with a
+    ``wsgi.file_wrapper`` can sendfile() them. With STREAM_SENDFILE_MODE set
+    to "x-accel-redirect" or "x-sendfile" the transfer is handed to the
+    fronting proxy instead. ``asynchronous`` (for the async views) streams
+    the bytes from an async iterator, which ASGI servers send chunk by
+    chunk rather than reading the file into memory first.
+    """
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # The row outlived its file (removed by hand, a lost volume).
+        raise Http404("This track's audio file is missing.")
+    size = stat.st_size
+    # Content-addressed files never change under their name, so their
+    # digest is a stable ETag and they can be cached for good.
+    digest = blob_digest(name)
+    etag = f'"{digest}"' if digest else f'"{size:x}-{int(stat.st_mtime):x}"'
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if getattr(settings, "STREAM_SENDFILE_MODE", None):
+            response = _proxy_response(name, path, content_type)
+        else:
+            response = _ranged_response(request, path, size, etag, last_modified, content_type, asynchronous)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Accept-Ranges"] = "bytes"
+    # Authorized per user, so shared caches must not keep a copy.
+    response["Cache-Control"] = "private, max-age=31536000, immutable" if digest else "private, max-age=3600"
+    return response
+
+
+def _ranged_response(request, path, size, etag, last_modified, content_type, asynchronous=False):
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range not in (etag, http_date(last_modified)):
+        # The client's partial copy is out of date: send the whole file.
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    chunk_size = getattr(settings, "STREAM_CHUNK_SIZE", 64 * 1024)
+    read_range = _aread_range if asynchronous else _read_range
+    if byte_range is None:
+        if not asynchronous:
+            return FileResponse(open(path, "rb"), content_type=content_type)
+        response = StreamingHttpResponse(read_range(path, 0, size, chunk_size), content_type=content_type)
+        response["Content-Length"] = str(size)
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        read_range(path, start, length, chunk_size), status=206, content_type=content_type
+    )
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
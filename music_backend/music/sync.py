@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db import connection
+
+from .models import FavoriteTrack, LibraryChange, LibraryRevision, Playlist, PlaylistItem, onlineTrack
+from .snapshot import favorite_rows, online_track_rows, playlist_item_rows, playlist_rows
+
+Kind = LibraryChange.Kind
+
+# Per kind: the model, the filter that scopes it to a user, the rows
+# builder and the key in the sync payload.
+SYNCED = {
+    Kind.ONLINE_TRACK: (onlineTrack, "user", online_track_rows, "online_tracks"),
+    Kind.PLAYLIST: (Playlist, "user", lambda queryset: playlist_rows(queryset, with_items=False), "playlists"),
+    Kind.PLAYLIST_ITEM: (PlaylistItem, "playlist__user", playlist_item_rows, "playlist_items"),
+    Kind.FAVORITE: (FavoriteTrack, "user", favorite_rows, "favorites"),
+}
+
+
+# --- Change log ---
+
+def record_library_changes(changes):
+    """
+    Log ``(user_id, kind, object_id, deleted)`` changes: each user's library
+    revision is bumped once and every object's change row is upserted with
+    the new revision, all in one statement.
+
+    The revision upsert holds the user's row lock until commit, so a
+    user's changes commit in revision order and a sync token never skips
+    one that commits late.
+    """
+    latest = {}
+    for user_id, kind, object_id, deleted in changes:
+        if user_id is not None:
+            latest[(user_id, str(kind), object_id)] = deleted
+    if not latest:
+        return
+    keys = sorted(latest)
+    revisions = connection.ops.quote_name(LibraryRevision._meta.db_table)
+    changes_table = connection.ops.quote_name(LibraryChange._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH changes (user_id, kind, object_id, deleted) AS (
+                SELECT * FROM unnest(%s::integer[], %s::text[], %s::bigint[], %s::boolean[])
+            ), bumped AS (
+                INSERT INTO {revisions} (user_id, revision, sync_floor)
+                SELECT DISTINCT user_id, 1, 0 FROM changes ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET revision = {revisions}.revision + 1
+                RETURNING user_id, revision
+            )
+            INSERT INTO {changes_table} (user_id, kind, object_id, deleted, revision, changed_at)
+            SELECT changes.user_id, kind, object_id, deleted, bumped.revision, now()
+            FROM changes JOIN bumped USING (user_id)
+            ON CONFLICT (user_id, kind, object_id) DO UPDATE
+            SET deleted = EXCLUDED.deleted, revision = EXCLUDED.revision, changed_at = EXCLUDED.changed_at
+            """,
+            [
+                [key[0] for key in keys],
+                [key[1] for key in keys],
+                [key[2] for key in keys],
+                [latest[key] for key in keys],
+            ],
+        )
+
+
+# --- Sync ---
+
+def library_changes(user, since, limit=None):
+    """
+    Everything in ``user``'s library that changed after revision ``since``:
+    upserted rows (shaped as in the snapshot, playlists without items) and
+    deleted ids per kind, plus the revision to pass as ``since`` next time.
+
+    Changes come oldest first, at most about ``limit`` of them (a single
+    revision is never split), with ``more`` set when there are others.
+    Returns ``reset`` instead when ``since`` is older than the pruned
+    tombstones or newer than the library: the client must start over from
+    /api/library/.
+    """
+    limit = limit or getattr(settings, "LIBRARY_SYNC_PAGE_SIZE", 500)
+    state = LibraryRevision.objects.filter(user=user).values("revision", "sync_floor").first()
+    revision, floor = (state["revision"], state["sync_floor"]) if state else (0, 0)
+    if since < floor or since > revision:
+        return {"revision": revision, "reset": True}
+
+    payload = {"revision": since, "reset": False, "more": False}
+    payload.update({key: {"upserted": [], "deleted": []} for _, _, _, key in SYNCED.values()})
+    if since == revision:
+        return payload
+
+    pending = LibraryChange.objects.filter(user=user, revision__gt=since).order_by("revision", "id")
+    changes = list(pending.values("kind", "object_id", "deleted", "revision")[:limit + 1])
+    if len(changes) > limit:
+        payload["more"] = True
+        cut = changes[limit]["revision"]
+        changes = [change for change in changes if change["revision"] < cut]
+        if not changes:
+            # One revision bigger than a page comes whole.
+            changes = list(pending.filter(revision=cut).values("kind", "object_id", "deleted", "revision"))
+    if payload["more"]:
+        payload["revision"] = changes[-1]["revision"]
+    else:
+        # Nothing left over: the token also moves past revisions that only
+        # touched uploads, which aren't synced.
+        payload["revision"] = max(revision, changes[-1]["revision"]) if changes else revision
+
+    upserted = {kind: [] for kind in SYNCED}
+    for change in changes:
+        if change["deleted"]:
+            payload[SYNCED[change["kind"]][3]]["deleted"].append(change["object_id"])
+        else:
+            upserted[change["kind"]].append(change["object_id"])
+    for kind, ids in upserted.items():
+        if ids:
+            model, owner, rows, key = SYNCED[kind]
+            # Rows deleted since are skipped; their tombstones come later.
+            payload[key]["upserted"] = rows(model.objects.filter(pk__in=ids, **{owner: user}))
+    return payload
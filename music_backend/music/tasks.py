@@ -0,0 +1,55 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    # Uploads are post-processed by a small bounded pool so a burst of
+    # uploads queues up instead of competing with request threads.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "TASK_WORKERS", 2),
+                thread_name_prefix="music-tasks",
+            )
+    return _executor
+
+
+def _run_in_worker(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s%r failed", func.__name__, args)
+    finally:
+        # Worker threads get their own connection; don't leave it open
+        # between tasks.
+        connection.close()
+
+
+def run_task(func, *args):
+    """
+    Run ``func(*args)`` on the configured TASK_BACKEND: "thread" (the
+    default) submits it to the worker pool, "inline" runs it right away,
+    which keeps tests deterministic.
+    """
+    backend = getattr(settings, "TASK_BACKEND", "thread")
+    if backend == "inline":
+        return func(*args)
+    if backend == "thread":
+        return get_executor().submit(_run_in_worker, func, *args)
+    raise ValueError(f"Unknown TASK_BACKEND: {backend!r}")
+
+
+def enqueue(func, *args):
+    # Wait for the surrounding transaction so the task sees the new rows.
+    transaction.on_commit(partial(run_task, func, *args))
@@ -1,3 +1,2496 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import asyncio
+import datetime
+import decimal
+
+import httpx
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from mutagen.easyid3 import EasyID3
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import search
+from .models import Album, Artist, AudioBlob, ChunkedUpload, FavoriteTrack, Genre, LibraryChange, LibraryRevision, Playlist, PlaylistItem, Tag, Track, TrackRendition, TrackWaveform, onlineTrack
+from .search.cache import SearchCache, get_search_cache
+from .search.client import AsyncProviderClient, ProviderClient
+from .search.fanout import afan_out, aiter_fan_out, fan_out, get_executor, get_pool_size, iter_fan_out
+from .search.library import search_library
+from .search.merge import fingerprint, merge_results, normalize_title
+from .audio import analyze_track
+from .bulk import resolve_artists
+from .checks import check_shared_cache
+from .lean import lean_online_track_rows
+from .ranks import rank_between, ranks_between
+from .renderers import Fragment, FragmentList, JSONRenderer, ORJSONRenderer
+from .serializers import OnlineTrackSerializer
+from .streaming import RangeNotSatisfiable, make_stream_token, parse_range
+from .transcode import analyze_and_transcode, plan_bitrates, transcode_track
+from .uploads import receive_chunk
+from .views import AsyncLibrarySnapshotView, AsyncSongSearchView, AsyncTrackStreamView, TrackViewSet, onlineTrackViewSet
+from .waveform import LoudnessMeter, PeakMeter, compute_waveform, integrated_loudness, peak_envelope
+
+
+# --- Stub provider servers ---
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of concurrent async searches.
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients that give up on a delayed response are expected here.
+        pass
+
+
+class StubProviderServer:
+    """
+    Local HTTP server standing in for a search provider. Every response is
+    delayed by ``delay`` seconds and carries ``payload`` as JSON. ``status``
+    may be a list, consumed one response at a time.
+    """
+
+    def __init__(self, payload=None, delay=0, status=200):
+        self.payload = payload if payload is not None else {}
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.payload).encode()
+                status = stub.status.pop(0) if isinstance(stub.status, list) else stub.status
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EchoProvider(search.SearchProvider):
+    name = "echo"
+
+    def search(self, query, limit):
+        return [{"title": query, "source": self.name}][:limit]
+
+
+class SleepyProvider(search.SearchProvider):
+    name = "sleepy"
+
+    def search(self, query, limit):
+        time.sleep(0.5)
+        return [{"title": f"{query} slowly", "source": self.name}]
+
+
+def stub_search(server, source):
+    def search_stub(query):
+        response = requests.get(server.url, params={"q": query})
+        response.raise_for_status()
+        return [{"title": item, "source": source} for item in response.json()["items"]]
+    return search_stub
+
+
+# --- Provider fan-out ---
+
+@override_settings(SEARCH_DEFAULT_DEADLINE=2.0, SEARCH_PROVIDER_DEADLINES={})
+class FanOutTests(SimpleTestCase):
+
+    def setUp(self):
+        get_search_cache().clear()
+
+    def test_providers_run_concurrently(self):
+        with StubProviderServer({"items": ["a"]}, delay=0.4) as one, \
+             StubProviderServer({"items": ["b"]}, delay=0.4) as two, \
+             StubProviderServer({"items": ["c"]}, delay=0.4) as three:
+            started = time.monotonic()
+            results, status = fan_out("q", {
+                "one": stub_search(one, "one"),
+                "two": stub_search(two, "two"),
+                "three": stub_search(three, "three"),
+            })
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual([r["title"] for r in results], ["a", "b", "c"])
+        self.assertEqual({s["status"] for s in status.values()}, {"ok"})
+
+    @override_settings(SEARCH_PROVIDER_DEADLINES={"slow": 0.3})
+    def test_slow_provider_is_cut_off_at_its_deadline(self):
+        with StubProviderServer({"items": ["fast"]}, delay=0.05) as fast, \
+             StubProviderServer({"items": ["slow"]}, delay=1.5) as slow:
+            started = time.monotonic()
+            results, status = fan_out("q", {
+                "fast": stub_search(fast, "fast"),
+                "slow": stub_search(slow, "slow"),
+            })
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(results, [{"title": "fast", "source": "fast"}])
+        self.assertEqual(status["fast"]["status"], "ok")
+        self.assertEqual(status["fast"]["count"], 1)
+        self.assertEqual(status["slow"]["status"], "timeout")
+
+    def test_failing_provider_reports_error(self):
+        with StubProviderServer({"items": ["ok"]}) as good, \
+             StubProviderServer({}, status=500) as bad:
+            results, status = fan_out("q", {
+                "good": stub_search(good, "good"),
+                "bad": stub_search(bad, "bad"),
+            })
+
+        self.assertEqual(results, [{"title": "ok", "source": "good"}])
+        self.assertEqual(status["bad"]["status"], "error")
+
+    def test_results_are_yielded_in_completion_order(self):
+        with StubProviderServer({"items": ["late"]}, delay=0.4) as late, \
+             StubProviderServer({"items": ["early"]}, delay=0.05) as early:
+            names = [name for name, _, _ in iter_fan_out("q", {
+                "late": stub_search(late, "late"),
+                "early": stub_search(early, "early"),
+            })]
+
+        self.assertEqual(names, ["early", "late"])
+
+    @override_settings(SEARCH_CONCURRENT_SEARCHES=5, SEARCH_PROVIDERS=[
+        "music.search.providers.JamendoProvider",
+        "music.search.providers.AudiusProvider",
+    ])
+    def test_pool_has_a_thread_per_provider_call(self):
+        self.assertEqual(get_pool_size(), 10)
+
+
+@override_settings(SEARCH_DEFAULT_DEADLINE=2.0, SEARCH_PROVIDER_DEADLINES={"audius": 0.3})
+class SongSearchViewTests(SimpleTestCase):
+
+    def setUp(self):
+        get_search_cache().clear()
+
+    def test_search_merges_providers_and_reports_status(self):
+        youtube = {"items": [{
+            "id": {"videoId": "abc"},
+            "snippet": {"title": "Song", "channelTitle": "Artist",
+                        "thumbnails": {"default": {"url": "http://img/yt.jpg"}}},
+        }]}
+        jamendo = {"results": [{
+            "name": "Song", "artist_name": "Artist",
+            "audio": "http://audio/jamendo.mp3", "album_image": "http://img/j.jpg",
+        }]}
+        mixcloud = {"data": [{
+            "name": "Mix", "user": {"name": "DJ"},
+            "url": "https://www.mixcloud.com/dj/mix/", "pictures": {"thumbnail": "http://img/m.jpg"},
+        }]}
+
+        with StubProviderServer(youtube, delay=0.2) as yt, \
+             StubProviderServer(jamendo, delay=0.2) as jm, \
+             StubProviderServer(mixcloud, delay=0.2) as mc, \
+             StubProviderServer({"data": []}, delay=1.5) as au, \
+             mock.patch.object(search.YouTubeProvider, "url", yt.url), \
+             mock.patch.object(search.JamendoProvider, "url", jm.url), \
+             mock.patch.object(search.MixcloudProvider, "url", mc.url), \
+             mock.patch.object(search.AudiusProvider, "url", au.url):
+            started = time.monotonic()
+            response = APIClient().get("/api/search/", {"q": "song"})
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, 1.0)
+        # YouTube and Jamendo returned the same song; Jamendo's copy wins.
+        self.assertEqual([r["source"] for r in response.data["results"]], ["jamendo", "mixcloud"])
+        self.assertEqual(response.data["results"][0]["alternates"],
+                         [{"source": "youtube", "stream_url": "https://www.youtube.com/watch?v=abc"}])
+        self.assertEqual(response.data["providers"]["audius"]["status"], "timeout")
+
+    def test_missing_query_is_rejected(self):
+        response = APIClient().get("/api/search/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_repeated_search_is_served_from_cache(self):
+        jamendo = {"results": [{
+            "name": "Song", "artist_name": "Artist",
+            "audio": "http://audio/jamendo.mp3", "album_image": "http://img/j.jpg",
+        }]}
+        with StubProviderServer({"items": []}) as yt, \
+             StubProviderServer(jamendo, delay=0.3) as jm, \
+             StubProviderServer({"data": []}) as mc, \
+             StubProviderServer({"data": []}) as au, \
+             mock.patch.object(search.YouTubeProvider, "url", yt.url), \
+             mock.patch.object(search.JamendoProvider, "url", jm.url), \
+             mock.patch.object(search.MixcloudProvider, "url", mc.url), \
+             mock.patch.object(search.AudiusProvider, "url", au.url):
+            APIClient().get("/api/search/", {"q": "Song"})
+            jm.delay = 5
+            started = time.monotonic()
+            response = APIClient().get("/api/search/", {"q": "  song "})
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.2)
+        self.assertEqual(response.data["providers"]["jamendo"]["cache"], "hit")
+        self.assertEqual(response.data["results"][0]["stream_url"], "http://audio/jamendo.mp3")
+
+
+@override_settings(
+    SEARCH_PROVIDERS=["music.tests.SleepyProvider", "music.tests.EchoProvider"],
+    SEARCH_DEFAULT_DEADLINE=2.0,
+    SEARCH_PROVIDER_DEADLINES={},
+)
+class ProviderRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        get_search_cache().clear()
+
+    def test_providers_come_from_settings_in_order(self):
+        self.assertEqual(list(search.get_providers()), ["sleepy", "echo"])
+
+        response = APIClient().get("/api/search/", {"q": "hello"})
+        self.assertEqual(response.data["results"], [
+            {"title": "hello slowly", "source": "sleepy"},
+            {"title": "hello", "source": "echo"},
+        ])
+
+    @override_settings(SEARCH_PROVIDER_LIMIT=0)
+    def test_limit_is_passed_to_providers(self):
+        response = APIClient().get("/api/search/", {"q": "hello"})
+        self.assertEqual(response.data["providers"]["echo"]["count"], 0)
+
+    def test_ndjson_stream_sends_fast_providers_first(self):
+        started = time.monotonic()
+        response = APIClient().get("/api/search/", {"q": "hello", "stream": "ndjson"})
+        chunks = iter(response.streaming_content)
+        first = json.loads(next(chunks))
+        first_after = time.monotonic() - started
+        rest = [json.loads(chunk) for chunk in chunks]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertLess(first_after, 0.3)
+        self.assertEqual(first["provider"], "echo")
+        self.assertEqual(first["results"], [{"title": "hello", "source": "echo"}])
+        self.assertEqual(rest[0]["provider"], "sleepy")
+        self.assertEqual(rest[-1], {"done": True})
+
+    def test_sse_stream(self):
+        response = APIClient().get("/api/search/", {"q": "hello", "stream": "sse"})
+        body = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(body.count("event: results\n"), 2)
+        self.assertTrue(body.endswith("event: done\ndata: {}\n\n"))
+
+    def test_unknown_stream_format_is_rejected(self):
+        response = APIClient().get("/api/search/", {"q": "hello", "stream": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+# --- Result merging ---
+
+def fake_result(title, artist, source):
+    return {"title": title, "artist": artist, "stream_url": f"http://{source}/{title}", "source": source}
+
+
+def score_by_source_name(cluster, query_tokens):
+    return cluster["members"][0]["result"]["source"]
+
+
+class MergeResultsTests(SimpleTestCase):
+
+    def test_title_noise_is_removed(self):
+        self.assertEqual(normalize_title("Hello (Official Music Video) [HD]"), "hello")
+        self.assertEqual(normalize_title("Halo (feat. Someone) - Lyrics"), "halo")
+        self.assertEqual(normalize_title("Beyoncé – Halo!"), "beyonce halo")
+        self.assertEqual(normalize_title("Hello (Live)"), "hello live")
+
+    def test_same_song_from_different_providers_shares_a_fingerprint(self):
+        self.assertEqual(
+            fingerprint(fake_result("Adele - Hello (Official Video)", "AdeleVEVO", "youtube")),
+            fingerprint(fake_result("Hello", "Adele", "jamendo")),
+        )
+        self.assertNotEqual(
+            fingerprint(fake_result("Hello", "Adele", "jamendo")),
+            fingerprint(fake_result("Hello", "Lionel Richie", "audius")),
+        )
+
+    @override_settings(SEARCH_SOURCE_WEIGHTS={"jamendo": 1.0, "audius": 0.9, "youtube": 0.5})
+    def test_duplicates_are_merged_and_ranked(self):
+        merged = merge_results([
+            fake_result("Adele - Hello (Official Video)", "AdeleVEVO", "youtube"),
+            fake_result("Someone Like You", "Adele", "youtube"),
+            fake_result("Goodbye", "Other", "jamendo"),
+            fake_result("Hello", "Adele", "jamendo"),
+            fake_result("HELLO", "adele", "audius"),
+        ], "hello")
+
+        self.assertEqual([(r["title"], r["source"]) for r in merged], [
+            ("Hello", "jamendo"),
+            ("Goodbye", "jamendo"),
+            ("Someone Like You", "youtube"),
+        ])
+        self.assertEqual([a["source"] for a in merged[0]["alternates"]], ["audius", "youtube"])
+        self.assertNotIn("alternates", merged[1])
+
+    def test_results_without_a_key_are_not_merged(self):
+        merged = merge_results([
+            {"source": "jamendo"},
+            {"title": "", "source": "audius"},
+            fake_result("Hello", "Adele", "jamendo"),
+        ], "hello")
+
+        self.assertEqual([r["source"] for r in merged], ["jamendo", "jamendo", "audius"])
+        self.assertFalse(any("alternates" in r for r in merged))
+
+    @override_settings(SEARCH_RANKING_FUNCTION="music.tests.score_by_source_name")
+    def test_scoring_function_is_configurable(self):
+        merged = merge_results([
+            fake_result("A", "x", "audius"),
+            fake_result("B", "y", "youtube"),
+            fake_result("C", "z", "jamendo"),
+        ], "q")
+        self.assertEqual([r["source"] for r in merged], ["youtube", "jamendo", "audius"])
+
+
+# --- Provider HTTP client ---
+
+class ProviderClientTests(SimpleTestCase):
+
+    def test_connections_are_kept_alive_and_pooled(self):
+        client = ProviderClient()
+        with StubProviderServer({"items": []}) as server:
+            for _ in range(5):
+                client.get(server.url, params={"q": "x"})
+        client.close()
+
+        self.assertEqual(server.requests, 5)
+        self.assertEqual(server.connections, 1)
+
+    def test_5xx_and_429_are_retried(self):
+        client = ProviderClient(retries=2, backoff_factor=0, backoff_jitter=0)
+        with StubProviderServer({"items": ["x"]}, status=[503, 429, 200]) as server:
+            response = client.get(server.url)
+        client.close()
+
+        self.assertEqual(response.json(), {"items": ["x"]})
+        self.assertEqual(server.requests, 3)
+
+    def test_error_status_raises_after_retries(self):
+        client = ProviderClient(retries=1, backoff_factor=0, backoff_jitter=0)
+        with StubProviderServer({}, status=500) as server:
+            with self.assertRaises(requests.HTTPError):
+                client.get(server.url)
+        client.close()
+
+        self.assertEqual(server.requests, 2)
+
+    def test_hung_provider_hits_read_timeout(self):
+        client = ProviderClient(timeout=(1, 0.2))
+        with StubProviderServer({}, delay=1) as server:
+            started = time.monotonic()
+            with self.assertRaises(requests.Timeout):
+                client.get(server.url)
+            elapsed = time.monotonic() - started
+        client.close()
+
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(server.requests, 1)
+
+
+# --- Search result cache ---
+
+@override_settings(SEARCH_CACHE_TTL={"default": 60}, SEARCH_CACHE_STALE_TTL=60)
+class SearchCacheTests(SimpleTestCase):
+
+    def test_query_is_normalized(self):
+        cache = SearchCache(max_entries=10)
+        cache.set("jamendo", "Daft  Punk", ["x"])
+        self.assertEqual(cache.get("jamendo", " daft punk"), (["x"], True))
+        self.assertIsNone(cache.get("audius", "daft punk"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SearchCache(max_entries=2)
+        cache.set("p", "a", [1])
+        cache.set("p", "b", [2])
+        cache.get("p", "a")
+        cache.set("p", "c", [3])
+
+        self.assertIsNone(cache.get("p", "b"))
+        self.assertIsNotNone(cache.get("p", "a"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_counters(self):
+        cache = SearchCache(max_entries=10)
+        cache.get("p", "a")
+        cache.set("p", "a", [1])
+        cache.get("p", "a")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    @override_settings(SEARCH_CACHE_TTL={"p": 0}, SEARCH_CACHE_STALE_TTL=60)
+    def test_stale_entry_is_served_and_revalidated_once(self):
+        cache = SearchCache(max_entries=10)
+        cache.set("p", "a", ["old"])
+        self.assertEqual(cache.get("p", "a"), (["old"], False))
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+
+        calls = []
+        release = threading.Event()
+
+        def search_stub(query):
+            calls.append(query)
+            release.wait(1)
+            return ["new"]
+
+        cache.revalidate("p", "a", search_stub, get_executor())
+        cache.revalidate("p", "a", search_stub, get_executor())
+        release.set()
+        for _ in range(100):
+            if cache._entries[("p", "a")][0] == ["new"]:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get("p", "a")[0], ["new"])
+        self.assertEqual(cache.stats()["refreshes"], 1)
+
+    @override_settings(SEARCH_CACHE_TTL={"p": 0}, SEARCH_CACHE_STALE_TTL=0)
+    def test_expired_entry_is_a_miss(self):
+        cache = SearchCache(max_entries=10)
+        cache.set("p", "a", [1])
+        self.assertIsNone(cache.get("p", "a"))
+
+    @override_settings(CACHES={"search": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_shared_backend_tier(self):
+        writer = SearchCache(max_entries=10, backend="search")
+        reader = SearchCache(max_entries=10, backend="search")
+        writer.set("p", "a", [1])
+
+        self.assertEqual(reader.get("p", "a"), ([1], True))
+        self.assertEqual(reader.stats()["backend_hits"], 1)
+
+
+# --- Library full-text search ---
+
+class LibrarySearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        cls.artist = Artist.objects.create(name="Daft Punk")
+        album = Album.objects.create(title="Discovery", artist=cls.artist, release_date=datetime.date(2001, 3, 12))
+        cls.house = Genre.objects.create(name="house")
+
+        cls.one_more_time = Track.objects.create(title="One More Time", artist=cls.artist, album=album)
+        cls.one_more_time.genres.add(cls.house)
+        cls.other_track = Track.objects.create(title="Around the World")
+
+        cls.saved = onlineTrack.objects.create(user=cls.user, title="Digital Love", artist=cls.artist, source="jamendo")
+        cls.saved.tags.add(Tag.objects.create(name="chill"))
+        onlineTrack.objects.create(user=cls.other, title="Digital Love", artist=cls.artist, source="jamendo")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get("/api/library/search/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [t["title"] for t in response.data["tracks"]], [t["title"] for t in response.data["online_tracks"]]
+
+    def test_matches_artist_album_genre_and_tag(self):
+        self.assertEqual(self.search("daft punk"), (["One More Time"], ["Digital Love"]))
+        self.assertEqual(self.search("discovery"), (["One More Time"], []))
+        self.assertEqual(self.search("house"), (["One More Time"], []))
+        self.assertEqual(self.search("chill"), ([], ["Digital Love"]))
+
+    def test_title_matches_rank_first(self):
+        Track.objects.create(title="Punk Rock", artist=Artist.objects.create(name="Someone"))
+        tracks, _ = self.search("punk")
+        self.assertEqual(tracks, ["Punk Rock", "One More Time"])
+
+    def test_vectors_follow_renames_and_label_changes(self):
+        self.artist.name = "Thomas Bangalter"
+        self.artist.save()
+        self.assertEqual(self.search("bangalter")[0], ["One More Time"])
+
+        self.one_more_time.genres.remove(self.house)
+        self.assertEqual(self.search("house"), ([], []))
+
+    # Trigram similarity reads the title, not the index, so it would still
+    # match with the vectors cleared.
+    @override_settings(LIBRARY_SEARCH_TRIGRAM=False)
+    def test_rebuild_command(self):
+        Track.objects.update(search_vector=None)
+        self.assertEqual(self.search("world"), ([], []))
+
+        call_command("rebuild_search_index", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.search("world"), (["Around the World"], []))
+
+    @tag("trigram")
+    @override_settings(LIBRARY_SEARCH_TRIGRAM=True)
+    def test_typos_match_by_trigram_similarity(self):
+        self.assertEqual(self.search("one more tim")[0], ["One More Time"])
+        self.assertEqual(self.search("digtal love")[1], ["Digital Love"])
+
+
+# --- Playlist query counts ---
+
+class PlaylistQueryCountTests(TestCase):
+    """
+    Serializing playlists must cost the same number of queries whether they
+    hold one item or hundreds.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.genre = Genre.objects.create(name="house")
+        cls.tag = Tag.objects.create(name="chill")
+        cls.artist = Artist.objects.create(name="Daft Punk")
+        cls.album = Album.objects.create(title="Discovery", artist=cls.artist, release_date=datetime.date(2001, 3, 12))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_playlist(self, size):
+        playlist = Playlist.objects.create(user=self.user, name=f"playlist {Playlist.objects.count()}")
+        for i in range(size):
+            if i % 2:
+                track = Track.objects.create(title=f"track {i}", artist=self.artist, album=self.album)
+                track.genres.add(self.genre)
+                track.tags.add(self.tag)
+                PlaylistItem.objects.create(playlist=playlist, track=track)
+            else:
+                online = onlineTrack.objects.create(
+                    user=self.user, title=f"online {i}", artist=self.artist, album=self.album, source="jamendo"
+                )
+                online.genres.add(self.genre)
+                online.tags.add(self.tag)
+                PlaylistItem.objects.create(playlist=playlist, online_track=online)
+        return playlist
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_playlist_list_is_one_query(self):
+        self.add_playlist(2)
+        for _ in range(5):
+            self.add_playlist(20)
+
+        # The page, plus loading the playlists missing from the fragment
+        # cache; then just the page.
+        self.assertEqual(self.count_queries("/api/playlists/"), 2)
+        self.assertEqual(self.count_queries("/api/playlists/"), 1)
+
+        response = self.client.get("/api/playlists/")
+        self.assertEqual(sum(p["item_count"] for p in response.data), 102)
+        self.assertNotIn("items", response.data[0])
+
+    def test_playlist_detail_nests_items(self):
+        playlist = self.add_playlist(2)
+
+        response = self.client.get(f"/api/playlists/{playlist.pk}/")
+
+        self.assertEqual(response.data["items"][0]["online_track_detail"]["artist"], "Daft Punk")
+        self.assertEqual(response.data["items"][1]["track_detail"]["genres"], [self.genre.pk])
+
+    def test_playlist_detail_and_items_are_constant(self):
+        small = self.add_playlist(2)
+        large = self.add_playlist(60)
+
+        self.assertEqual(
+            self.count_queries(f"/api/playlists/{large.pk}/"),
+            self.count_queries(f"/api/playlists/{small.pk}/"),
+        )
+        self.assertEqual(
+            self.count_queries(f"/api/playlists/{large.pk}/items/"),
+            self.count_queries(f"/api/playlists/{small.pk}/items/"),
+        )
+
+    def test_playlist_item_list_is_constant(self):
+        self.add_playlist(2)
+        small = self.count_queries("/api/playlist-items/")
+
+        self.add_playlist(60)
+        self.assertEqual(self.count_queries("/api/playlist-items/"), small)
+
+
+class RankTests(SimpleTestCase):
+
+    def test_spread_ranks_are_ordered_and_short(self):
+        ranks = ranks_between(None, None, 1000)
+
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), 1000)
+        self.assertLessEqual(max(map(len, ranks)), 2)
+
+    def test_repeated_inserts_stay_between_neighbours(self):
+        low, high = "V", "W"
+        for _ in range(200):
+            middle = rank_between(low, high)
+            self.assertTrue(low < middle < high)
+            self.assertFalse(middle.endswith("0"))
+            high = middle
+
+    def test_rejects_unordered_bounds(self):
+        with self.assertRaises(ValueError):
+            rank_between("b", "a")
+
+
+class PlaylistOrderingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.other = User.objects.create_user("uploader", password="pw")
+        cls.upload = Track.objects.create(title="Shared", uploaded_by=cls.other)
+        cls.online = [onlineTrack.objects.create(user=cls.user, title=f"song {i}") for i in range(300)]
+        cls.playlist = Playlist.objects.create(user=cls.user, name="Mix")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/playlists/{self.playlist.pk}/"
+
+    def order(self):
+        return list(self.playlist.items.values_list("online_track", flat=True))
+
+    def add(self, tracks, **extra):
+        entries = [{"online_track": track.pk} for track in tracks]
+        return self.client.post(self.url + "add-tracks/", {"items": entries, **extra}, format="json")
+
+    def test_single_adds_append(self):
+        for track in self.online[:3]:
+            PlaylistItem.objects.create(playlist=self.playlist, online_track=track)
+
+        self.assertEqual(self.order(), [track.pk for track in self.online[:3]])
+
+    def test_batch_add_is_a_fixed_number_of_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.add(self.online[:2])
+        with CaptureQueriesContext(connection) as large:
+            response = self.add(self.online[2:300])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(self.order(), [track.pk for track in self.online])
+
+    def test_batch_add_at_a_position_skips_duplicates(self):
+        first = self.add(self.online[:2]).data["items"][0]
+
+        self.add([self.online[5], self.online[0], self.online[5]], after=first["id"])
+        self.add([self.online[9]], after=None)
+
+        self.assertEqual(self.order(), [self.online[i].pk for i in (9, 0, 5, 1)])
+
+    def test_batch_add_checks_ownership(self):
+        theirs = onlineTrack.objects.create(user=self.other, title="Theirs")
+
+        response = self.add([theirs])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.playlist.items.exists())
+
+    def test_reorder_rewrites_only_the_moved_items(self):
+        items = self.add(self.online[:5]).data["items"]
+        before = {item["id"]: item["rank"] for item in items}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url + "reorder/", {"items": [items[4]["id"], items[3]["id"]], "after": None}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), [self.online[i].pk for i in (4, 3, 0, 1, 2)])
+        after = dict(self.playlist.items.values_list("id", "rank"))
+        self.assertEqual([pk for pk in before if before[pk] != after[pk]], [items[3]["id"], items[4]["id"]])
+        self.assertLessEqual(len(queries), 9)
+
+    def test_reorder_respreads_overgrown_ranks(self):
+        items = self.add(self.online[:3]).data["items"]
+        with mock.patch("music.playlists.MAX_RANK_LENGTH", 2):
+            for _ in range(20):
+                self.client.post(self.url + "reorder/", {"items": [items[2]["id"]], "after": items[0]["id"]}, format="json")
+                self.client.post(self.url + "reorder/", {"items": [items[1]["id"]], "after": items[0]["id"]}, format="json")
+
+        self.assertEqual(self.order(), [self.online[i].pk for i in (0, 1, 2)])
+        self.assertLessEqual(max(len(rank) for rank in self.playlist.items.values_list("rank", flat=True)), 2)
+
+    def test_batch_remove_leaves_tombstones(self):
+        items = self.add(self.online[:4]).data["items"]
+        since = json.loads(self.client.get("/api/library/").content)["revision"]
+
+        response = self.client.post(self.url + "remove-tracks/", {"items": [items[0]["id"], items[2]["id"]]}, format="json")
+
+        self.assertEqual(sorted(response.data["removed"]), [items[0]["id"], items[2]["id"]])
+        self.assertEqual(self.order(), [self.online[1].pk, self.online[3].pk])
+        changes = self.client.get("/api/library/sync/", {"since": since}).data
+        self.assertEqual(sorted(changes["playlist_items"]["deleted"]), [items[0]["id"], items[2]["id"]])
+
+    def test_add_track_accepts_shared_uploads_and_own_online_tracks(self):
+        self.assertEqual(self.client.post(self.url + "add_track/", {"track_id": self.upload.pk}).status_code, 201)
+        self.assertEqual(self.client.post(self.url + "add_track/", {"online_track_id": self.online[0].pk}).status_code, 201)
+
+        self.assertEqual(self.playlist.items.count(), 2)
+
+
+class PlaylistAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.tracks = [
+            Track.objects.create(title=f"track {i}", duration=datetime.timedelta(seconds=60 * (i + 1))) for i in range(3)
+        ]
+        cls.online = [
+            onlineTrack.objects.create(user=cls.user, title=f"song {i}", thumbnail=f"https://img.example.com/{i}.jpg")
+            for i in range(3)
+        ]
+        cls.playlist = Playlist.objects.create(user=cls.user, name="Mix")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/playlists/{self.playlist.pk}/"
+
+    def aggregates(self):
+        self.playlist.refresh_from_db()
+        return self.playlist.item_count, self.playlist.total_duration.total_seconds(), self.playlist.cover_thumbnail
+
+    def test_batch_edits_keep_aggregates_current(self):
+        entries = [{"track": track.pk} for track in self.tracks] + [{"online_track": track.pk} for track in self.online]
+        items = self.client.post(self.url + "add-tracks/", {"items": entries}, format="json").data["items"]
+        self.assertEqual(self.aggregates(), (6, 360, self.online[0].thumbnail))
+
+        self.client.post(self.url + "reorder/", {"items": [items[4]["id"]], "after": None}, format="json")
+        self.assertEqual(self.aggregates(), (6, 360, self.online[1].thumbnail))
+
+        self.client.post(self.url + "remove-tracks/", {"items": [items[0]["id"], items[4]["id"]]}, format="json")
+        self.assertEqual(self.aggregates(), (4, 300, self.online[0].thumbnail))
+
+    def test_single_item_writes_keep_aggregates_current(self):
+        self.client.post("/api/playlist-items/", {"playlist": self.playlist.pk, "track": self.tracks[1].pk}, format="json")
+        PlaylistItem.objects.create(playlist=self.playlist, online_track=self.online[2])
+        self.assertEqual(self.aggregates(), (2, 120, self.online[2].thumbnail))
+
+        self.tracks[1].duration = datetime.timedelta(seconds=90)
+        self.tracks[1].save(update_fields=["duration"])
+        self.online[2].delete()
+        self.assertEqual(self.aggregates(), (1, 90, None))
+
+    def test_rebuild_command_fixes_drift(self):
+        PlaylistItem.objects.create(playlist=self.playlist, track=self.tracks[2])
+        Playlist.objects.update(item_count=42, total_duration=datetime.timedelta(0))
+
+        call_command("rebuild_playlist_aggregates", stdout=io.StringIO())
+
+        self.assertEqual(self.aggregates(), (1, 180, None))
+
+
+# --- Index usage ---
+
+class HotPathIndexTests(TestCase):
+    """
+    EXPLAIN the per-user hot queries against a seeded dataset and fail if
+    any of them falls back to a sequential scan.
+    """
+    users = 20
+    tracks_per_user = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f"user{i}") for i in range(cls.users)]
+        )
+        onlineTrack.objects.bulk_create([
+            onlineTrack(user=user, title=f"song {i}", source="jamendo")
+            for user in users for i in range(cls.tracks_per_user)
+        ])
+        playlists = Playlist.objects.bulk_create([
+            Playlist(user=user, name=f"playlist {i}") for user in users for i in range(20)
+        ])
+        online_tracks = list(onlineTrack.objects.order_by("pk"))
+        FavoriteTrack.objects.bulk_create([
+            FavoriteTrack(user=track.user, online_track=track) for track in online_tracks[::2]
+        ])
+        PlaylistItem.objects.bulk_create([
+            PlaylistItem(playlist=playlist, online_track=online_tracks[(n * 37 + i) % len(online_tracks)])
+            for n, playlist in enumerate(playlists) for i in range(15)
+        ])
+        with connection.cursor() as cursor:
+            for model in (User, onlineTrack, Playlist, PlaylistItem, FavoriteTrack):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        cls.user = users[7]
+        cls.playlist = playlists[42]
+
+    def assertNoSeqScan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan, f"{queryset.query}\n{plan}")
+
+    def test_online_track_library_listing(self):
+        self.assertNoSeqScan(onlineTrack.objects.filter(user=self.user).order_by("-saved_at", "-id")[:10])
+
+    def test_online_track_keyset_page(self):
+        last = onlineTrack.objects.filter(user=self.user).order_by("-saved_at", "-id")[150]
+        self.assertNoSeqScan(
+            onlineTrack.objects.filter(user=self.user, saved_at__lte=last.saved_at)
+            .filter(Q(saved_at__lt=last.saved_at) | Q(id__lt=last.pk))
+            .order_by("-saved_at", "-id")[:11]
+        )
+
+    def test_online_track_duplicate_check(self):
+        self.assertNoSeqScan(onlineTrack.objects.filter(user=self.user, title="song 3", source="jamendo"))
+
+    def test_favorites_listing(self):
+        self.assertNoSeqScan(FavoriteTrack.objects.filter(user=self.user).order_by("-favorited_at", "-id"))
+
+    def test_playlist_listing(self):
+        self.assertNoSeqScan(Playlist.objects.filter(user=self.user).order_by("created_at"))
+
+    def test_playlist_items(self):
+        self.assertNoSeqScan(PlaylistItem.objects.filter(playlist=self.playlist).order_by("id"))
+
+    def test_user_delete_cascade_lookups(self):
+        # The dropped single-column FK indexes must stay covered.
+        self.assertNoSeqScan(onlineTrack.objects.filter(user=self.user))
+        self.assertNoSeqScan(FavoriteTrack.objects.filter(user=self.user))
+        self.assertNoSeqScan(Playlist.objects.filter(user=self.user))
+
+
+# --- Pagination ---
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        # bulk_create gives every row the same saved_at, so paging must
+        # break ties on id.
+        cls.tracks = onlineTrack.objects.bulk_create([
+            onlineTrack(user=cls.user, title=f"song {i}", source="jamendo") for i in range(23)
+        ])
+        FavoriteTrack.objects.bulk_create([
+            FavoriteTrack(user=cls.user, online_track=track) for track in cls.tracks[:12]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data["next"]
+        return pages
+
+    def test_cursor_walks_every_row_once_newest_first(self):
+        pages = self.walk("/api/online-tracks/?pagination=cursor&page_size=10")
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 3])
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, sorted((t.pk for t in self.tracks), reverse=True))
+
+    def test_cursor_pages_skip_offset_and_count(self):
+        first = self.client.get("/api/online-tracks/?pagination=cursor&page_size=5")
+        self.assertNotIn("count", first.data)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data["next"])
+        sql = " ".join(q["sql"] for q in queries).upper()
+        self.assertNotIn("OFFSET", sql)
+        self.assertNotIn("COUNT(", sql)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/online-tracks/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_without_count(self):
+        response = self.client.get("/api/online-tracks/", {"count": "false", "page": 3})
+        self.assertIsNone(response.data["count"])
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertIsNone(response.data["next"])
+        self.assertIn("page=2", response.data["previous"])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/online-tracks/", {"count": "false"})
+        self.assertIn("page=2", response.data["next"])
+        self.assertNotIn("COUNT(", " ".join(q["sql"] for q in queries).upper())
+
+    def test_default_page_numbers_are_unchanged(self):
+        response = self.client.get("/api/online-tracks/")
+        self.assertEqual(response.data["count"], 23)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_favorites_are_a_plain_list_unless_paginated(self):
+        response = self.client.get("/api/favorites/")
+        self.assertEqual(len(response.data), 12)
+
+        pages = self.walk("/api/favorites/?pagination=cursor&page_size=5")
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+
+
+# --- Bulk save ---
+
+class OnlineTrackBulkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.artist = Artist.objects.create(name="Daft Punk")
+        Album.objects.create(title="Discovery", artist=cls.artist, release_date=datetime.date(2001, 3, 12))
+        Genre.objects.create(name="house")
+        Tag.objects.create(name="chill")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, count, prefix="song"):
+        return [{
+            "title": f"{prefix} {i}",
+            "artist": f"{prefix} artist {i % 3}",
+            "stream_url": f"https://audio.example.com/{prefix}/{i}.mp3",
+            "source": "jamendo",
+            "genres": ["house"],
+            "tags": ["chill"],
+        } for i in range(count)]
+
+    def test_creates_tracks_with_relations(self):
+        response = self.client.post("/api/online-tracks/bulk/", [
+            {"title": "One More Time", "artist": "Daft Punk", "album": "Discovery",
+             "source": "jamendo", "genres": ["house"], "tags": ["chill"]},
+            {"title": "New Song", "artist": "Brand New Artist", "source": "audius"},
+        ], format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"][0]["artist"], "Daft Punk")
+        self.assertEqual(response.data["created"][0]["album"], "Discovery")
+        self.assertEqual(response.data["created"][0]["genres"], ["house"])
+        self.assertEqual(response.data["created"][1]["artist"], "Brand New Artist")
+        self.assertEqual(Artist.objects.filter(name="Daft Punk").count(), 1)
+
+        self.assertEqual(
+            list(search_library(onlineTrack.objects.filter(user=self.user), "discovery").values_list("title", flat=True)),
+            ["One More Time"],
+        )
+
+    def test_duplicates_are_skipped(self):
+        onlineTrack.objects.create(user=self.user, title="song 0", source="jamendo")
+        payload = self.payload(3) + self.payload(1)
+
+        response = self.client.post("/api/online-tracks/bulk/", {"tracks": payload}, format="json")
+
+        self.assertEqual([t["title"] for t in response.data["created"]], ["song 1", "song 2"])
+        self.assertEqual(response.data["skipped"], [
+            {"title": "song 0", "source": "jamendo"},
+            {"title": "song 0", "source": "jamendo"},
+        ])
+        self.assertEqual(onlineTrack.objects.filter(user=self.user).count(), 3)
+
+    def test_unknown_genre_rejects_the_whole_batch(self):
+        payload = self.payload(3)
+        payload[2]["genres"] = ["polka"]
+
+        response = self.client.post("/api/online-tracks/bulk/", payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(onlineTrack.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post("/api/online-tracks/bulk/", self.payload(5, "small"), format="json")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post("/api/online-tracks/bulk/", self.payload(300, "large"), format="json")
+
+        self.assertEqual(len(response.data["created"]), 300)
+        self.assertEqual(len(large), len(small))
+
+
+class TemporaryMediaTestCase(TestCase):
+    # Uploaded files land in a throwaway MEDIA_ROOT.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class TrackStreamTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.body = bytes(range(256)) * 4
+        cls.track = Track.objects.create(
+            title="song", uploaded_by=cls.user,
+            audio_file=SimpleUploadedFile("song.mp3", cls.body, content_type="audio/mpeg"),
+        )
+        cls.url = f"/api/tracks/{cls.track.pk}/stream/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=95-200", 100), (95, 99))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(parse_range("items=0-1", 100))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=100-", 100)
+
+    def test_full_body(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "audio/mpeg")
+        self.assertEqual(self.content(response), self.body)
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.body)}")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(self.content(response), self.body[10:20])
+
+    def test_missing_file_is_404(self):
+        track = Track.objects.create(title="gone", uploaded_by=self.user, audio_file="tracks/gone.mp3")
+
+        response = self.client.get(f"/api/tracks/{track.pk}/stream/")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.body)}")
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.body)
+
+    @override_settings(STREAM_SENDFILE_MODE="x-accel-redirect")
+    def test_accel_redirect_hands_off_to_proxy(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.track.audio_file.name)
+        self.assertEqual(response.content, b"")
+
+    def test_signed_token_authorizes_without_header(self):
+        token = self.client.get("/api/tracks/stream-token/").data["token"]
+        anonymous = APIClient()
+
+        response = anonymous.get(self.url, {"token": token}, HTTP_RANGE="bytes=0-3")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), self.body[:4])
+
+    def test_rejects_missing_or_forged_token(self):
+        anonymous = APIClient()
+        forged = make_stream_token(self.user)[:-1] + "x"
+
+        self.assertEqual(anonymous.get(self.url).status_code, 401)
+        self.assertEqual(anonymous.get(self.url, {"token": forged}).status_code, 401)
+
+    @override_settings(STREAM_TOKEN_MAX_AGE=-1)
+    def test_rejects_expired_token(self):
+        response = APIClient().get(self.url, {"token": make_stream_token(self.user)})
+
+        self.assertEqual(response.status_code, 401)
+
+
+def silent_mp3(frames=200, **tags):
+    """128 kbps / 44.1 kHz MPEG-1 Layer III frames of silence, optionally ID3-tagged."""
+    frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+    with tempfile.NamedTemporaryFile(suffix=".mp3") as f:
+        f.write(frame * frames)
+        f.flush()
+        if tags:
+            id3 = EasyID3()
+            id3.update(tags)
+            id3.save(f.name)
+        with open(f.name, "rb") as tagged:
+            return tagged.read()
+
+
+@override_settings(TASK_BACKEND="inline")
+class TrackAnalysisTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("uploader", password="pw")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Decoding MP3 for the waveform needs ffmpeg; covered separately.
+        patcher = mock.patch("music.views.compute_waveform")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, body, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/tracks/", {
+                "audio_file": SimpleUploadedFile("upload.mp3", body, content_type="audio/mpeg"), **data,
+            }, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_upload_returns_before_analysis_and_fills_in_metadata(self):
+        body = silent_mp3(title="Night Drive", artist="Neon", album="Roads", date="2019-05-01")
+
+        response = self.upload(body)
+
+        self.assertEqual(response.data["analysis_status"], "pending")
+        track = Track.objects.select_related("artist", "album").get(pk=response.data["id"])
+        self.assertEqual(track.analysis_status, Track.AnalysisStatus.DONE)
+        self.assertAlmostEqual(track.duration.total_seconds(), 5.2, delta=0.1)
+        self.assertEqual((track.bitrate, track.codec), (128, "mp3"))
+        self.assertEqual(track.title, "Night Drive")
+        self.assertEqual(track.artist.name, "Neon")
+        self.assertEqual((track.album.title, track.album.release_date), ("Roads", datetime.date(2019, 5, 1)))
+
+        polled = self.client.get(f"/api/tracks/{track.pk}/")
+        self.assertEqual(polled.data["analysis_status"], "done")
+
+    def test_uploader_values_are_kept(self):
+        artist = Artist.objects.create(name="Someone Else")
+
+        response = self.upload(silent_mp3(title="Night Drive", artist="Neon"), title="My Title", artist=artist.pk)
+
+        track = Track.objects.get(pk=response.data["id"])
+        self.assertEqual((track.title, track.artist_id), ("My Title", artist.pk))
+        self.assertFalse(Artist.objects.filter(name="Neon").exists())
+
+    def test_album_is_matched_by_title_and_artist(self):
+        other = Album.objects.create(
+            title="Greatest Hits", artist=Artist.objects.create(name="Someone Else"), release_date=datetime.date(2001, 1, 1),
+        )
+
+        response = self.upload(silent_mp3(artist="Neon", album="Greatest Hits", date="2019"))
+
+        track = Track.objects.select_related("album").get(pk=response.data["id"])
+        self.assertNotEqual(track.album_id, other.pk)
+        self.assertEqual((track.album.title, track.album.artist_id), ("Greatest Hits", track.artist_id))
+
+        again = Track.objects.get(pk=self.upload(silent_mp3(artist="Neon", album="Greatest Hits")).data["id"])
+        self.assertEqual(again.album_id, track.album_id)
+
+    def test_unreadable_file_is_marked_failed(self):
+        response = self.upload(b"not audio at all")
+
+        track = Track.objects.get(pk=response.data["id"])
+        self.assertEqual(track.analysis_status, Track.AnalysisStatus.FAILED)
+        self.assertTrue(track.analysis_error)
+
+    def test_backfill_command(self):
+        track = Track.objects.create(
+            uploaded_by=self.user, audio_file=SimpleUploadedFile("old.mp3", silent_mp3(artist="Neon")),
+        )
+
+        with mock.patch("music.management.commands.analyze_tracks.compute_waveform"):
+            call_command("analyze_tracks", stdout=io.StringIO())
+
+        track.refresh_from_db()
+        self.assertEqual(track.analysis_status, Track.AnalysisStatus.DONE)
+        self.assertEqual(track.artist.name, "Neon")
+
+
+def sine(seconds, rate=48000, amplitude=1.0, frequency=997):
+    t = np.arange(int(seconds * rate)) / rate
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def stereo_wav(left, right, rate=48000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        frames = np.round(np.column_stack([left, right]) * 32767).astype("<i2")
+        wav.writeframes(frames.tobytes())
+    return buffer.getvalue()
+
+
+class LoudnessTests(SimpleTestCase):
+
+    def test_full_scale_sine_in_one_channel_is_minus_3_lufs(self):
+        # The BS.1770 calibration point, at two sample rates.
+        for rate in (48000, 44100):
+            tone = sine(3, rate)
+            samples = np.vstack([tone, np.zeros_like(tone)])
+            self.assertAlmostEqual(integrated_loudness(samples, rate), -3.01, delta=0.05)
+
+    def test_half_amplitude_stereo(self):
+        tone = sine(3, amplitude=0.5)
+        self.assertAlmostEqual(integrated_loudness(np.vstack([tone, tone]), 48000), -6.02, delta=0.05)
+
+    def test_silence_and_short_clips_have_no_loudness(self):
+        self.assertIsNone(integrated_loudness(np.zeros((2, 48000)), 48000))
+        self.assertIsNone(integrated_loudness(np.vstack([sine(0.2)] * 2), 48000))
+
+    def test_peak_envelope(self):
+        samples = np.concatenate([np.zeros(500), sine(0.01, amplitude=0.5)[:500]])
+
+        peaks = peak_envelope(samples[np.newaxis], 10)
+
+        self.assertEqual(peaks.dtype, np.int8)
+        self.assertEqual(list(peaks[:5]), [0] * 5)
+        self.assertTrue(all(60 <= peak <= 64 for peak in peaks[5:]))
+
+    def test_block_by_block_matches_the_whole_track(self):
+        tone = np.vstack([sine(3, amplitude=0.5), sine(3, amplitude=0.25)])
+        meter = LoudnessMeter(48000, block_frames=4096)
+        for start in range(0, tone.shape[1], 10007):
+            meter.add(tone[:, start:start + 10007])
+
+        self.assertAlmostEqual(meter.loudness(), integrated_loudness(tone, 48000), places=6)
+
+    def test_peaks_of_unknown_length_stay_bounded(self):
+        ramp = np.linspace(0, 1, 48000 * 20)[np.newaxis]
+        meter = PeakMeter(10)
+        for start in range(0, ramp.shape[1], 4096):
+            meter.add(ramp[:, start:start + 4096])
+
+        self.assertLessEqual(meter.count, 640)
+        exact = peak_envelope(ramp, 10).astype(int)
+        self.assertLessEqual(np.abs(meter.envelope().astype(int) - exact).max(), 1)
+
+
+@override_settings(TASK_BACKEND="inline", WAVEFORM_PEAKS=100)
+class TrackWaveformTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_computes_waveform_served_as_int8(self):
+        # Loud first half, quiet second half.
+        tone = np.concatenate([sine(2, amplitude=0.5), sine(2, amplitude=0.05)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/tracks/", {
+                "audio_file": SimpleUploadedFile("tone.wav", stereo_wav(tone, tone), content_type="audio/wav"),
+            }, format="multipart")
+        url = f"/api/tracks/{response.data['id']}/waveform/"
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertIn("max-age", response["Cache-Control"])
+        peaks = np.frombuffer(response.content, dtype=np.int8)
+        self.assertEqual(len(peaks), 100)
+        self.assertTrue((peaks[:50] >= 60).all() and (peaks[50:] <= 7).all())
+        loudness = float(response["X-Loudness"])
+        self.assertLess(loudness, -6.0)
+        self.assertAlmostEqual(float(response["X-Loudness-Gain"]), -14.0 - loudness, places=1)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_other_formats_are_decoded_as_a_stream(self):
+        decoder = os.path.join(self.media_root, "fake-decoder")
+        with open(decoder, "w") as f:
+            f.write(FAKE_DECODER.format(python=sys.executable))
+        os.chmod(decoder, 0o755)
+        track = Track.objects.create(
+            title="song", uploaded_by=self.user,
+            audio_file=SimpleUploadedFile("song.mp3", b"ID3 not really", content_type="audio/mpeg"),
+        )
+
+        with override_settings(FFMPEG_BINARY=decoder):
+            waveform = compute_waveform(track.pk)
+            self.assertAlmostEqual(waveform.loudness, -6.02, delta=0.05)
+            self.assertTrue(all(60 <= peak <= 64 for peak in np.frombuffer(waveform.peaks, dtype=np.int8)))
+
+            open(os.path.join(self.media_root, "fail"), "w").close()
+            with self.assertLogs("music.waveform", "WARNING"):
+                self.assertIsNone(compute_waveform(track.pk))
+
+    def test_missing_waveform_is_404(self):
+        track = Track.objects.create(title="song", uploaded_by=self.user)
+
+        response = self.client.get(f"/api/tracks/{track.pk}/waveform/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(TrackWaveform.objects.exists())
+
+
+FAKE_DECODER = """#!{python}
+# Stands in for ffmpeg decoding to f32le: 5 s of a half-scale stereo tone.
+import math, os, struct, sys
+if os.path.exists(os.path.join(os.path.dirname(sys.argv[0]), "fail")):
+    sys.exit("Invalid data found when processing input")
+for second in range(5):
+    frames = (0.5 * math.sin(2 * math.pi * 997 * (second + i / 48000)) for i in range(48000))
+    sys.stdout.buffer.write(b"".join(struct.pack("<ff", v, v) for v in frames))
+"""
+
+
+FAKE_FFMPEG = """#!{python}
+# Stands in for ffmpeg's HLS muxer: two segments and a VOD playlist.
+import os, sys
+args = sys.argv[1:]
+if os.path.exists(os.path.join(os.path.dirname(sys.argv[0]), "fail")):
+    sys.exit("Invalid data found when processing input")
+bitrate = args[args.index("-b:a") + 1]
+pattern = args[args.index("-hls_segment_filename") + 1]
+lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:6", "#EXT-X-PLAYLIST-TYPE:VOD"]
+for i in range(2):
+    with open(pattern % i, "w") as f:
+        f.write(bitrate + str(i))
+    lines += ["#EXTINF:6.0,", os.path.basename(pattern % i)]
+with open(args[-1], "w") as f:
+    f.write("\\n".join(lines + ["#EXT-X-ENDLIST"]) + "\\n")
+"""
+
+
+@override_settings(TASK_BACKEND="inline", HLS_BITRATES=[128, 64])
+class TrackHLSTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        ffmpeg = os.path.join(self.media_root, "fake-ffmpeg")
+        with open(ffmpeg, "w") as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(ffmpeg, 0o755)
+        override = override_settings(FFMPEG_BINARY=ffmpeg)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self):
+        tone = sine(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/tracks/", {
+                "audio_file": SimpleUploadedFile("tone.wav", stereo_wav(tone, tone), content_type="audio/wav"),
+            }, format="multipart")
+        return Track.objects.get(pk=response.data["id"])
+
+    def test_upload_is_packaged_for_adaptive_streaming(self):
+        track = self.upload()
+
+        self.assertEqual(
+            list(track.renditions.order_by("bitrate").values_list("bitrate", "status")),
+            [(64, "ready"), (128, "ready")],
+        )
+
+        master = self.client.get(f"/api/tracks/{track.pk}/hls/")
+        self.assertEqual(master["Content-Type"], "application/vnd.apple.mpegurl")
+        lines = master.content.decode().splitlines()
+        self.assertEqual(lines[0], "#EXTM3U")
+        self.assertIn("BANDWIDTH=70400", lines[3])
+        self.assertEqual(lines[4], f"http://testserver/api/tracks/{track.pk}/hls/64/index.m3u8/")
+
+        variant = self.client.get(lines[6]).content.decode().splitlines()
+        self.assertIn("#EXT-X-ENDLIST", variant)
+        segment_url = f"http://testserver/api/tracks/{track.pk}/hls/128/segment_0001.ts/"
+        self.assertIn(segment_url, variant)
+
+        segment = self.client.get(segment_url)
+        self.assertEqual(segment["Content-Type"], "video/mp2t")
+        self.assertEqual(b"".join(segment.streaming_content), b"128k1")
+
+    def test_token_is_carried_into_playlists(self):
+        track = self.upload()
+        token = make_stream_token(self.user)
+        anonymous = APIClient()
+
+        master = anonymous.get(f"/api/tracks/{track.pk}/hls/", {"token": token}).content.decode()
+        variant_url = master.splitlines()[4]
+        self.assertTrue(variant_url.endswith("?" + urlencode({"token": token})))
+        segment_url = anonymous.get(variant_url).content.decode().splitlines()[5]
+
+        self.assertEqual(anonymous.get(segment_url).status_code, 200)
+        self.assertEqual(anonymous.get(f"/api/tracks/{track.pk}/hls/").status_code, 401)
+
+    def test_failed_encode_is_recorded(self):
+        open(os.path.join(self.media_root, "fail"), "w").close()
+        self.addCleanup(os.remove, os.path.join(self.media_root, "fail"))
+
+        track = self.upload()
+
+        self.assertEqual(set(track.renditions.values_list("status", flat=True)), {"failed"})
+        self.assertIn("Invalid data", track.renditions.first().error)
+        self.assertEqual(self.client.get(f"/api/tracks/{track.pk}/hls/").status_code, 404)
+
+    def test_retranscoding_replaces_renditions(self):
+        track = self.upload()
+
+        transcode_track(track.pk)
+
+        self.assertEqual(TrackRendition.objects.filter(track=track).count(), 2)
+
+    @override_settings(HLS_BITRATES=[64, 128, 256])
+    def test_upload_is_analyzed_before_its_ladder_is_planned(self):
+        with mock.patch("music.views.compute_waveform"), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/tracks/", {
+                "audio_file": SimpleUploadedFile("song.mp3", silent_mp3(), content_type="audio/mpeg"),
+            }, format="multipart")
+
+        track = Track.objects.get(pk=response.data["id"])
+        self.assertEqual(track.bitrate, 128)
+        self.assertEqual(list(track.renditions.order_by("bitrate").values_list("bitrate", flat=True)), [64, 128])
+
+    def test_transcoding_is_queued_as_its_own_task(self):
+        track = Track.objects.create(title="t")
+
+        with mock.patch("music.transcode.analyze_track") as analyze, mock.patch("music.transcode.run_task") as run_task:
+            analyze_and_transcode(track.pk)
+
+        analyze.assert_called_once_with(track.pk)
+        run_task.assert_called_once_with(transcode_track, track.pk)
+
+    def test_ladder_stops_at_source_bitrate(self):
+        self.assertEqual(plan_bitrates(Track(bitrate=100)), [64])
+        self.assertEqual(plan_bitrates(Track(bitrate=32)), [64])
+        self.assertEqual(plan_bitrates(Track()), [64, 128])
+
+
+class DroppingStream(io.BytesIO):
+    def read(self, size=-1):
+        chunk = super().read(size)
+        if not chunk:
+            raise UnreadablePostError("connection reset")
+        return chunk
+
+
+@override_settings(TASK_BACKEND="inline")
+class ChunkedUploadTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("uploader", password="pw")
+        cls.body = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch("music.views.process_upload")
+        self.process_upload = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self, length=None):
+        response = self.client.post("/api/uploads/", {"filename": "big song.flac", "length": length or len(self.body)}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return f"/api/uploads/{response.data['id']}/"
+
+    def patch(self, url, chunk, offset, **extra):
+        return self.client.generic(
+            "PATCH", url, chunk, content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET=str(offset), **extra
+        )
+
+    def test_chunks_are_assembled_into_a_track(self):
+        url = self.start()
+
+        with mock.patch("music.uploads.READ_SIZE", 1000):
+            first = self.patch(url, self.body[:4000], 0)
+            second = self.patch(url, self.body[4000:], 4000)
+
+        self.assertEqual((first.status_code, first["Upload-Offset"]), (204, "4000"))
+        self.assertEqual(second["Upload-Offset"], str(len(self.body)))
+        self.assertEqual(self.client.head(url)["Upload-Offset"], str(len(self.body)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + "finalize/", {"title": "Big Song"}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        track = Track.objects.get(pk=response.data["id"])
+        self.assertEqual((track.title, track.uploaded_by), ("Big Song", self.user))
+        digest = hashlib.sha256(self.body).hexdigest()
+        self.assertEqual(track.audio_file.name, f"blobs/{digest[:2]}/{digest}.flac")
+        with track.audio_file.open("rb") as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertFalse(os.listdir(os.path.join(self.media_root, "uploads")))
+        self.process_upload.assert_called_once_with(track)
+
+    def test_dropped_chunk_resumes_from_received_bytes(self):
+        url = self.start()
+
+        upload = ChunkedUpload.objects.get()
+
+        # The client promised 4000 bytes but the connection dies after 1500.
+        with mock.patch("music.uploads.READ_SIZE", 500):
+            with self.assertRaises(UnreadablePostError):
+                receive_chunk(upload, DroppingStream(self.body[:1500]), 0, 4000)
+
+        offset = int(self.client.get(url).data["offset"])
+        self.assertEqual(offset, 1500)
+        self.patch(url, self.body[offset:], offset)
+        self.client.post(url + "finalize/", {}, format="json")
+
+        with Track.objects.get().audio_file.open("rb") as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_rejects_bad_chunks(self):
+        url = self.start()
+        self.patch(url, self.body[:100], 0)
+
+        self.assertEqual(self.patch(url, self.body[:100], 0).status_code, 409)
+        self.assertEqual(self.patch(url, self.body, 100).status_code, 400)
+        self.assertEqual(self.client.patch(url, {"offset": 0}, format="json").status_code, 415)
+        self.assertEqual(self.client.get(url).data["offset"], 100)
+
+    def test_finalize_needs_every_byte_once(self):
+        url = self.start()
+        self.patch(url, self.body[:100], 0)
+        self.assertEqual(self.client.post(url + "finalize/", {}, format="json").status_code, 409)
+
+        self.patch(url, self.body[100:], 100)
+        self.assertEqual(self.client.post(url + "finalize/", {}, format="json").status_code, 201)
+        self.assertEqual(self.client.post(url + "finalize/", {}, format="json").status_code, 409)
+        self.assertEqual(Track.objects.count(), 1)
+
+    def test_limits_and_ownership(self):
+        with override_settings(UPLOAD_MAX_SIZE=10):
+            self.assertEqual(self.client.post("/api/uploads/", {"filename": "a.mp3", "length": 11}, format="json").status_code, 400)
+
+        url = self.start()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user("other", password="pw"))
+        self.assertEqual(other.get(url).status_code, 404)
+        self.assertEqual(self.patch(url, b"", 0).status_code, 204)
+
+    def test_delete_and_purge_remove_partial_files(self):
+        kept, dropped, stale = self.start(), self.start(), self.start()
+        self.client.delete(dropped)
+        ChunkedUpload.objects.filter(pk=stale.split("/")[-2]).update(
+            updated_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+
+        call_command("purge_uploads", stdout=io.StringIO())
+
+        self.assertEqual([str(pk) for pk in ChunkedUpload.objects.values_list("pk", flat=True)], [kept.split("/")[-2]])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "uploads")), [kept.split("/")[-2] + ".part"])
+
+
+@override_settings(TASK_BACKEND="inline")
+class ContentAddressedStorageTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", password="pw")
+        cls.bob = User.objects.create_user("bob", password="pw")
+        cls.body = b"ID3" + bytes(range(256)) * 8
+        cls.digest = hashlib.sha256(cls.body).hexdigest()
+
+    def setUp(self):
+        patcher = mock.patch("music.views.process_upload")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def upload(self, user, body=None, filename="song.mp3"):
+        response = self.client_for(user).post("/api/tracks/", {
+            "audio_file": SimpleUploadedFile(filename, body or self.body), "uploaded_by": user.pk,
+        }, format="multipart")
+        return Track.objects.get(pk=response.data["id"])
+
+    def blob_files(self):
+        return sorted(
+            name for _, _, names in os.walk(os.path.join(self.media_root, "blobs")) for name in names
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(self.alice)
+        second = self.upload(self.bob, filename="copy.MP3")
+
+        self.assertEqual(first.audio_file.name, f"blobs/{self.digest[:2]}/{self.digest}.mp3")
+        self.assertEqual(second.audio_file.name, first.audio_file.name)
+        self.assertEqual(self.blob_files(), [f"{self.digest}.mp3"])
+        self.assertEqual(AudioBlob.objects.get().refcount, 2)
+
+    def test_replacing_and_deleting_tracks_release_references(self):
+        track = self.upload(self.alice)
+        self.upload(self.bob)
+
+        self.client_for(self.alice).patch(
+            f"/api/tracks/{track.pk}/", {"audio_file": SimpleUploadedFile("new.mp3", b"other bytes")}, format="multipart"
+        )
+        counts = dict(AudioBlob.objects.values_list("digest", "refcount"))
+        self.assertEqual(counts[self.digest], 1)
+        self.assertEqual(counts[hashlib.sha256(b"other bytes").hexdigest()], 1)
+
+        Track.objects.all().delete()
+        self.assertEqual(set(AudioBlob.objects.values_list("refcount", flat=True)), {0})
+
+    def test_gc_repairs_counts_and_removes_unreferenced_blobs(self):
+        kept = self.upload(self.alice)
+        dropped = self.upload(self.bob, b"dropped bytes")
+        dropped.delete()
+        AudioBlob.objects.filter(pk=self.digest).update(refcount=5)
+
+        call_command("gc_audio_blobs", "--grace-hours=0", stdout=io.StringIO())
+
+        self.assertEqual(list(AudioBlob.objects.values_list("digest", "refcount")), [(self.digest, 1)])
+        self.assertEqual(self.blob_files(), [os.path.basename(kept.audio_file.name)])
+
+    def test_known_digest_skips_the_upload(self):
+        existing = self.upload(self.alice)
+        client = self.client_for(self.bob)
+
+        response = client.post("/api/uploads/", {
+            "filename": "same.mp3", "length": len(self.body), "sha256": self.digest.upper(),
+        }, format="json")
+        self.assertEqual(response.data["offset"], len(self.body))
+
+        finalized = client.post(f"/api/uploads/{response.data['id']}/finalize/", {}, format="json")
+
+        self.assertEqual(Track.objects.get(pk=finalized.data["id"]).audio_file.name, existing.audio_file.name)
+        self.assertEqual(AudioBlob.objects.get().refcount, 2)
+
+    def test_declared_digest_is_verified(self):
+        client = self.client_for(self.bob)
+        response = client.post("/api/uploads/", {
+            "filename": "song.mp3", "length": len(self.body), "sha256": "0" * 64,
+        }, format="json")
+        url = f"/api/uploads/{response.data['id']}/"
+        client.generic("PATCH", url, self.body, content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET="0")
+
+        self.assertEqual(client.post(url + "finalize/", {}, format="json").status_code, 400)
+        self.assertFalse(Track.objects.exists())
+
+    def test_blobs_stream_with_digest_etag(self):
+        track = self.upload(self.alice)
+
+        response = self.client_for(self.bob).get(f"/api/tracks/{track.pk}/stream/")
+
+        self.assertEqual(response["ETag"], f'"{self.digest}"')
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+# --- Library snapshot ---
+
+class LibrarySnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        cls.artist = Artist.objects.create(name="Daft Punk")
+        cls.genre = Genre.objects.create(name="house")
+        cls.track = Track.objects.create(
+            title="Digital Love", artist=cls.artist, uploaded_by=cls.user, duration=datetime.timedelta(seconds=301)
+        )
+        cls.track.genres.add(cls.genre)
+        cls.online = onlineTrack.objects.create(user=cls.user, title="Aerodynamic", artist=cls.artist, source="jamendo")
+        cls.playlist = Playlist.objects.create(user=cls.user, name="Mix")
+        cls.item = PlaylistItem.objects.create(playlist=cls.playlist, online_track=cls.online)
+        FavoriteTrack.objects.create(user=cls.user, track=cls.track)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self):
+        return self.client.get("/api/library/")["ETag"]
+
+    def test_returns_whole_library(self):
+        response = self.client.get("/api/library/")
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body["tracks"][0]["title"], "Digital Love")
+        self.assertEqual(body["tracks"][0]["artist"], "Daft Punk")
+        self.assertEqual(body["tracks"][0]["genres"], ["house"])
+        self.assertEqual(body["tracks"][0]["duration"], 301)
+        self.assertEqual(body["online_tracks"][0]["title"], "Aerodynamic")
+        self.assertEqual(
+            body["playlists"][0]["items"],
+            [{"id": self.item.pk, "track": None, "online_track": self.online.pk, "rank": self.item.rank}],
+        )
+        self.assertEqual(body["favorites"][0]["track"], self.track.pk)
+
+    def test_unchanged_library_is_a_304_after_one_query(self):
+        etag = self.etag()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/library/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_unchanged_revision_is_served_from_cache(self):
+        self.etag()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/library/")
+
+        self.assertEqual(len(queries), 1)
+
+    def test_writes_change_the_etag(self):
+        writes = [
+            lambda: Track.objects.filter(pk=self.track.pk).first().save(),
+            lambda: self.track.tags.add(Tag.objects.create(name="chill")),
+            lambda: PlaylistItem.objects.create(playlist=self.playlist, track=self.track),
+            lambda: FavoriteTrack.objects.filter(user=self.user).delete(),
+            lambda: Artist.objects.filter(pk=self.artist.pk).first().save(),
+            lambda: self.client.post("/api/online-tracks/bulk/", [{"title": "Veridis Quo"}], format="json"),
+            lambda: self.online.delete(),
+        ]
+        for write in writes:
+            etag = self.etag()
+            write()
+            self.assertNotEqual(self.etag(), etag)
+
+    def test_deleting_a_user_drops_their_library(self):
+        self.user.delete()
+
+        self.assertFalse(LibraryRevision.objects.filter(user_id=self.user.pk).exists())
+
+    def test_other_users_writes_keep_the_etag(self):
+        etag = self.etag()
+
+        onlineTrack.objects.create(user=self.other, title="Something")
+        Playlist.objects.create(user=self.other, name="Theirs")
+
+        self.assertEqual(self.etag(), etag)
+
+
+class LibrarySyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.online = onlineTrack.objects.create(user=cls.user, title="Aerodynamic")
+        cls.playlist = Playlist.objects.create(user=cls.user, name="Mix")
+        cls.item = PlaylistItem.objects.create(playlist=cls.playlist, online_track=cls.online)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.since = json.loads(self.client.get("/api/library/").content)["revision"]
+
+    def sync(self, since=None):
+        return self.client.get("/api/library/sync/", {"since": self.since if since is None else since}).data
+
+    def test_malformed_since_is_rejected(self):
+        for since in ("abc", "\u00b2", "-1"):
+            response = self.client.get("/api/library/sync/", {"since": since})
+
+            self.assertEqual(response.status_code, 400, since)
+
+    def test_unchanged_library_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            changes = self.sync()
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(changes["revision"], self.since)
+        self.assertEqual(changes["online_tracks"], {"upserted": [], "deleted": []})
+
+    def test_returns_only_what_changed(self):
+        self.client.post("/api/favorites/", {"online_track": self.online.pk}, format="json")
+
+        changes = self.sync()
+
+        self.assertEqual([row["online_track"] for row in changes["favorites"]["upserted"]], [self.online.pk])
+        self.assertEqual(changes["online_tracks"]["upserted"], [])
+        self.assertEqual(changes["playlists"]["upserted"], [])
+        self.assertEqual(self.sync(changes["revision"])["favorites"]["upserted"], [])
+
+    def test_deletes_leave_tombstones(self):
+        self.client.delete(f"/api/online-tracks/{self.online.pk}/")
+        self.client.delete(f"/api/playlists/{self.playlist.pk}/")
+
+        changes = self.sync()
+
+        self.assertEqual(changes["online_tracks"]["deleted"], [self.online.pk])
+        self.assertEqual(changes["playlists"]["deleted"], [self.playlist.pk])
+        self.assertEqual(changes["playlist_items"]["deleted"], [self.item.pk])
+
+    def test_deleting_a_playlist_logs_its_items_at_once(self):
+        def delete_playlist_of(size):
+            playlist = Playlist.objects.create(user=self.user, name=f"{size} items")
+            items = [PlaylistItem.objects.create(playlist=playlist, online_track=self.online) for _ in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                playlist.delete()
+            return len(queries), [item.pk for item in items]
+
+        small, _ = delete_playlist_of(2)
+        large, item_ids = delete_playlist_of(20)
+
+        self.assertEqual(large, small)
+        self.assertTrue(set(item_ids) <= set(self.sync()["playlist_items"]["deleted"]))
+
+    def test_label_renames_resend_the_tracks_showing_them(self):
+        artist = Artist.objects.create(name="Daft Punk")
+        onlineTrack.objects.filter(pk=self.online.pk).update(artist=artist)
+        since = self.sync()["revision"]
+
+        artist.name = "Daft Punk (FR)"
+        artist.save()
+
+        self.assertEqual(self.sync(since)["online_tracks"]["upserted"][0]["artist"], "Daft Punk (FR)")
+
+    @override_settings(LIBRARY_SYNC_PAGE_SIZE=2)
+    def test_pages_never_split_a_revision(self):
+        Playlist.objects.create(user=self.user, name="One")
+        self.client.post("/api/online-tracks/bulk/", [{"title": f"song {i}"} for i in range(3)], format="json")
+
+        first = self.sync()
+        second = self.sync(first["revision"])
+
+        self.assertTrue(first["more"])
+        self.assertEqual(len(first["playlists"]["upserted"]), 1)
+        self.assertEqual(len(second["online_tracks"]["upserted"]), 3)
+        self.assertEqual(self.sync(second["revision"])["online_tracks"]["upserted"], [])
+
+    def test_pruned_tombstones_force_a_reset(self):
+        self.client.delete(f"/api/online-tracks/{self.online.pk}/")
+        LibraryChange.objects.filter(deleted=True).update(changed_at=timezone.now() - datetime.timedelta(days=60))
+
+        call_command("prune_library_changes", stdout=io.StringIO())
+
+        self.assertFalse(LibraryChange.objects.filter(deleted=True).exists())
+        self.assertTrue(self.sync()["reset"])
+        fresh = json.loads(self.client.get("/api/library/").content)["revision"]
+        self.assertFalse(self.sync(fresh)["reset"])
+
+    def test_rejects_malformed_tokens(self):
+        response = self.client.get("/api/library/sync/", {"since": "yesterday"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+# --- Favorites membership ---
+
+class FavoritesMembershipTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.tracks = [Track.objects.create(title=f"track {i}") for i in range(4)]
+        cls.online = [onlineTrack.objects.create(user=cls.user, title=f"song {i}") for i in range(4)]
+        FavoriteTrack.objects.create(user=cls.user, track=cls.tracks[1])
+        FavoriteTrack.objects.create(user=cls.user, online_track=cls.online[2])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def contains(self, tracks=(), online_tracks=()):
+        return self.client.get("/api/favorites/contains/", {
+            "tracks": ",".join(str(track.pk) for track in tracks),
+            "online_tracks": ",".join(str(track.pk) for track in online_tracks),
+        })
+
+    def test_reports_favorited_ids(self):
+        response = self.contains(self.tracks, self.online)
+
+        self.assertEqual(response.data, {"tracks": [self.tracks[1].pk], "online_tracks": [self.online[2].pk]})
+
+    def test_cached_lookups_skip_the_database(self):
+        self.contains(self.tracks)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.contains(self.tracks, self.online)
+
+        self.assertEqual(len(queries), 0)
+
+    def test_favoriting_and_unfavoriting_update_membership_in_place(self):
+        self.contains(self.tracks)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/favorites/", {"track": self.tracks[3].pk}, format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteTrack.objects.filter(online_track=self.online[2]).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.contains(self.tracks, self.online)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.data, {"tracks": [self.tracks[1].pk, self.tracks[3].pk], "online_tracks": []})
+
+    def test_changing_a_favorite_rebuilds_membership(self):
+        favorite = FavoriteTrack.objects.get(track=self.tracks[1])
+        self.contains(self.tracks)
+
+        favorite.track = self.tracks[0]
+        favorite.save()
+
+        self.assertEqual(self.contains(self.tracks).data["tracks"], [self.tracks[0].pk])
+
+    def test_rejects_malformed_ids(self):
+        for tracks in ("1,two", "1,\u00b2", "0", "-3"):
+            response = self.client.get("/api/favorites/contains/", {"tracks": tracks})
+
+            self.assertEqual(response.status_code, 400, tracks)
+
+
+# --- Reference data cache ---
+
+class ReferenceCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.genres = [Genre.objects.create(name=f"genre {i}") for i in range(5)]
+        cls.tags = [Tag.objects.create(name=f"tag {i}") for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_served_from_cache_with_etag(self):
+        first = self.client.get("/api/genres/")
+        self.assertEqual([row["name"] for row in json.loads(first.content)], [genre.name for genre in self.genres])
+
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get("/api/genres/")
+            unchanged = self.client.get("/api/genres/", HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(unchanged.status_code, 304)
+
+    def test_writes_replace_the_version(self):
+        etag = self.client.get("/api/tags/")["ETag"]
+
+        self.client.post("/api/tags/", {"name": "fresh"}, format="json")
+
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("fresh", [row["name"] for row in json.loads(response.content)])
+
+    def test_label_names_resolve_without_a_query_each(self):
+        def save(count):
+            title = f"song {onlineTrack.objects.count()} with {count}"
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post("/api/online-tracks/", {
+                    "title": title,
+                    "genres": [genre.name for genre in self.genres[:count]],
+                    "tags": [tag.name for tag in self.tags[:count]],
+                }, format="json")
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        save(1)  # Warms the cache.
+        self.assertEqual(save(5), save(1))
+        self.assertEqual(onlineTrack.objects.get(title="song 1 with 5").genres.count(), 5)
+
+    def test_unknown_names_are_rejected(self):
+        response = self.client.post("/api/online-tracks/", {"title": "song", "genres": ["polka"]}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("genres", response.data)
+
+    def test_artists_are_looked_up_by_name_not_cached_whole(self):
+        etag = self.client.get("/api/genres/")["ETag"]
+        Artist.objects.create(name="Daft Punk")
+
+        with CaptureQueriesContext(connection) as queries:
+            artists = resolve_artists(["Daft Punk", "Justice"])
+
+        # One lookup of the batch's names and one insert, whatever the catalog size.
+        self.assertEqual(len(queries), 2)
+        self.assertIn('"name" IN', queries[0]["sql"])
+        self.assertEqual(set(artists), {"Daft Punk", "Justice"})
+        self.assertEqual(self.client.get("/api/genres/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    LOCAL = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    REDIS = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache:6379"}}
+
+    def test_process_local_cache_is_rejected_when_required(self):
+        with override_settings(REQUIRE_SHARED_CACHE=True, CACHES=self.LOCAL):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ["music.E001"])
+        with override_settings(REQUIRE_SHARED_CACHE=True, CACHES=self.REDIS):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(REQUIRE_SHARED_CACHE=False, CACHES=self.LOCAL):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+# --- Response fragments ---
+
+# Counts calls into the serializer; LeanRowsTests covers the lean rows.
+@override_settings(LEAN_ROWS=False)
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.genre = Genre.objects.create(name="house")
+        cls.artist = Artist.objects.create(name="Daft Punk")
+        cls.tracks = []
+        for i in range(5):
+            track = onlineTrack.objects.create(user=cls.user, title=f"song {i}", artist=cls.artist, source="jamendo")
+            track.genres.add(cls.genre)
+            cls.tracks.append(track)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def serialized(self, **params):
+        with mock.patch.object(
+            OnlineTrackSerializer, "to_representation", autospec=True, side_effect=OnlineTrackSerializer.to_representation
+        ) as serialize:
+            response = self.client.get("/api/online-tracks/", params)
+        self.assertEqual(response.status_code, 200)
+        return response, serialize.call_count
+
+    def test_list_is_rendered_as_before_and_cached(self):
+        first, count = self.serialized()
+        self.assertEqual(count, 5)
+
+        tracks = onlineTrack.objects.filter(user=self.user).order_by("-saved_at", "-id")
+        expected = DRFJSONRenderer().render({
+            "count": 5,
+            "next": None,
+            "previous": None,
+            "results": OnlineTrackSerializer(tracks, many=True).data,
+        })
+        self.assertEqual(first.content, expected)
+
+        with CaptureQueriesContext(connection) as queries:
+            again, count = self.serialized()
+        self.assertEqual(count, 0)
+        self.assertEqual(len(queries), 2)  # COUNT(*) and the page
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again.data["results"][0]["title"], "song 4")
+
+    def test_writes_reserialize_only_what_changed(self):
+        self.serialized()
+
+        self.client.patch(f"/api/online-tracks/{self.tracks[0].pk}/", {"title": "renamed"}, format="json")
+        response, count = self.serialized()
+        self.assertEqual(count, 1)
+        self.assertEqual(response.data["results"][-1]["title"], "renamed")
+
+        self.tracks[1].genres.add(Genre.objects.create(name="disco"))
+        response, count = self.serialized()
+        self.assertEqual(count, 1)
+        self.assertEqual(response.data["results"][-2]["genres"], ["house", "disco"])
+
+        self.artist.name = "Thomas Bangalter"
+        self.artist.save()
+        response, count = self.serialized()
+        self.assertEqual(count, 5)
+        self.assertEqual({row["artist"] for row in response.data["results"]}, {"Thomas Bangalter"})
+
+    def test_retrieve_sees_queryset_updates_that_forget(self):
+        track = Track.objects.create(title="upload", uploaded_by=self.user)
+        self.assertEqual(self.client.get(f"/api/tracks/{track.pk}/").data["analysis_status"], "pending")
+
+        analyze_track(track.pk)  # no audio: fails, through a queryset update
+
+        response = self.client.get(f"/api/tracks/{track.pk}/")
+        self.assertEqual(response.data["analysis_status"], "failed")
+
+    def test_playlist_index_follows_aggregate_refreshes(self):
+        playlist = Playlist.objects.create(user=self.user, name="mix")
+        self.assertEqual(self.client.get("/api/playlists/").data[0]["item_count"], 0)
+
+        self.client.post(
+            f"/api/playlists/{playlist.pk}/add-tracks/",
+            {"items": [{"online_track": track.pk} for track in self.tracks]},
+            format="json",
+        )
+
+        self.assertEqual(self.client.get("/api/playlists/").data[0]["item_count"], 5)
+
+
+class LeanRowsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        genres = [Genre.objects.create(name=name) for name in ("house", "disco")]
+        tags = [Tag.objects.create(name=name) for name in ("chill", "live")]
+        artist = Artist.objects.create(name="Daft Punk")
+        album = Album.objects.create(title="Discovery", artist=artist, release_date=datetime.date(2001, 3, 12))
+
+        full = Track.objects.create(
+            title="One More Time", file="tracks/one.mp3", audio_file="blobs/ab/" + "a" * 64 + ".mp3",
+            duration=datetime.timedelta(minutes=5, seconds=20, microseconds=500), artist=artist, album=album,
+            uploaded_by=cls.user, stream_url="https://example.com/one", bitrate=320, codec="mp3",
+        )
+        full.genres.add(genres[1], genres[0])
+        full.tags.add(*tags)
+        Track.objects.create(uploaded_by=cls.user)
+
+        online = onlineTrack.objects.create(
+            user=cls.user, title="Aerodynamic", artist=artist, album=album, source="jamendo",
+            stream_url="https://example.com/aero", thumbnail="https://example.com/aero.jpg",
+        )
+        online.genres.add(genres[1], genres[0])
+        online.tags.add(tags[0])
+        onlineTrack.objects.create(user=cls.user, title="Untitled")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_lists_are_unchanged(self):
+        for url in ("/api/tracks/?ordering=title", "/api/online-tracks/", "/api/tracks/?pagination=cursor"):
+            responses = []
+            for lean in (False, True):
+                cache.clear()
+                with override_settings(LEAN_ROWS=lean):
+                    responses.append(self.client.get(url))
+            self.assertEqual(responses[0].status_code, 200)
+            self.assertEqual(responses[1].content, responses[0].content, url)
+
+    def test_rows_match_the_serializers(self):
+        request = APIRequestFactory().get("/api/tracks/")
+        context = {"request": Request(request)}
+        for view in (TrackViewSet, onlineTrackViewSet):
+            queryset = view.fragment_queryset.order_by("pk")
+            expected = view.serializer_class(queryset, many=True, context=context).data
+            self.assertEqual(
+                DRFJSONRenderer().render(view.lean_rows(queryset, context)), DRFJSONRenderer().render(expected)
+            )
+
+    def test_lean_rows_take_one_query(self):
+        with self.assertNumQueries(1):
+            lean_online_track_rows(onlineTrack.objects.all(), {})
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("benchmark_list_rows", rows=20, repeat=1, stdout=out)
+
+        self.assertIn("rows/s", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith="benchmark-").exists())
+
+
+class RendererTests(SimpleTestCase):
+
+    def test_fragments_are_spliced(self):
+        data = {"next": None, "results": FragmentList([Fragment(b'{"id":1}'), Fragment(b'{"id":2}')])}
+
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            self.assertEqual(renderer.render(data), b'{"next":null,"results":[{"id":1},{"id":2}]}')
+        self.assertEqual(DRFJSONRenderer().render(data), b'{"next":null,"results":[{"id":1},{"id":2}]}')
+
+    def test_orjson_matches_drf(self):
+        data = {
+            "when": datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc),
+            "price": decimal.Decimal("1.50"),
+            "detail": gettext_lazy("Not found."),
+            "nested": [{"a": 1, "b": "é"}],
+            1: "key",
+        }
+
+        self.assertEqual(ORJSONRenderer().render(data), DRFJSONRenderer().render(data))
+
+
+# --- Async views ---
+
+class StubProvider(search.SearchProvider):
+    # A SearchProvider over a StubProviderServer, for the async client.
+
+    def __init__(self, server, name):
+        self.url = server.url
+        self.name = name
+
+    def params(self, query, limit):
+        return {"q": query}
+
+    def parse(self, data, limit):
+        return [{"title": item, "source": self.name} for item in data["items"]][:limit]
+
+
+class AsyncProviderClientTests(SimpleTestCase):
+
+    async def test_connections_are_kept_alive_and_pooled(self):
+        client = AsyncProviderClient()
+        with StubProviderServer({"items": []}) as server:
+            for _ in range(5):
+                await client.get(server.url, params={"q": "x"})
+            await client.aclose()
+
+        self.assertEqual(server.requests, 5)
+        self.assertEqual(server.connections, 1)
+
+    async def test_5xx_and_429_are_retried(self):
+        client = AsyncProviderClient(retries=2, backoff_factor=0, backoff_jitter=0)
+        with StubProviderServer({"items": ["x"]}, status=[503, 429, 200]) as server:
+            response = await client.get(server.url)
+            await client.aclose()
+
+        self.assertEqual(response.json(), {"items": ["x"]})
+        self.assertEqual(server.requests, 3)
+
+    async def test_error_status_raises_after_retries(self):
+        client = AsyncProviderClient(retries=1, backoff_factor=0, backoff_jitter=0)
+        with StubProviderServer({}, status=500) as server:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await client.get(server.url)
+            await client.aclose()
+
+        self.assertEqual(server.requests, 2)
+
+    async def test_hung_provider_hits_read_timeout(self):
+        client = AsyncProviderClient(timeout=(1, 0.2))
+        with StubProviderServer({}, delay=1) as server:
+            started = time.monotonic()
+            with self.assertRaises(httpx.ReadTimeout):
+                await client.get(server.url)
+            elapsed = time.monotonic() - started
+            await client.aclose()
+
+        self.assertLess(elapsed, 0.8)
+
+
+@override_settings(SEARCH_DEFAULT_DEADLINE=2.0, SEARCH_PROVIDER_DEADLINES={}, SEARCH_CONCURRENT_SEARCHES=1)
+class AsyncFanOutTests(SimpleTestCase):
+
+    def setUp(self):
+        get_search_cache().clear()
+
+    async def test_searches_in_flight_are_not_bound_by_threads(self):
+        # 100 searches of 0.5s each: at least 12.5s on four threads.
+        with StubProviderServer({"items": ["a"]}, delay=0.5) as server:
+            provider = StubProvider(server, "stub")
+            started = time.monotonic()
+            answers = await asyncio.gather(*(afan_out(f"q{i}", {"stub": provider}) for i in range(100)))
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 3.0)
+        self.assertEqual({answer[1]["stub"]["status"] for answer in answers}, {"ok"})
+        self.assertEqual(server.requests, 100)
+
+    @override_settings(SEARCH_PROVIDER_DEADLINES={"slow": 0.3})
+    async def test_slow_provider_is_cut_off_at_its_deadline(self):
+        with StubProviderServer({"items": ["fast"]}, delay=0.05) as fast, \
+             StubProviderServer({"items": ["slow"]}, delay=1.5) as slow:
+            started = time.monotonic()
+            results, status = await afan_out("q", {
+                "fast": StubProvider(fast, "fast"),
+                "slow": StubProvider(slow, "slow"),
+            })
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(results, [{"title": "fast", "source": "fast"}])
+        self.assertEqual(status["slow"]["status"], "timeout")
+
+    async def test_results_are_yielded_in_completion_order(self):
+        with StubProviderServer({"items": ["late"]}, delay=0.4) as late, \
+             StubProviderServer({"items": ["early"]}, delay=0.05) as early:
+            names = [name async for name, _, _ in aiter_fan_out("q", {
+                "late": StubProvider(late, "late"),
+                "early": StubProvider(early, "early"),
+            })]
+
+        self.assertEqual(names, ["early", "late"])
+
+    async def test_sync_searches_and_failures(self):
+        with StubProviderServer({"items": ["ok"]}) as good, \
+             StubProviderServer({}, status=500) as bad:
+            results, status = await afan_out("q", {
+                "echo": EchoProvider(),
+                "good": stub_search(good, "good"),
+                "bad": StubProvider(bad, "bad"),
+            })
+
+        self.assertEqual(results, [{"title": "q", "source": "echo"}, {"title": "ok", "source": "good"}])
+        self.assertEqual(status["bad"]["status"], "error")
+
+    async def test_cached_results_skip_the_providers(self):
+        with StubProviderServer({"items": ["a"]}) as server:
+            await afan_out("q", {"stub": StubProvider(server, "stub")})
+            results, status = await afan_out("q", {"stub": StubProvider(server, "stub")})
+
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(results, [{"title": "a", "source": "stub"}])
+        self.assertEqual(status["stub"]["cache"], "hit")
+
+
+@override_settings(
+    SEARCH_PROVIDERS=["music.tests.SleepyProvider", "music.tests.EchoProvider"],
+    SEARCH_DEFAULT_DEADLINE=2.0,
+    SEARCH_PROVIDER_DEADLINES={},
+)
+class AsyncViewTests(TemporaryMediaTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("listener", password="pw")
+        cls.body = bytes(range(256)) * 4
+        cls.track = Track.objects.create(
+            title="song", uploaded_by=cls.user,
+            audio_file=SimpleUploadedFile("song.mp3", cls.body, content_type="audio/mpeg"),
+        )
+
+    def setUp(self):
+        get_search_cache().clear()
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    async def content(self, response):
+        return b"".join([chunk async for chunk in response])
+
+    async def test_search_matches_the_sync_view(self):
+        response = await AsyncSongSearchView.as_view()(self.factory.get("/api/search/", {"q": "hello"}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [
+            {"title": "hello slowly", "source": "sleepy"},
+            {"title": "hello", "source": "echo"},
+        ])
+
+    async def test_search_rejects_bad_parameters(self):
+        view = AsyncSongSearchView.as_view()
+
+        self.assertEqual((await view(self.factory.get("/api/search/"))).status_code, 400)
+        response = await view(self.factory.get("/api/search/", {"q": "x", "stream": "xml"}))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_search_streams_ndjson(self):
+        response = await AsyncSongSearchView.as_view()(self.factory.get("/api/search/", {"q": "hi", "stream": "ndjson"}))
+
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) for line in (await self.content(response)).splitlines()]
+        self.assertEqual([line.get("provider") for line in lines], ["echo", "sleepy", None])
+        self.assertEqual(lines[-1], {"done": True})
+
+    async def test_stream_range_needs_a_user(self):
+        view = AsyncTrackStreamView.as_view()
+        url = f"/api/tracks/{self.track.pk}/stream/"
+
+        self.assertEqual((await view(self.factory.get(url), pk=self.track.pk)).status_code, 401)
+
+        request = self.factory.get(url, {"token": make_stream_token(self.user)}, HTTP_RANGE="bytes=10-19")
+        response = await view(request, pk=self.track.pk)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(await self.content(response), self.body[10:20])
+
+    async def test_stream_whole_file(self):
+        request = self.factory.get(f"/api/tracks/{self.track.pk}/stream/")
+        force_authenticate(request, self.user)
+        response = await AsyncTrackStreamView.as_view()(request, pk=self.track.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Length"], str(len(self.body)))
+        self.assertEqual(await self.content(response), self.body)
+
+    async def test_missing_track_is_404(self):
+        request = self.factory.get("/api/tracks/0/stream/")
+        force_authenticate(request, self.user)
+
+        self.assertEqual((await AsyncTrackStreamView.as_view()(request, pk=0)).status_code, 404)
+
+    async def test_missing_file_is_404(self):
+        track = await Track.objects.acreate(title="gone", uploaded_by=self.user, audio_file="tracks/gone.mp3")
+        request = self.factory.get(f"/api/tracks/{track.pk}/stream/")
+        force_authenticate(request, self.user)
+
+        self.assertEqual((await AsyncTrackStreamView.as_view()(request, pk=track.pk)).status_code, 404)
+
+    async def test_library_snapshot_and_304(self):
+        view = AsyncLibrarySnapshotView.as_view()
+        request = self.factory.get("/api/library/")
+        force_authenticate(request, self.user)
+        response = await view(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["tracks"][0]["title"], "song")
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        request = self.factory.get("/api/library/", HTTP_IF_NONE_MATCH=response["ETag"])
+        force_authenticate(request, self.user)
+        self.assertEqual((await view(request)).status_code, 304)
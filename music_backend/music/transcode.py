@@ -0,0 +1,102 @@
+import shutil
+from threading import BoundedSemaphore, Lock
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .audio import analyze_track
+from .encoding import encode_hls_rendition
+from .models import Track, TrackRendition
+from .tasks import run_task
+
+HLS_PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+
+_encode_slots = None
+_encode_slots_lock = Lock()
+
+
+def get_encode_slots():
+    # ffmpeg is CPU bound: TRANSCODE_WORKERS caps how many encodes run at
+    # once, however many task threads are transcoding.
+    global _encode_slots
+    with _encode_slots_lock:
+        if _encode_slots is None:
+            _encode_slots = BoundedSemaphore(getattr(settings, "TRANSCODE_WORKERS", 2))
+    return _encode_slots
+
+
+def rendition_dir(track_id, bitrate=None):
+    """Storage-relative directory of a track's HLS output."""
+    parts = ["hls", str(track_id)] + ([str(bitrate)] if bitrate is not None else [])
+    return "/".join(parts)
+
+
+def plan_bitrates(track):
+    # No point encoding above the source: keep the ladder below the
+    # uploaded bitrate (when analysis has found it), but always one rung.
+    ladder = sorted(set(getattr(settings, "HLS_BITRATES", [64, 128, 256])))
+    if track.bitrate:
+        return [bitrate for bitrate in ladder if bitrate <= track.bitrate] or ladder[:1]
+    return ladder
+
+
+def analyze_and_transcode(track_id):
+    """
+    Analyze an upload, then queue its transcoding as a task of its own:
+    the ladder needs the analyzed bitrate (see plan_bitrates), but the
+    analysis shouldn't wait behind the encodes.
+    """
+    analyze_track(track_id)
+    run_task(transcode_track, track_id)
+
+
+def transcode_track(track_id):
+    """
+    Encode every bitrate rendition of an uploaded track, one after another,
+    and record each as a TrackRendition. Any previous renditions are
+    replaced. Runs on the task backend.
+    """
+    track = Track.objects.filter(pk=track_id).first()
+    audio = track and (track.audio_file or track.file)
+    if not audio:
+        return []
+
+    TrackRendition.objects.filter(track=track).delete()
+    shutil.rmtree(default_storage.path(rendition_dir(track.pk)), ignore_errors=True)
+    renditions = TrackRendition.objects.bulk_create([
+        TrackRendition(track=track, bitrate=bitrate) for bitrate in plan_bitrates(track)
+    ])
+
+    for rendition in renditions:
+        try:
+            with get_encode_slots():
+                encode_hls_rendition(
+                    getattr(settings, "FFMPEG_BINARY", "ffmpeg"),
+                    audio.path,
+                    default_storage.path(rendition_dir(track.pk, rendition.bitrate)),
+                    rendition.bitrate,
+                    getattr(settings, "HLS_SEGMENT_SECONDS", 6),
+                    getattr(settings, "TRANSCODE_TIMEOUT", 600),
+                )
+        except Exception as exc:
+            rendition.status = TrackRendition.Status.FAILED
+            rendition.error = str(exc)
+        else:
+            rendition.status = TrackRendition.Status.READY
+            rendition.playlist = f"{rendition_dir(track.pk, rendition.bitrate)}/index.m3u8"
+        rendition.save(update_fields=["status", "error", "playlist"])
+    return renditions
+
+
+def read_playlist(rendition):
+    with default_storage.open(rendition.playlist, "r") as f:
+        return f.read()
+
+
+def rewrite_playlist(text, url_for):
+    """Replace every URI line of an m3u8 playlist with ``url_for(uri)``."""
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        lines.append(url_for(stripped) if stripped and not stripped.startswith("#") else line)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import AudioBlob, ChunkedUpload
+from .storage import get_blob_storage
+
+READ_SIZE = 1024 * 1024
+
+
+class UploadConflict(APIException):
+    status_code = 409
+    default_detail = "The upload is not in the expected state."
+    default_code = "upload_conflict"
+
+
+def part_name(upload):
+    return f"{getattr(settings, 'UPLOAD_TEMP_DIR', 'uploads')}/{upload.pk}.part"
+
+
+def part_path(upload):
+    return default_storage.path(part_name(upload))
+
+
+def start_upload(upload):
+    # Bytes we already store needn't be sent again: the upload starts out
+    # complete, ready to finalize. (Knowing a digest grants nothing extra:
+    # every user can already stream every uploaded track.)
+    if known_blob(upload) is not None:
+        upload.offset = upload.length
+        upload.save(update_fields=["offset"])
+        return
+    # Otherwise an empty .part file, so every chunk is a plain seek-and-write.
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def receive_chunk(upload, stream, offset, size):
+    """
+    Write ``size`` bytes from ``stream`` at ``offset`` of the upload's .part
+    file, straight to disk in READ_SIZE pieces. Returns the new offset.
+
+    Whatever arrived is kept even if the client drops mid-chunk, so it can
+    resume from there. The offset moves with a compare-and-set, so of two
+    racing PATCHes at the same offset only one wins; the other gets a 409.
+    """
+    written = 0
+    try:
+        with open(part_path(upload), "r+b") as f:
+            f.seek(offset)
+            while written < size:
+                chunk = stream.read(min(READ_SIZE, size - written))
+                if not chunk:
+                    break
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        moved = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset, track__isnull=True).update(
+            offset=offset + written
+        )
+    if not moved:
+        raise UploadConflict("The upload was changed by another request.")
+    upload.offset = offset + written
+    return upload.offset
+
+
+def assemble(upload):
+    """
+    Turn a completed upload into a stored audio file and return its storage
+    name. The .part file is hashed in one pass and renamed into the blob
+    store (nothing is copied), or dropped if those bytes are already
+    stored. Uploads that skipped sending bytes because their declared
+    SHA-256 was known resolve straight to the existing blob.
+    """
+    storage = get_blob_storage()
+    ext = os.path.splitext(upload.filename)[1]
+    if not os.path.exists(part_path(upload)):
+        blob = AudioBlob.objects.filter(digest=upload.sha256).first() if upload.sha256 else None
+        if blob is None:
+            raise UploadConflict("The upload's data is gone; please upload it again.")
+        return blob.name
+    try:
+        return storage.ingest_file(part_path(upload), ext, expected_digest=upload.sha256 or None)
+    except ValueError as exc:
+        raise ValidationError(str(exc))
+
+
+def known_blob(upload):
+    """The stored blob matching the upload's declared SHA-256 and length, if any."""
+    if not upload.sha256:
+        return None
+    return AudioBlob.objects.filter(digest=upload.sha256, size=upload.length).first()
+
+
+def discard(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
@@ -1,12 +1,14 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ArtistViewSet, AlbumViewSet, TrackViewSet , UserViewSet , RegisterView ,SongSearchView , onlineTrackViewSet ,PlaylistItemViewSet, PlaylistViewSet, GenreViewSet, TagViewSet , FavoriteTrackViewSet
+from .views import ArtistViewSet, AlbumViewSet, TrackViewSet , UploadViewSet , UserViewSet , RegisterView ,SongSearchView , SearchCacheStatsView , LibrarySearchView , LibrarySnapshotView , LibrarySyncView , onlineTrackViewSet ,PlaylistItemViewSet, PlaylistViewSet, GenreViewSet, TagViewSet , FavoriteTrackViewSet , AsyncSongSearchView , AsyncLibrarySnapshotView , AsyncTrackStreamView
 
 
 router = DefaultRouter()
 router.register(r'artists', ArtistViewSet)
 router.register(r'albums', AlbumViewSet)
 router.register(r'tracks', TrackViewSet)
+router.register(r'uploads', UploadViewSet, basename='upload')
 router.register(r'users', UserViewSet)
 router.register(r'online-tracks', onlineTrackViewSet, basename='online-track')
 router.register(r'playlists', PlaylistViewSet, basename='playlist')
@@ -19,8 +21,21 @@ router.register(r'favorites', FavoriteTrackViewSet, basename='favorite')
 
 
 
-urlpatterns = [
+# Under ASGI (see music_backend/asgi.py) the I/O-bound endpoints are served
+# by coroutines; the responses are the same.
+if settings.ASYNC_VIEWS:
+    song_search_view, library_snapshot_view = AsyncSongSearchView, AsyncLibrarySnapshotView
+    async_patterns = [path('tracks/<int:pk>/stream/', AsyncTrackStreamView.as_view())]
+else:
+    song_search_view, library_snapshot_view = SongSearchView, LibrarySnapshotView
+    async_patterns = []
+
+urlpatterns = async_patterns + [
     path('', include(router.urls)),
     path('register/', RegisterView.as_view(), name='register'),
-    path("search/", SongSearchView.as_view(), name="song-search"),
+    path("search/", song_search_view.as_view(), name="song-search"),
+    path("search/cache-stats/", SearchCacheStatsView.as_view(), name="song-search-cache-stats"),
+    path("library/", library_snapshot_view.as_view(), name="library-snapshot"),
+    path("library/sync/", LibrarySyncView.as_view(), name="library-sync"),
+    path("library/search/", LibrarySearchView.as_view(), name="library-search"),
 ]
@@ -1,25 +1,47 @@
-from rest_framework import viewsets, permissions, generics
+import inspect
+
+from rest_framework import viewsets, mixins, permissions, generics, serializers, status
 from rest_framework.parsers import MultiPartParser, FormParser ,JSONParser  
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 from django_filters import rest_framework as filters
-from rest_framework.exceptions import ValidationError , PermissionDenied
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError , PermissionDenied, NotAuthenticated, NotFound, UnsupportedMediaType
 from rest_framework.decorators import action
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User 
-
-from .models import Artist, Album, Track , onlineTrack , Genre, Tag ,PlaylistItem, Playlist ,FavoriteTrack
-from .serializers import ArtistSerializer,AlbumSerializer,TrackSerializer,UserSerializer,RegisterSerializer,OnlineTrackSerializer,GenreSerializer,TagSerializer , PlaylistItemSerializer, PlaylistSerializer , FavoriteTrackSerializer
-from .search import search_youtube, search_jamendo, search_mixcloud ,search_audius
-
-# --- Pagination ---
-class TrackPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 50
+from django.db import transaction
+from django.db.models import Prefetch
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+
+from .models import Artist, Album, Track , TrackRendition, TrackWaveform, onlineTrack , Genre, Tag ,PlaylistItem, Playlist ,FavoriteTrack, ChunkedUpload
+from .serializers import ArtistSerializer,AlbumSerializer,TrackSerializer,UserSerializer,RegisterSerializer,OnlineTrackSerializer,GenreSerializer,TagSerializer , PlaylistItemSerializer, PlaylistSerializer , PlaylistSummarySerializer, PlaylistAddSerializer, PlaylistBatchSerializer, FavoriteTrackSerializer, OnlineTrackBulkSerializer, ChunkedUploadSerializer
+from .bulk import bulk_save_online_tracks
+from .pagination import TrackPagination, OptionalKeysetPagination
+from .tasks import enqueue
+from .uploads import UploadConflict, assemble, discard, receive_chunk, start_upload
+from .transcode import HLS_PLAYLIST_TYPE, analyze_and_transcode, read_playlist, rendition_dir, rewrite_playlist
+from .waveform import compute_waveform
+from .streaming import auser_from_stream_token, make_stream_token, stream_file, user_from_stream_token
+from .favorites import favorited
+from .fragments import serialized_fragments
+from .lean import lean_online_track_rows, lean_track_rows
+from .playlists import AT_END, add_items, item_rows, move_items, remove_items
+from .reference import reference_table
+from .snapshot import aget_library_revision, alibrary_snapshot_bytes, get_library_revision, library_etag, library_snapshot_bytes
+from .sync import library_changes
+from .search.fanout import afan_out, fan_out
+from .search.cache import get_search_cache
+from .search.merge import merge_results
+from .search.library import search_library
+from .search.streaming import STREAM_FORMATS, astream_search, stream_search
 
 # --- Filterings ---
 
@@ -38,8 +60,96 @@ class OnlineTrackFilter(FilterSet):
 
 
 
+# --- Query plans ---
+# PlaylistItemSerializer nests TrackSerializer / OnlineTrackSerializer, which
+# read the online track's artist and album and both tracks' genres and tags.
+# Loading those up front keeps serialization at a fixed number of queries
+# however many playlists and items there are.
+
+def playlist_items_queryset(queryset=None):
+    if queryset is None:
+        queryset = PlaylistItem.objects.all()
+    return queryset.select_related(
+        'track',
+        'online_track__artist',
+        'online_track__album',
+    ).prefetch_related(
+        'track__genres',
+        'track__tags',
+        'online_track__genres',
+        'online_track__tags',
+    )
+
+
+def playlists_queryset(queryset):
+    return queryset.prefetch_related(
+        Prefetch('items', queryset=playlist_items_queryset())
+    )
+
+
+def process_upload(track):
+    # Post-processing runs in the background; clients poll
+    # analysis_status and the renditions' status. Transcoding is queued
+    # once the analysis has found the bitrate its renditions depend on.
+    for task in (analyze_and_transcode, compute_waveform):
+        enqueue(task, track.pk)
+
+
 # --- ViewSets ---
 
+class CachedReferenceListMixin:
+    """
+    Lists a reference table (music.reference) from its cached, pre-encoded
+    JSON, with an ETag from the table's version: no query and no
+    serializing until the table changes, and a 304 for clients that have it.
+    """
+
+    def list(self, request, *args, **kwargs):
+        version, entry = reference_table(self.queryset.model).load()
+        etag = f'"{self.queryset.model._meta.model_name}-{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(entry['body'], content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class CachedFragmentsListMixin:
+    """
+    Lists objects from their cached serialized JSON (music.fragments):
+    only objects changed since they were last served go through the
+    serializer. ``fragment_queryset`` loads those, with what the
+    serializer reads; ``lean_rows`` (music.lean), if set and enabled by
+    LEAN_ROWS, builds the same output without the serializer.
+    """
+    fragment_queryset = None
+    lean_rows = None
+
+    def fragments(self, objects):
+        lean_rows = self.lean_rows if getattr(settings, 'LEAN_ROWS', True) else None
+        return serialized_fragments(
+            self.get_serializer_class(), objects, self.fragment_queryset.all(), self.get_serializer_context(),
+            rows=lean_rows,
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.fragments(page))
+        return Response(self.fragments(queryset))
+
+
+class CachedFragmentsMixin(CachedFragmentsListMixin):
+
+    def retrieve(self, request, *args, **kwargs):
+        rows = self.fragments([self.get_object()])
+        if not rows:
+            raise NotFound()
+        return Response(rows[0])
+
+
 class ArtistViewSet(viewsets.ModelViewSet):
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
@@ -62,37 +172,223 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
 
 
-class TrackViewSet(viewsets.ModelViewSet):
+class TrackViewSet(CachedFragmentsMixin, viewsets.ModelViewSet):
     queryset = Track.objects.all()
     serializer_class = TrackSerializer
+    fragment_queryset = Track.objects.prefetch_related(
+        Prefetch('genres', queryset=Genre.objects.order_by('pk')),
+        Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+    )
+    lean_rows = staticmethod(lean_track_rows)
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = TrackPagination
     filterset_class = TrackFilter
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['title', 'artist', 'album']
+    search_fields = ['title', 'artist__name', 'album__title']
     ordering_fields = ['title', 'duration', 'artist']
+    keyset_field = 'created_at'
+
 
+    def perform_create(self, serializer):
+        process_upload(serializer.save())
 
     def perform_update(self, serializer):
         if self.get_object().uploaded_by != self.request.user:
             raise PermissionDenied("You do not have permission to edit this track.")
-        serializer.save()
+        if 'file' in serializer.validated_data or 'audio_file' in serializer.validated_data:
+            process_upload(serializer.save(analysis_status=Track.AnalysisStatus.PENDING))
+        else:
+            serializer.save()
+
+    def authorize_stream(self, request):
+        # Audio players send Range requests without an Authorization header,
+        # so a signed ?token= from stream-token is accepted as well.
+        # Either way the user is resolved before any byte is read.
+        if request.user.is_authenticated:
+            return request.user
+        token = request.query_params.get('token')
+        user = user_from_stream_token(token) if token else None
+        if user is None:
+            raise NotAuthenticated()
+        return user
+
+    @action(detail=False, methods=['get'], url_path='stream-token')
+    def stream_token(self, request):
+        return Response({
+            'token': make_stream_token(request.user),
+            'expires_in': getattr(settings, 'STREAM_TOKEN_MAX_AGE', 6 * 60 * 60),
+        })
 
-class onlineTrackViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def stream(self, request, pk=None):
+        self.authorize_stream(request)
+        track = self.get_object()
+        audio = track.audio_file or track.file
+        if not audio:
+            raise NotFound("This track has no uploaded audio.")
+        return stream_file(request, audio.name, audio.storage)
+
+    def hls_url(self, request, track, bitrate, name):
+        url = request.build_absolute_uri(
+            reverse('track-hls-file', kwargs={'pk': track.pk, 'bitrate': bitrate, 'name': name})
+        )
+        token = request.query_params.get('token')
+        return f'{url}?{urlencode({"token": token})}' if token else url
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def hls(self, request, pk=None):
+        # Master playlist over the renditions that finished encoding. URLs
+        # are absolute and carry the caller's ?token= so native HLS players
+        # (which can't add headers) keep access.
+        self.authorize_stream(request)
+        track = self.get_object()
+        renditions = track.renditions.filter(status=TrackRendition.Status.READY).order_by('bitrate')
+        if not renditions:
+            raise NotFound("No HLS renditions are ready for this track.")
+
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+        for rendition in renditions:
+            lines.append(
+                f'#EXT-X-STREAM-INF:BANDWIDTH={rendition.bitrate * 1100},'
+                f'AVERAGE-BANDWIDTH={rendition.bitrate * 1000},CODECS="{rendition.codec}"'
+            )
+            lines.append(self.hls_url(request, track, rendition.bitrate, 'index.m3u8'))
+        response = HttpResponse('\n'.join(lines) + '\n', content_type=HLS_PLAYLIST_TYPE)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny],
+            url_path=r'hls/(?P<bitrate>[0-9]+)/(?P<name>index\.m3u8|segment_[0-9]+\.ts)', url_name='hls-file')
+    def hls_file(self, request, pk=None, bitrate=None, name=None):
+        self.authorize_stream(request)
+        track = self.get_object()
+        rendition = track.renditions.filter(bitrate=bitrate, status=TrackRendition.Status.READY).first()
+        if rendition is None:
+            raise NotFound("No such rendition.")
+
+        if name == 'index.m3u8':
+            playlist = rewrite_playlist(
+                read_playlist(rendition), lambda uri: self.hls_url(request, track, bitrate, uri)
+            )
+            return HttpResponse(playlist, content_type=HLS_PLAYLIST_TYPE)
+
+        segment = f'{rendition_dir(track.pk, rendition.bitrate)}/{name}'
+        if not default_storage.exists(segment):
+            raise NotFound("No such segment.")
+        return stream_file(request, segment, content_type='video/mp2t')
+
+    @action(detail=True, methods=['get'])
+    def waveform(self, request, pk=None):
+        # Raw int8 peaks (0..127), one byte per bucket; loudness rides along
+        # in headers so the body stays a plain typed array for the player.
+        waveform = TrackWaveform.objects.filter(track=self.get_object()).first()
+        if waveform is None:
+            raise NotFound("The waveform has not been computed yet.")
+
+        etag = f'"{waveform.pk:x}-{int(waveform.updated_at.timestamp()):x}"'
+        last_modified = waveform.updated_at.timestamp()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(bytes(waveform.peaks), content_type='application/octet-stream')
+            if waveform.loudness is not None:
+                target = getattr(settings, 'LOUDNESS_TARGET', -14.0)
+                response['X-Loudness'] = f'{waveform.loudness:.2f}'
+                response['X-Loudness-Gain'] = f'{target - waveform.loudness:.2f}'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = f"private, max-age={getattr(settings, 'WAVEFORM_CACHE_MAX_AGE', 30 * 24 * 60 * 60)}"
+        return response
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads: POST {filename, length} to start, PATCH raw bytes
+    (Content-Type application/offset+octet-stream) with an Upload-Offset
+    header, HEAD/GET to learn the offset to resume from after a drop, then
+    POST finalize/ with the track fields to turn the file into a Track.
+    """
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        start_upload(serializer.save(user=self.request.user))
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = response.data['offset']
+        response['Upload-Length'] = response.data['length']
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def partial_update(self, request, *args, **kwargs):
+        # The body is never parsed: request.data is left alone and the raw
+        # stream is copied to disk as it arrives.
+        if request.content_type != 'application/offset+octet-stream':
+            raise UnsupportedMediaType(request.content_type)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            size = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError("Upload-Offset and Content-Length headers are required.")
+
+        upload = self.get_object()
+        if upload.track_id is not None:
+            raise UploadConflict("This upload has already been finalized.")
+        if offset != upload.offset:
+            raise UploadConflict(f"Upload-Offset must be {upload.offset}.")
+        if offset + size > upload.length:
+            raise ValidationError("The chunk runs past the declared upload length.")
+
+        new_offset = receive_chunk(upload, request.stream, offset, size)
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Upload-Offset': new_offset})
+
+    def perform_destroy(self, instance):
+        discard(instance)
+        instance.delete()
+
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser, FormParser, MultiPartParser])
+    def finalize(self, request, pk=None):
+        serializer = TrackSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            upload = self.get_queryset().select_for_update().get(pk=self.get_object().pk)
+            if upload.track_id is not None:
+                raise UploadConflict("This upload has already been finalized.")
+            if upload.offset != upload.length:
+                raise UploadConflict(f"Only {upload.offset} of {upload.length} bytes have been received.")
+            track = serializer.save(audio_file=assemble(upload), uploaded_by=request.user)
+            upload.track = track
+            upload.save(update_fields=['track', 'updated_at'])
+            process_upload(track)
+
+        return Response(TrackSerializer(track, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+class onlineTrackViewSet(CachedFragmentsMixin, viewsets.ModelViewSet):
 
     queryset = onlineTrack.objects.all() 
     serializer_class = OnlineTrackSerializer
+    fragment_queryset = onlineTrack.objects.select_related('artist', 'album').prefetch_related(
+        Prefetch('genres', queryset=Genre.objects.order_by('pk')),
+        Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+    )
+    lean_rows = staticmethod(lean_online_track_rows)
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser , JSONParser]
     pagination_class = TrackPagination
     filterset_class = OnlineTrackFilter
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['title', 'artist', 'album']
+    search_fields = ['title', 'artist__name', 'album__title']
     ordering_fields = ['title', 'artist']
+    keyset_field = 'saved_at'
 
     def get_queryset(self):
-        return onlineTrack.objects.filter(user=self.request.user)
+        return onlineTrack.objects.filter(user=self.request.user).order_by('-saved_at', '-id')
     
     
     def perform_create(self, serializer):
@@ -101,7 +397,7 @@ class onlineTrackViewSet(viewsets.ModelViewSet):
             user=self.request.user,
             title=serializer.validated_data.get("title"),
             source=serializer.validated_data.get("source")
-        ).first()
+        ).exists()
 
         if existing:
             raise ValidationError("Track already saved.")
@@ -119,24 +415,54 @@ class onlineTrackViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Not allowed to delete this item."}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Accepts {"tracks": [...]} or a bare list of tracks.
+        data = {"tracks": request.data} if isinstance(request.data, list) else request.data
+        serializer = OnlineTrackBulkSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        created_ids, skipped = bulk_save_online_tracks(request.user, serializer.validated_data['tracks'])
+
+        created = (
+            onlineTrack.objects.filter(pk__in=created_ids)
+            .select_related('artist', 'album')
+            .prefetch_related('genres', 'tags')
+            .order_by('pk')
+        )
+        return Response({
+            "created": OnlineTrackSerializer(created, many=True).data,
+            "skipped": [{"title": title, "source": source} for title, source in skipped],
+        }, status=status.HTTP_201_CREATED)
 
 
-class GenreViewSet(viewsets.ModelViewSet):
+
+class GenreViewSet(CachedReferenceListMixin, viewsets.ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CachedReferenceListMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
 
-class PlaylistViewSet(viewsets.ModelViewSet):
+class PlaylistViewSet(CachedFragmentsListMixin, viewsets.ModelViewSet):
     serializer_class = PlaylistSerializer
     permission_classes = [IsAuthenticated]
+    # The index page only; a playlist with its items is read fresh.
+    fragment_queryset = Playlist.objects.all()
 
     def get_queryset(self):
-        return Playlist.objects.filter(user=self.request.user)
+        queryset = Playlist.objects.filter(user=self.request.user).order_by('created_at')
+        # Only actions that render items pay for loading them; the index
+        # page reads the denormalized aggregates instead.
+        if self.action in ('retrieve', 'items'):
+            queryset = playlists_queryset(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        return PlaylistSummarySerializer if self.action == 'list' else PlaylistSerializer
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -150,8 +476,7 @@ class PlaylistViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def items(self, request, pk=None):
         playlist = self.get_object()
-        items = PlaylistItem.objects.filter(playlist=playlist)
-        serializer = PlaylistItemSerializer(items, many=True)
+        serializer = PlaylistItemSerializer(playlist.items.all(), many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
@@ -168,13 +493,14 @@ class PlaylistViewSet(viewsets.ModelViewSet):
 
         if track_id:
             try:
-                item.track = Track.objects.get(id=track_id, user=request.user)
+                # Uploads are shared, so any of them can go on a playlist.
+                item.track = Track.objects.get(id=track_id)
             except Track.DoesNotExist:
                 return Response({"detail": "Track not found."}, status=status.HTTP_404_NOT_FOUND)
         elif online_track_id:
             try:
-                item.online_track = OnlineTrack.objects.get(id=online_track_id, user=request.user)
-            except OnlineTrack.DoesNotExist:
+                item.online_track = onlineTrack.objects.get(id=online_track_id, user=request.user)
+            except onlineTrack.DoesNotExist:
                 return Response({"detail": "OnlineTrack not found."}, status=status.HTTP_404_NOT_FOUND)
 
         item.save()
@@ -198,6 +524,31 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         deleted, _ = items.delete()
         return Response({"detail": f"{deleted} item(s) removed from playlist."}, status=status.HTTP_200_OK)
 
+    # Batch edits: hundreds of items per request, each in one transaction
+    # with a fixed number of queries (music.playlists).
+
+    def batch(self, serializer_class):
+        serializer = serializer_class(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return self.get_object(), data['items'], data.get('after', AT_END)
+
+    @action(detail=True, methods=['post'], url_path='add-tracks')
+    def add_tracks(self, request, pk=None):
+        playlist, entries, after = self.batch(PlaylistAddSerializer)
+        items = add_items(playlist, entries, after)
+        return Response({"items": item_rows(items)}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='remove-tracks')
+    def remove_tracks(self, request, pk=None):
+        playlist, item_ids, _ = self.batch(PlaylistBatchSerializer)
+        return Response({"removed": remove_items(playlist, item_ids)})
+
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        playlist, item_ids, after = self.batch(PlaylistBatchSerializer)
+        return Response({"items": item_rows(move_items(playlist, item_ids, after))})
+
 
 
 class PlaylistItemViewSet(viewsets.ModelViewSet):
@@ -205,7 +556,7 @@ class PlaylistItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return PlaylistItem.objects.filter(playlist__user=self.request.user)
+        return playlist_items_queryset(PlaylistItem.objects.filter(playlist__user=self.request.user))
 
     def perform_create(self, serializer):
         playlist = serializer.validated_data['playlist']
@@ -223,9 +574,31 @@ class PlaylistItemViewSet(viewsets.ModelViewSet):
 class FavoriteTrackViewSet(viewsets.ModelViewSet):
     serializer_class = FavoriteTrackSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Unpaginated unless the client sends ?pagination=cursor.
+    pagination_class = OptionalKeysetPagination
+    keyset_field = 'favorited_at'
+    max_membership_ids = 1000
 
     def get_queryset(self):
-        return FavoriteTrack.objects.filter(user=self.request.user)
+        return FavoriteTrack.objects.filter(user=self.request.user).order_by('-favorited_at')
+
+    @action(detail=False, methods=['get'])
+    def contains(self, request):
+        """
+        Which of ``?tracks=1,2,...`` and ``?online_tracks=...`` the user has
+        favorited, answered from the cached membership arrays.
+        """
+        ids = {}
+        id_field = serializers.IntegerField(min_value=1)
+        for param in ('tracks', 'online_tracks'):
+            values = [value for value in request.query_params.get(param, '').split(',') if value]
+            if len(values) > self.max_membership_ids:
+                raise ValidationError({param: f'At most {self.max_membership_ids} ids per request.'})
+            try:
+                ids[param] = [id_field.run_validation(value) for value in values]
+            except ValidationError:
+                raise ValidationError({param: 'Must be a comma-separated list of ids.'})
+        return Response(favorited(request.user.pk, ids['tracks'], ids['online_tracks']))
 
 # --- Unified Song Search API ---
 
@@ -234,19 +607,199 @@ from rest_framework.views import APIView
 class SongSearchView(APIView):
     permission_classes = [AllowAny]
 
+    def invalid_search(self, request):
+        if not request.query_params.get("q"):
+            return Response({"error": "Query parameter is required"}, status=400)
+        stream_format = request.query_params.get("stream")
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return Response({"error": f"stream must be one of: {', '.join(STREAM_FORMATS)}"}, status=400)
+        return None
+
+    def get(self, request, format=None):
+        error = self.invalid_search(request)
+        if error is not None:
+            return error
+        query = request.query_params["q"]
+
+        # ?stream=ndjson|sse sends each provider's results as soon as they
+        # arrive instead of waiting for the slowest one.
+        stream_format = request.query_params.get("stream")
+        if stream_format:
+            return stream_search(query, stream_format)
+
+        # All providers run at once; a provider that misses its deadline is
+        # reported in "providers" instead of holding up the response.
+        results, providers = fan_out(query)
+
+        return Response({
+            "results": merge_results(results, query),
+            "providers": providers,
+        })
+
+
+class SearchCacheStatsView(APIView):
+    # Hit/miss/eviction counters for sizing SEARCH_CACHE_MAX_ENTRIES and TTLs.
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(get_search_cache().stats())
+
+
+# --- Library full-text search ---
+
+class LibrarySearchView(APIView):
+    """
+    Ranked full-text search over uploaded tracks and the user's saved online
+    tracks, matching title, artist, album, genres and tags in one indexed
+    query per table.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
     def get(self, request, format=None):
-        query = request.query_params.get("q")
+        query = request.query_params.get("q", "").strip()
         if not query:
             return Response({"error": "Query parameter is required"}, status=400)
 
-        yt_results = search_youtube(query)
-        jamendo_results = search_jamendo(query)
-        mixcloud_results = search_mixcloud(query)
-        audios_results = search_audius(query)
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+
+        tracks = search_library(Track.objects.all(), query)[:limit]
+        online_tracks = search_library(onlineTrack.objects.filter(user=request.user), query)[:limit]
 
         return Response({
-            "results": yt_results + jamendo_results + mixcloud_results + audios_results,
+            "tracks": TrackSerializer(tracks, many=True, context={"request": request}).data,
+            "online_tracks": OnlineTrackSerializer(online_tracks, many=True, context={"request": request}).data,
         })
-    
 
 
+class LibrarySnapshotView(APIView):
+    """
+    The whole library of the current user in one payload, versioned by the
+    user's library revision. A matching If-None-Match gets a 304 after a
+    single revision lookup; otherwise the serialized snapshot for that
+    revision is served from the cache, or built once.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        revision = get_library_revision(request.user.pk)
+        response = self.not_modified(request, revision)
+        if response is None:
+            response = HttpResponse(library_snapshot_bytes(request.user, revision), content_type='application/json')
+        return self.finish(request, response, revision)
+
+    def not_modified(self, request, revision):
+        return get_conditional_response(request, etag=library_etag(request.user.pk, revision))
+
+    def finish(self, request, response, revision):
+        response['ETag'] = library_etag(request.user.pk, revision)
+        # Browsers revalidate every time and reuse their copy on a 304.
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class LibrarySyncView(APIView):
+    """
+    What changed in the current user's library since a revision (``since``,
+    as returned by /api/library/ or a previous sync): upserted rows and
+    tombstones for online tracks, playlists, playlist items and favorites.
+    The work done is proportional to the changes, not the library.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            since = serializers.IntegerField(min_value=0).run_validation(request.query_params.get('since', '0'))
+        except ValidationError:
+            raise ValidationError({'since': 'Must be a library revision.'})
+        return Response(library_changes(request.user, since))
+
+
+# --- Async views ---
+# For ASGI deployments (ASYNC_VIEWS; see music_backend/asgi.py): the
+# endpoints that mostly wait on I/O, as coroutines, so a request waiting
+# on a provider or a slow client holds no worker thread.
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines. Authentication, permissions and
+    throttling are DRF's own and may query the database, so they run in a
+    thread; everything else stays on the event loop.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncSongSearchView(AsyncAPIView, SongSearchView):
+
+    async def get(self, request, format=None):
+        error = self.invalid_search(request)
+        if error is not None:
+            return error
+        query = request.query_params["q"]
+
+        stream_format = request.query_params.get("stream")
+        if stream_format:
+            return astream_search(query, stream_format)
+
+        results, providers = await afan_out(query)
+        return Response({
+            "results": merge_results(results, query),
+            "providers": providers,
+        })
+
+
+class AsyncLibrarySnapshotView(AsyncAPIView, LibrarySnapshotView):
+
+    async def get(self, request):
+        revision = await aget_library_revision(request.user.pk)
+        response = self.not_modified(request, revision)
+        if response is None:
+            body = await alibrary_snapshot_bytes(request.user, revision)
+            response = HttpResponse(body, content_type='application/json')
+        return self.finish(request, response, revision)
+
+
+class AsyncTrackStreamView(AsyncAPIView):
+    """/api/tracks/{id}/stream/ (TrackViewSet.stream), reading the file off the event loop."""
+    permission_classes = [AllowAny]
+
+    async def get(self, request, pk):
+        user = request.user if request.user.is_authenticated else None
+        token = request.query_params.get('token')
+        if user is None and token:
+            user = await auser_from_stream_token(token)
+        if user is None:
+            raise NotAuthenticated()
+
+        track = await Track.objects.filter(pk=pk).afirst()
+        if track is None:
+            raise NotFound()
+        audio = track.audio_file or track.file
+        if not audio:
+            raise NotFound("This track has no uploaded audio.")
+        return stream_file(request, audio.name, audio.storage, asynchronous=True)
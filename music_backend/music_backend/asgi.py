@@ -5,6 +5,39 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serving the API over ASGI
+-------------------------
+Every worker process must share one cache: set ``REDIS_URL`` (see
+CACHES in settings.py; ``manage.py check`` fails without it unless DEBUG).
+
+Set ``ASYNC_VIEWS=True`` in the environment so song search, audio
+streaming and the library snapshot run as async views (they need the
+``httpx`` package for provider requests). A search waiting on its
+providers is then a coroutine on the worker's event loop rather than a
+blocked thread, so one process keeps thousands of them in flight, bounded
+by SEARCH_ASYNC_MAX_CONNECTIONS. Every other endpoint still runs in
+Django's thread pool.
+
+With uvicorn, one process per core::
+
+    ASYNC_VIEWS=True uvicorn music_backend.asgi:application \\
+        --host 0.0.0.0 --port 8000 --workers 4 --lifespan off \\
+        --timeout-keep-alive 5
+
+or under gunicorn's process manager, with the settings in gunicorn.conf.py
+next to manage.py::
+
+    ASYNC_VIEWS=True gunicorn music_backend.asgi:application
+
+With daphne (one process; run several behind the proxy to use every core)::
+
+    ASYNC_VIEWS=True daphne -b 0.0.0.0 -p 8000 music_backend.asgi:application
+
+Keep ``CONN_MAX_AGE`` at 0: async views run their queries on short-lived
+threads, and persistent connections would pile up with them. Behind nginx,
+STREAM_SENDFILE_MODE = 'x-accel-redirect' still takes audio bytes off the
+server entirely; otherwise they are streamed chunk by chunk from a thread.
 """
 
 import os
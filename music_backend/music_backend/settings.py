@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 YOUTUBE_API_KEY = config("YOUTUBE_API_KEY")
 JAMENDO_CLIENT_ID = config("JAMENDO_CLIENT_ID")
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
@@ -63,6 +65,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'music_backend.urls'
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+# Loudness headers sent alongside /api/tracks/{id}/waveform/, and the
+# resumable upload offset.
+CORS_EXPOSE_HEADERS = ['X-Loudness', 'X-Loudness-Gain', 'Upload-Offset', 'Upload-Length']
 
 TEMPLATES = [
     {
@@ -80,6 +86,13 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'music_backend.wsgi.application'
+ASGI_APPLICATION = 'music_backend.asgi.application'
+
+# --- ASGI deployment ---
+# Under an ASGI server, ASYNC_VIEWS serves song search, audio streaming and
+# the library snapshot from async views, which wait on providers and slow
+# clients without holding a thread. See music_backend/asgi.py.
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
 
 
 # Database
@@ -96,6 +109,30 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The genre and tag tables (music.reference), the list fragments
+# (music.fragments) and the favorites arrays (music.favorites) are kept
+# current by every write, so every worker must share the cache: set
+# REDIS_URL in production. Without it each process gets its own
+# LocMemCache, which only suits development and tests, and
+# REQUIRE_SHARED_CACHE (on unless DEBUG) makes `manage.py check` fail.
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+REQUIRE_SHARED_CACHE = config("REQUIRE_SHARED_CACHE", default=not DEBUG, cast=bool)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -151,7 +188,178 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # music.renderers.ORJSONRenderer is a faster drop-in (needs orjson).
+    'DEFAULT_RENDERER_CLASSES': [
+        'music.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+
+# --- Song search ---
+# Enabled providers (subclasses of music.search.SearchProvider), in the order
+# their results are returned. SEARCH_PROVIDER_LIMIT is how many results each
+# provider is asked for.
+SEARCH_PROVIDERS = [
+    'music.search.providers.YouTubeProvider',
+    'music.search.providers.JamendoProvider',
+    'music.search.providers.MixcloudProvider',
+    'music.search.providers.AudiusProvider',
+]
+SEARCH_PROVIDER_LIMIT = 5
+
+# Results from different providers that are the same song are merged into
+# one entry, kept from the highest weighted source. SEARCH_RANKING_FUNCTION
+# is a dotted path to score(cluster, query_tokens); None uses
+# music.search.merge.default_score.
+SEARCH_SOURCE_WEIGHTS = {
+    'jamendo': 1.0,
+    'audius': 1.0,
+    'youtube': 0.8,
+    'mixcloud': 0.6,
+}
+SEARCH_RANKING_FUNCTION = None
+
+# Provider calls for /api/search/ run concurrently on a shared thread pool
+# with one thread per provider for each of SEARCH_CONCURRENT_SEARCHES
+# searches a process is expected to serve at once. Each provider gets its
+# own deadline (seconds); slower providers are dropped from the response
+# and reported with status "timeout".
+SEARCH_CONCURRENT_SEARCHES = 8
+SEARCH_DEFAULT_DEADLINE = 3.0
+SEARCH_PROVIDER_DEADLINES = {
+    'youtube': 2.5,
+    'jamendo': 2.5,
+    'mixcloud': 2.5,
+    'audius': 2.5,
+}
+
+# Provider results are cached per (provider, normalized query). Entries are
+# fresh for SEARCH_CACHE_TTL seconds, then served stale for up to
+# SEARCH_CACHE_STALE_TTL more while a background refresh runs.
+# SEARCH_CACHE_BACKEND names an entry of CACHES to share results between
+# workers; None keeps the cache in process memory only.
+SEARCH_CACHE_MAX_ENTRIES = 10000
+SEARCH_CACHE_TTL = {
+    'default': 300,
+    'youtube': 900,
+}
+SEARCH_CACHE_STALE_TTL = 600
+SEARCH_CACHE_BACKEND = None
+
+# Outbound provider HTTP: one keep-alive connection pool per provider host.
+# Timeouts are (connect, read) seconds; 429/5xx answers are retried with
+# jittered exponential backoff.
+SEARCH_HTTP_POOL_SIZE = 16
+SEARCH_HTTP_TIMEOUT = (2.0, 3.0)
+SEARCH_HTTP_RETRIES = 2
+SEARCH_HTTP_BACKOFF = 0.2
+SEARCH_HTTP_BACKOFF_JITTER = 0.2
+# The async views (ASYNC_VIEWS) share one httpx connection pool per process
+# instead: how many provider requests it keeps in flight at once.
+SEARCH_ASYNC_MAX_CONNECTIONS = 512
+
+
+# --- Library full-text search ---
+# Text search configuration for the tsvector columns on Track/onlineTrack.
+# "simple" does no stemming, which suits multilingual titles and names.
+# LIBRARY_SEARCH_TRIGRAM adds pg_trgm title similarity for typo tolerance.
+LIBRARY_SEARCH_CONFIG = 'simple'
+LIBRARY_SEARCH_TRIGRAM = True
+
+
+# --- Audio streaming ---
+# /api/tracks/{id}/stream/ answers Range requests itself by default. Behind
+# nginx set STREAM_SENDFILE_MODE = 'x-accel-redirect' (with an internal
+# location at STREAM_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT), or
+# 'x-sendfile' for Apache/lighttpd, to hand the transfer to the proxy.
+STREAM_SENDFILE_MODE = None
+STREAM_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+STREAM_CHUNK_SIZE = 64 * 1024
+# Lifetime in seconds of the signed ?token= used by <audio> elements.
+STREAM_TOKEN_MAX_AGE = 6 * 60 * 60
+
+
+# --- Background tasks ---
+# Upload post-processing (see music.tasks). "thread" runs tasks on a pool
+# of TASK_WORKERS threads in the web process; "inline" runs them
+# synchronously, which is what the tests use.
+TASK_BACKEND = 'thread'
+TASK_WORKERS = 2
+
+
+# --- Waveforms and loudness ---
+# Computed once per upload by music.waveform. Formats other than PCM WAV
+# are decoded with FFMPEG_BINARY. X-Loudness-Gain is the gain in dB that
+# brings a track to LOUDNESS_TARGET (LUFS).
+FFMPEG_BINARY = 'ffmpeg'
+WAVEFORM_PEAKS = 1000
+WAVEFORM_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+LOUDNESS_TARGET = -14.0
+
+
+# --- HLS transcoding ---
+# Every upload is encoded (with FFMPEG_BINARY) into one AAC rendition per
+# bitrate in kbps, skipping rungs above the source bitrate, and served at
+# /api/tracks/{id}/hls/. TRANSCODE_WORKERS caps concurrent ffmpeg processes.
+HLS_BITRATES = [64, 128, 256]
+HLS_SEGMENT_SECONDS = 6
+TRANSCODE_WORKERS = 2
+TRANSCODE_TIMEOUT = 600
+
+
+# --- Resumable uploads ---
+# /api/uploads/ keeps partial files in UPLOAD_TEMP_DIR (relative to
+# MEDIA_ROOT, so finalizing is a rename into tracks/). purge_uploads drops
+# uploads untouched for UPLOAD_EXPIRY_HOURS.
+UPLOAD_MAX_SIZE = 1024 ** 3
+UPLOAD_TEMP_DIR = 'uploads'
+UPLOAD_EXPIRY_HOURS = 24
+
+
+# --- Audio storage ---
+# Uploaded audio is stored once per distinct content (music.storage).
+# gc_audio_blobs leaves unreferenced blobs alone for BLOB_GC_GRACE_HOURS
+# so uploads in flight can still claim them.
+BLOB_GC_GRACE_HOURS = 1
+
+
+# --- Library snapshot and sync ---
+# /api/library/ is versioned by a per-user revision bumped on every write,
+# so a serialized snapshot never goes stale; the timeout only bounds how
+# long superseded revisions linger in the cache. /api/library/sync/ returns
+# at most about LIBRARY_SYNC_PAGE_SIZE changes per call, and
+# prune_library_changes drops tombstones older than
+# LIBRARY_TOMBSTONE_RETENTION_DAYS (clients that stayed away longer start
+# over from a snapshot).
+LIBRARY_SNAPSHOT_CACHE_TIMEOUT = 60 * 60
+LIBRARY_SYNC_PAGE_SIZE = 500
+LIBRARY_TOMBSTONE_RETENTION_DAYS = 30
+
+
+# --- Favorites membership ---
+# /api/favorites/contains/ answers from per-user sorted id arrays cached in
+# the default cache; each favorite/unfavorite updates them in place.
+FAVORITES_CACHE_TIMEOUT = 60 * 60
+
+
+# --- Reference data cache ---
+# Genres and tags are cached whole (music.reference), per process and in
+# the default (shared) cache, under a version replaced on every write; the timeout
+# only bounds how long superseded versions linger. Artists and albums grow
+# with the catalog and are looked up by name instead.
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+
+# --- Response fragments ---
+# Track, online track and playlist list responses are assembled from each
+# object's cached serialized JSON (music.fragments), keyed on a per-object
+# version token dropped on every write; the timeout bounds how long
+# fragments of objects nobody reads linger. With LEAN_ROWS, track and
+# online track misses are built from .values() rows (music.lean) instead
+# of going through their serializers.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+LEAN_ROWS = True